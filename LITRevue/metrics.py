@@ -0,0 +1,327 @@
+"""
+Per-request performance metrics.
+
+RequestMetricsMiddleware times every request and the phases it spends
+its time in:
+
+- sql: the queries run on any database of the request's thread, with
+  their number, through an execute_wrapper();
+- template: the rendering of templates, through the TimedDjangoTemplates
+  backend. A template rendered while another one is (an include, a
+  cached card rendered by a template tag) is not counted twice. The
+  queries run while rendering count in both phases;
+- image: the handling of ticket images, marked with span(IMAGE).
+
+The timings are sent back in a Server-Timing header, which browsers
+show in their developer tools, unless SERVER_TIMING_HEADER is False,
+and added to histograms per view name. The metrics view serves the
+histograms of the process, with the fragment cache counters, to staff
+users in the Prometheus text format.
+
+Each process keeps its own histograms: with several workers, scrape
+each of them. Writes handed to the write queue run on its thread and
+their queries are not counted.
+
+The cost is a few clock readings per query and template and a few
+locked counter increments per request, low enough to stay enabled.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+from main_feed import fragments
+
+
+SQL = "sql"
+TEMPLATE = "template"
+IMAGE = "image"
+
+PHASES = (SQL, TEMPLATE, IMAGE)
+
+UNMATCHED_VIEW = "<unmatched>"
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """
+    Thread-safe histogram with fixed buckets, per combination of
+    label values, exported in the Prometheus text format.
+
+    Attributes:
+        name (str): Name of the metric.
+        description (str): Its HELP text.
+        label_names (tuple): Names of the labels.
+        buckets (tuple): Upper bounds of the buckets, increasing.
+
+    Methods:
+        observe(labels, value): Counts one value.
+        snapshot(): Returns {labels: (bucket counts, sum, count)},
+        the bucket counts being cumulative, +Inf last.
+        exposition(): Returns the lines of the text format.
+        reset(): Forgets every value.
+    """
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0
+                ]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            series = {
+                labels: (list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            }
+        for labels, (counts, total, count) in series.items():
+            for i in range(1, len(counts)):
+                counts[i] += counts[i - 1]
+        return series
+
+    def exposition(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        bounds = [format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total, count) in sorted(
+                self.snapshot().items()):
+            pairs = list(zip(self.label_names, labels))
+            for bound, cumulative in zip(bounds, counts):
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{format_labels(pairs + [('le', bound)])} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{format_labels(pairs)} "
+                f"{format_value(total)}"
+            )
+            lines.append(f"{self.name}_count{format_labels(pairs)} {count}")
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(pairs):
+    def escape(value):
+        return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+                .replace("\n", "\\n"))
+
+    return "{" + ",".join(
+        f'{name}="{escape(value)}"' for name, value in pairs
+    ) + "}"
+
+
+request_seconds = Histogram(
+    "litrevue_request_duration_seconds",
+    "Total time of the requests, per view.",
+    ("view",), DURATION_BUCKETS,
+)
+phase_seconds = Histogram(
+    "litrevue_request_phase_seconds",
+    "Time of the requests spent in SQL queries, template rendering and "
+    "image handling, per view.",
+    ("view", "phase"), DURATION_BUCKETS,
+)
+request_queries = Histogram(
+    "litrevue_request_queries",
+    "Number of SQL queries of the requests, per view.",
+    ("view",), QUERY_BUCKETS,
+)
+response_bytes = Histogram(
+    "litrevue_response_size_bytes",
+    "Size of the response bodies, streamed responses excepted, "
+    "per view.",
+    ("view",), SIZE_BUCKETS,
+)
+
+HISTOGRAMS = [request_seconds, phase_seconds, request_queries,
+              response_bytes]
+
+
+@dataclass
+class RequestTimings:
+    """
+    Timings of the current request.
+
+    Attributes:
+        queries (int): Number of SQL queries.
+        phases (dict): Seconds spent in each phase.
+        open_phases (set): Phases being timed, so that nested spans
+        of the same phase are not counted twice.
+    """
+    queries: int = 0
+    phases: dict = field(default_factory=lambda: dict.fromkeys(PHASES, 0.0))
+    open_phases: set = field(default_factory=set)
+
+    def execute(self, execute, sql, params, many, context):
+        """
+        execute_wrapper() counting and timing the queries.
+        """
+        self.queries += 1
+        with span(SQL):
+            return execute(sql, params, many, context)
+
+
+_current = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(phase):
+    """
+    Adds the time spent in the block to a phase of the current
+    request. Does nothing outside requests and inside a span of the
+    same phase.
+    """
+    timings = _current.get()
+    if timings is None or phase in timings.open_phases:
+        yield
+        return
+    timings.open_phases.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[phase] += time.perf_counter() - start
+        timings.open_phases.discard(phase)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with span(TEMPLATE):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing the rendering of its
+    templates.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Unknown paths would each get their own series.
+        return UNMATCHED_VIEW
+    return match.view_name
+
+
+def server_timing(total, timings):
+    """
+    Returns the value of the Server-Timing header of a request.
+    """
+    entries = [f"total;dur={total * 1000:.1f}"]
+    for phase in PHASES:
+        entry = f"{phase};dur={timings.phases[phase] * 1000:.1f}"
+        if phase == SQL:
+            entry += f';desc="{timings.queries} queries"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times each request and its phases, adds them to the histograms
+    and to the Server-Timing header of the response.
+
+    It should come first in MIDDLEWARE, so that the time and queries
+    of the other middlewares are counted.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        view = view_label(request)
+        request_seconds.observe((view,), total)
+        request_queries.observe((view,), timings.queries)
+        for phase in PHASES:
+            phase_seconds.observe((view, phase), timings.phases[phase])
+        if not response.streaming:
+            response_bytes.observe((view,), len(response.content))
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = server_timing(total, timings)
+        return response
+
+
+def fragment_cache_exposition():
+    name = "litrevue_fragment_cache_lookups_total"
+    lines = [
+        f"# HELP {name} Lookups of the rendered card cache.",
+        f"# TYPE {name} counter",
+    ]
+    for kind, counts in fragments.stats.snapshot().items():
+        for result in ("hits", "misses"):
+            labels = format_labels([("kind", kind), ("result", result)])
+            lines.append(f"{name}{labels} {counts[result]}")
+    return lines
+
+
+@staff_member_required
+def metrics(request):
+    """
+    Serves the request histograms and the fragment cache counters of
+    this process in the Prometheus text format.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.exposition())
+    lines.extend(fragment_cache_exposition())
+    return HttpResponse(
+        "\n".join(lines) + "\n", content_type=PROMETHEUS_CONTENT_TYPE
+    )
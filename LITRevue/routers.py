@@ -0,0 +1,115 @@
+"""
+Routing of the database reads to read replicas.
+
+Writes always go to the primary ("default") database. Reads go to one
+of the DATABASE_REPLICAS aliases, but only while handling a request
+that has not written anything: management commands, background tasks
+and transactions keep reading from the primary, which they may just
+have written to.
+
+Replicas lag behind the primary. So that users always see their own
+new review or comment, a request that writes (any POST, or a GET
+whose code writes) marks its user "sticky" with a cookie: for the
+next REPLICA_STICKY_SECONDS, their requests read from the primary.
+
+The router and the middleware are always installed; without
+DATABASE_REPLICAS, everything stays on the primary.
+"""
+import random
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+STICKY_COOKIE = "read_primary"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
+
+@dataclass
+class RoutingState:
+    """
+    Routing decisions of the current request.
+
+    Attributes:
+        use_replicas (bool): Reads may go to a replica.
+        wrote (bool): The request wrote to the primary.
+    """
+    use_replicas: bool = False
+    wrote: bool = False
+
+
+_state = ContextVar("replica_routing", default=None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends the writes to the primary and, when the current request
+    allows it, the reads to a randomly chosen replica.
+    """
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if (state is None or not state.use_replicas or not replicas
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Read your own writes for the rest of the request.
+            state.use_replicas = False
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets the reads of safe requests go to the replicas, unless the
+    user wrote less than REPLICA_STICKY_SECONDS ago, and sets the
+    sticky cookie on the responses of the requests that wrote.
+
+    It must come before SessionMiddleware and AuthenticationMiddleware
+    in MIDDLEWARE, so that the session and the user are read and
+    written under its routing. The queries of the middlewares before
+    it, such as RequestMetricsMiddleware, go to the primary.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(
+            use_replicas=(
+                request.method in SAFE_METHODS
+                and STICKY_COOKIE not in request.COOKIES
+            ),
+        )
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if settings.DATABASE_REPLICAS and (
+                state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                STICKY_COOKIE, "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite="Lax",
+            )
+        return response
@@ -10,8 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from LITRevue.sqlite_profile import (
+    PERFORMANCE, PROFILE_ENV_VAR, performance_profile
+)
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -38,15 +43,19 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     "authentication.apps.AuthenticationConfig",
-    "main_feed.apps.MainFeedConfig"
+    "main_feed.apps.MainFeedConfig",
+    "profiling.apps.ProfilingConfig"
 ]
 
 MIDDLEWARE = [
+    'LITRevue.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'LITRevue.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'profiling.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +64,7 @@ ROOT_URLCONF = 'LITRevue.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'LITRevue.metrics.TimedDjangoTemplates',
         'DIRS': [
             BASE_DIR.joinpath("templates"),
         ],
@@ -83,6 +92,87 @@ DATABASES = {
     }
 }
 
+# Opt-in SQLite performance profile (WAL, mmap, busy timeout,
+# persistent connections), see LITRevue/sqlite_profile.py:
+#   LITREVUE_SQLITE_PROFILE=performance python manage.py runserver
+
+if os.environ.get(PROFILE_ENV_VAR) == PERFORMANCE:
+    DATABASES['default'] = performance_profile(DATABASES['default'])
+
+# Read replicas (LITRevue/routers.py)
+# The reads of the requests that do not write go to the DATABASE_REPLICAS
+# aliases; users who just wrote keep reading from the primary for
+# REPLICA_STICKY_SECONDS. To try it with a copy of the database standing
+# in for a replica:
+#   cp db.sqlite3 replica.sqlite3
+#   LITREVUE_REPLICA_DB=replica.sqlite3 python manage.py runserver
+
+DATABASE_REPLICAS = []
+if os.environ.get('LITREVUE_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['LITREVUE_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['LITRevue.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+
+
+# Single-writer queue (LITRevue/write_queue.py)
+# When enabled, the writes of the views run on one writer thread that
+# groups concurrent writes, up to WRITE_QUEUE_MAX_BATCH of them, into
+# a single transaction. A view waits at most WRITE_QUEUE_TIMEOUT
+# seconds for its write to be committed.
+
+SERIALIZE_WRITES = False
+WRITE_QUEUE_MAX_BATCH = 32
+WRITE_QUEUE_TIMEOUT = 30
+
+
+# Request metrics (LITRevue/metrics.py)
+# Every response carries a Server-Timing header with its time spent in
+# SQL queries, template rendering and image handling, unless
+# SERVER_TIMING_HEADER is False. Staff users can read the histograms
+# of the process in the Prometheus text format at /metrics/.
+
+SERVER_TIMING_HEADER = True
+
+
+# On-demand profiling (profiling/middleware.py)
+# A staff user adds ?profile=1 to a URL, or sends an X-Profile header,
+# to record a cProfile dump of that request in PROFILES_DIR. The
+# profiles are listed in the admin.
+
+PROFILES_DIR = BASE_DIR.joinpath("profiles")
+PROFILE_QUERY_PARAMETER = "profile"
+PROFILE_HEADER = "X-Profile"
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'litrevue',
+    }
+}
+
+# Lifetime of the rendered ticket and review cards (main_feed.fragments)
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# In-process cache of the username completions of the most typed
+# prefixes (authentication.autocomplete).
+USERNAME_COMPLETION_CACHE_SIZE = 1024
+USERNAME_COMPLETION_CACHE_SECONDS = 30
+
+# In-process cache of the followee and follower ids of the most
+# recently active users (authentication.graph).
+FOLLOW_GRAPH_CACHE_USERS = 10000
+FOLLOW_GRAPH_CACHE_SECONDS = 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,3 +220,36 @@ LOGOUT_REDIRECT_URL = LOGIN_URL
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR.joinpath('media/')
+
+# Ticket images are stored once per distinct content, under their digest.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'ticket_images': {
+        'BACKEND': 'main_feed.storage.ContentAddressedStorage',
+    },
+}
+
+# Ticket images with more pixels than this are refused, from the size
+# in their header, before being decoded (main_feed.validators).
+
+TICKET_IMAGE_MAX_PIXELS = 40_000_000
+
+# Background tasks (main_feed.tasks)
+# Work such as delivering new posts to the followers' timelines runs
+# on a small thread pool after the transaction commits. Set
+# BACKGROUND_TASKS_EAGER to True to run it synchronously instead.
+
+BACKGROUND_TASK_WORKERS = 2
+BACKGROUND_TASKS_EAGER = False
+
+# Home feed delivery (main_feed.fanout)
+# Posts of accounts with more followers than this are not copied into
+# each follower's timeline; they are merged into the feed when it is
+# read.
+
+FEED_FANOUT_MAX_FOLLOWERS = 10000
@@ -0,0 +1,83 @@
+"""
+Performance profile of the SQLite database.
+
+The default configuration suits development: rollback journal, one
+fsync per commit, a new connection per request and transactions that
+only take the write lock when they first write, which makes a reader
+turning into a writer fail with "database is locked" instead of
+waiting for its turn.
+
+The profile applies, on every new connection:
+
+- journal_mode=WAL: readers no longer block the writer and the
+  writer no longer blocks readers;
+- synchronous=NORMAL: in WAL mode, commits no longer wait for an
+  fsync, only checkpoints do. A power loss can lose the last
+  transactions, never corrupt the database;
+- mmap_size, cache_size: pages are read through a memory map and a
+  larger page cache;
+- busy_timeout: a writer waits for the lock instead of failing;
+- temp_store=MEMORY: sorts and temporary B-trees stay in memory.
+
+Transactions start with BEGIN IMMEDIATE, so they take the write lock
+up front and wait for it under busy_timeout, and connections are kept
+open between requests (CONN_MAX_AGE) with a health check.
+
+It is enabled by setting the LITREVUE_SQLITE_PROFILE environment
+variable to "performance" (see LITRevue.settings).
+"""
+
+PROFILE_ENV_VAR = "LITREVUE_SQLITE_PROFILE"
+PERFORMANCE = "performance"
+
+BUSY_TIMEOUT_MS = 5000
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are in KiB: 64 MiB.
+    "cache_size": -64 * 1024,
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "temp_store": "MEMORY",
+}
+
+CONN_MAX_AGE = 600
+
+
+def init_command(pragmas=PRAGMAS):
+    """
+    Returns the PRAGMA statements run on each new connection, as
+    expected by the "init_command" option of the sqlite3 backend.
+    """
+    return ";".join(
+        f"PRAGMA {name}={value}" for name, value in pragmas.items()
+    )
+
+
+def performance_profile(database):
+    """
+    Returns a copy of a DATABASES entry using the performance
+    profile.
+
+    Args:
+        database (dict): A sqlite3 entry of the DATABASES setting.
+
+    Returns:
+        dict: The same entry with the PRAGMAs, BEGIN IMMEDIATE and
+        persistent connections enabled.
+    """
+    options = dict(database.get("OPTIONS", {}))
+    options.update({
+        "init_command": init_command(),
+        "transaction_mode": "IMMEDIATE",
+        # Seconds the Python driver waits for a lock, on top of the
+        # busy_timeout of the statements it runs itself.
+        "timeout": BUSY_TIMEOUT_MS / 1000,
+    })
+    return {
+        **database,
+        "OPTIONS": options,
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+    }
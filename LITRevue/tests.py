@@ -0,0 +1,392 @@
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from authentication.models import User
+from main_feed.models import Review, Ticket
+from . import metrics, write_queue
+from .routers import (
+    STICKY_COOKIE, PrimaryReplicaRouter, ReplicaRoutingMiddleware
+)
+from .sqlite_profile import (
+    BUSY_TIMEOUT_MS, CONN_MAX_AGE, PRAGMAS, performance_profile
+)
+from .write_queue import run_write
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Routing decisions of PrimaryReplicaRouter under
+    ReplicaRoutingMiddleware, with "default" standing for the primary
+    and "replica" for a replica.
+    """
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def handle(self, request, view):
+        """
+        Runs 'view' as the view of 'request' through the middleware
+        and returns the response with the databases the view read
+        from.
+        """
+        reads = []
+
+        def get_response(request):
+            view(reads)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return response, reads
+
+    def read(self, reads):
+        reads.append(self.router.db_for_read(Ticket))
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Ticket), DEFAULT_DB_ALIAS)
+
+    def test_safe_request_reads_from_replica(self):
+        response, reads = self.handle(self.factory.get("/home/"), self.read)
+        self.assertEqual(reads, ["replica"])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_post_reads_primary_and_sets_sticky_cookie(self):
+        response, reads = self.handle(
+            self.factory.post("/reviews/create/"), self.read
+        )
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS])
+        self.assertEqual(response.cookies[STICKY_COOKIE]["max-age"], 5)
+
+    def test_sticky_user_reads_from_primary(self):
+        request = self.factory.get("/home/")
+        request.COOKIES[STICKY_COOKIE] = "1"
+        _, reads = self.handle(request, self.read)
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS])
+
+    def test_reads_after_a_write_use_the_primary(self):
+        def view(reads):
+            self.read(reads)
+            self.assertEqual(
+                self.router.db_for_write(Review), DEFAULT_DB_ALIAS
+            )
+            self.read(reads)
+
+        response, reads = self.handle(self.factory.get("/home/"), view)
+        self.assertEqual(reads, ["replica", DEFAULT_DB_ALIAS])
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        response, reads = self.handle(self.factory.post("/"), self.read)
+        self.assertEqual(reads, [DEFAULT_DB_ALIAS])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertIs(
+            self.router.allow_migrate("replica", "main_feed"), False
+        )
+        self.assertIsNone(
+            self.router.allow_migrate(DEFAULT_DB_ALIAS, "main_feed")
+        )
+
+
+class ReplicaDatabaseTests(TransactionTestCase):
+    """
+    Requests read from a second SQLite database standing in for the
+    replica, unless they write or their user just wrote.
+    """
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings["replica"] = {
+            **connections.settings[DEFAULT_DB_ALIAS],
+            "NAME": str(Path(directory.name) / "replica.sqlite3"),
+        }
+        self.addCleanup(self.remove_replica)
+        # Connected here, as the test case only lets its own databases
+        # connect on demand.
+        connections["replica"].connect()
+        call_command("migrate", database="replica", verbosity=0)
+
+        User.objects.create(username="primaire")
+        User.objects.using("replica").create(username="réplique")
+        self.factory = RequestFactory()
+
+    @staticmethod
+    def remove_replica():
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def usernames(self, request):
+        def view(request):
+            return HttpResponse(
+                ",".join(User.objects.values_list("username", flat=True))
+            )
+
+        with override_settings(DATABASE_REPLICAS=["replica"]):
+            response = ReplicaRoutingMiddleware(view)(request)
+        return response.content.decode(), response
+
+    def test_get_reads_from_the_replica(self):
+        usernames, response = self.usernames(self.factory.get("/home/"))
+        self.assertEqual(usernames, "réplique")
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_writers_read_from_the_primary(self):
+        usernames, response = self.usernames(self.factory.post("/home/"))
+        self.assertEqual(usernames, "primaire")
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = self.factory.get("/home/")
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        usernames, _ = self.usernames(request)
+        self.assertEqual(usernames, "primaire")
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """
+    Connections opened with the performance profile run with its
+    PRAGMAs.
+    """
+    def test_pragmas_are_applied(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = ConnectionHandler({
+            # Required by the handler, never connected to.
+            DEFAULT_DB_ALIAS: {},
+            "profiled": performance_profile({
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": Path(directory.name) / "profiled.sqlite3",
+            }),
+        })
+        profiled = handler["profiled"]
+        self.addCleanup(profiled.close)
+
+        values = {}
+        with profiled.cursor() as cursor:
+            for name in PRAGMAS:
+                cursor.execute(f"PRAGMA {name}")
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {
+            "journal_mode": "wal",
+            # NORMAL
+            "synchronous": 1,
+            "mmap_size": PRAGMAS["mmap_size"],
+            "cache_size": PRAGMAS["cache_size"],
+            "busy_timeout": BUSY_TIMEOUT_MS,
+            # MEMORY
+            "temp_store": 2,
+        })
+        self.assertEqual(profiled.transaction_mode, "IMMEDIATE")
+        self.assertEqual(profiled.settings_dict["CONN_MAX_AGE"],
+                         CONN_MAX_AGE)
+
+
+@override_settings(SERIALIZE_WRITES=True, WRITE_QUEUE_TIMEOUT=10)
+class WriteQueueTests(TransactionTestCase):
+    """
+    The writer thread groups the writes queued during a transaction
+    into the next one, rolls back a failing write alone, raises its
+    exception to its caller and survives it.
+    """
+    def setUp(self):
+        self.queue = write_queue.WriteQueue(max_batch=4)
+        patcher = mock.patch.object(write_queue, "_queue", self.queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.batches = []
+        run = self.queue._run
+
+        def record(batch):
+            self.batches.append(len(batch))
+            run(batch)
+
+        self.queue._run = record
+
+    def block(self):
+        """
+        Occupies the writer until the returned event is set.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def wait():
+            started.set()
+            release.wait(10)
+
+        future = self.queue.submit(wait)
+        started.wait(10)
+        self.addCleanup(release.set)
+        return future, release
+
+    @staticmethod
+    def create_user(username, error=None):
+        User.objects.create(username=username)
+        if error is not None:
+            raise error
+
+    def test_queued_writes_share_a_transaction(self):
+        blocker, release = self.block()
+        futures = [
+            self.queue.submit(self.create_user, f"lecteur{n}")
+            for n in range(6)
+        ]
+        release.set()
+        for future in [blocker, *futures]:
+            future.result(10)
+        self.assertEqual(self.batches, [1, 4, 2])
+        self.assertEqual(User.objects.count(), 6)
+
+    def test_failing_write_is_rolled_back_alone(self):
+        blocker, release = self.block()
+        futures = [
+            self.queue.submit(self.create_user, "avant"),
+            self.queue.submit(self.create_user, "raté", ValueError("non")),
+            self.queue.submit(self.create_user, "après"),
+        ]
+        release.set()
+        blocker.result(10)
+        futures[0].result(10)
+        futures[2].result(10)
+        with self.assertRaisesMessage(ValueError, "non"):
+            futures[1].result(10)
+        self.assertEqual(self.batches, [1, 3])
+        self.assertEqual(
+            sorted(User.objects.values_list("username", flat=True)),
+            ["après", "avant"],
+        )
+
+    def test_exceptions_reach_the_caller(self):
+        self.assertEqual(run_write(lambda: 42), 42)
+        with self.assertRaisesMessage(ValueError, "non"):
+            run_write(self.create_user, "raté", ValueError("non"))
+        with self.assertRaises(KeyboardInterrupt):
+            run_write(self.create_user, "raté", KeyboardInterrupt())
+        # The writer survived both.
+        run_write(self.create_user, "lecteur")
+        self.assertEqual(
+            list(User.objects.values_list("username", flat=True)),
+            ["lecteur"],
+        )
+
+    def test_writer_survives_closing_its_connection(self):
+        with mock.patch.object(
+                write_queue, "close_old_connections",
+                side_effect=RuntimeError("fermeture")), \
+                self.assertLogs("LITRevue.write_queue", "ERROR"):
+            run_write(self.create_user, "lecteur")
+        self.assertEqual(run_write(lambda: 42), 42)
+
+    @override_settings(WRITE_QUEUE_TIMEOUT=0.05)
+    def test_waiting_is_bounded(self):
+        _, release = self.block()
+        with self.assertRaises(TimeoutError):
+            run_write(self.create_user, "lecteur")
+        release.set()
+        # The write timed out before it started: it was cancelled.
+        self.assertEqual(run_write(lambda: 42), 42)
+        self.assertFalse(User.objects.exists())
+
+
+class RequestMetricsTests(TestCase):
+    """
+    RequestMetricsMiddleware reports the phases of each request in
+    the Server-Timing header and in histograms served to staff users.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="lecteur", password="azerty123"
+        )
+        cls.staff = User.objects.create_user(
+            username="admin", password="azerty123", is_staff=True
+        )
+
+    def setUp(self):
+        for histogram in metrics.HISTOGRAMS:
+            histogram.reset()
+
+    def timings(self, response):
+        phases = {}
+        for entry in response["Server-Timing"].split(", "):
+            name, duration, *desc = entry.split(";")
+            phases[name] = float(duration.removeprefix("dur="))
+            if desc:
+                phases[name + "_desc"] = desc[0]
+        return phases
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("homepage"))
+        timings = self.timings(response)
+        self.assertEqual(
+            timings["sql_desc"],
+            f'desc="{len(context.captured_queries)} queries"',
+        )
+        self.assertGreater(timings["template"], 0)
+        self.assertLessEqual(timings["template"], timings["total"])
+        self.assertEqual(timings["image"], 0)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_can_be_disabled(self):
+        response = self.client.get(reverse("login"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_histograms_per_view(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("homepage"))
+        self.client.get(reverse("homepage"))
+        self.client.get("/nulle-part/")
+
+        counts, _, count = metrics.request_seconds.snapshot()[("homepage",)]
+        self.assertEqual(count, 2)
+        self.assertEqual(counts[-1], 2)
+        self.assertIn((metrics.UNMATCHED_VIEW,),
+                      metrics.request_seconds.snapshot())
+        self.assertEqual(
+            metrics.phase_seconds.snapshot()[("homepage", "sql")][2], 2
+        )
+
+    def test_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("h", "Test.", ("view",), (1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(("v",), value)
+        self.assertEqual(
+            histogram.snapshot()[("v",)], ([2, 3, 4], 56.5, 4)
+        )
+        self.assertIn('h_bucket{view="v",le="+Inf"} 4',
+                      histogram.exposition())
+
+    def test_endpoint_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 302)
+
+        self.client.force_login(self.staff)
+        self.client.get(reverse("homepage"))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        body = response.content.decode()
+        self.assertIn(
+            'litrevue_request_duration_seconds_count{view="homepage"} 1',
+            body,
+        )
+        self.assertIn(
+            'litrevue_fragment_cache_lookups_total'
+            '{kind="ticket",result="hits"}',
+            body,
+        )
@@ -19,9 +19,12 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from LITRevue.metrics import metrics
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", metrics, name="metrics"),
     path("", include("authentication.urls")),
     path("", include("main_feed.urls"))
 ]
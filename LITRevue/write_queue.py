@@ -0,0 +1,174 @@
+"""
+Optional single-writer queue for the database writes of the views.
+
+SQLite lets one connection write at a time. When many requests write
+at once, each of them waits for the lock, retries, and pays for its
+own commit. With SERIALIZE_WRITES enabled, the views hand their
+writes to run_write() instead: one writer thread runs them one after
+the other on its own connection, so they never contend for the lock,
+and groups the writes that queued up during the previous commit into
+a single transaction, so that one commit (and one fsync) serves them
+all.
+
+Each write runs in its own savepoint: a write that fails is rolled
+back alone and its exception is raised to its caller, while the
+others of the group are committed. run_write() only returns once the
+transaction holding the write is committed, so callers get the same
+success or failure as if they had written themselves.
+
+Writes should be short and only touch the database: files, such as
+uploaded images, are better stored before calling run_write().
+
+Sessions are written outside the queue: login() and logout() change
+request.session, which SessionMiddleware saves on the request thread.
+Only the user rows they update, such as the last login, are queued.
+
+Callers wait at most WRITE_QUEUE_TIMEOUT seconds for their write. The
+writer thread outlives the failures of the writes and of their
+transactions, and is started again should it die all the same.
+
+When SERIALIZE_WRITES is disabled (the default), or when the caller is
+already inside a transaction, run_write() simply calls the function.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueue:
+    """
+    A writer thread running the submitted functions in groups, each
+    group in one transaction.
+
+    Attributes:
+        max_batch (int): Maximum number of writes per transaction.
+
+    Methods:
+        submit(func, *args, **kwargs): Queues a write and returns a
+        Future resolved once its transaction is committed.
+        is_writer(): Whether the current thread is the writer.
+    """
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._start()
+        self._jobs.put((future, func, args, kwargs))
+        return future
+
+    def is_writer(self):
+        return threading.current_thread() is self._thread
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name="write-queue", daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._jobs.get()]
+            # Take the writes that queued up meanwhile, without waiting
+            # for more: an idle queue adds no latency.
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._run(batch)
+            except BaseException as error:
+                # The thread must survive: its callers wait for it.
+                logger.exception("Write queue batch failed")
+                for future, _, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            try:
+                close_old_connections()
+            except Exception:
+                logger.exception("Closing the write queue connection "
+                                 "failed")
+
+    def _run(self, batch):
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for future, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            result = func(*args, **kwargs)
+                    except BaseException as error:
+                        outcomes.append((future, None, error))
+                    else:
+                        outcomes.append((future, result, None))
+        except BaseException as error:
+            # The transaction failed: none of the writes happened.
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for future, result, error in outcomes:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def _get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = WriteQueue(settings.WRITE_QUEUE_MAX_BATCH)
+        return _queue
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs), a function writing to the database,
+    and returns its result.
+
+    With SERIALIZE_WRITES, the function runs on the writer thread, in
+    a transaction shared with other concurrent writes, and this call
+    blocks until that transaction is committed. Exceptions raised by
+    the function, or by the commit, are raised here.
+
+    Args:
+        func (callable): The write. It runs in another thread: it
+        must not rely on the caller's database connection.
+
+    Returns:
+        The value returned by func.
+
+    Raises:
+        TimeoutError: The write was not committed within
+        WRITE_QUEUE_TIMEOUT seconds. It is cancelled if it has not
+        started yet; one already running may still be committed.
+    """
+    if (not settings.SERIALIZE_WRITES or connection.in_atomic_block
+            or (_queue is not None and _queue.is_writer())):
+        return func(*args, **kwargs)
+    future = _get_queue().submit(func, *args, **kwargs)
+    try:
+        return future.result(timeout=settings.WRITE_QUEUE_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.contrib.auth.signals import user_logged_in
 
 
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        # Replaced by signals.queue_last_login.
+        user_logged_in.disconnect(dispatch_uid="update_last_login")
+        from . import signals  # noqa: F401
@@ -0,0 +1,131 @@
+"""
+Username completion for the follow form.
+
+Usernames starting with a typed prefix, whatever its case, are read
+with a range over the lower(username) index of User:
+
+    lower(username) >= prefix AND lower(username) < prefix + U+10FFFF
+
+which SQLite serves with a seek in the index, where a LIKE or an
+istartswith lookup would scan the whole table. As SQLite's lower()
+only folds ASCII letters, the prefix is folded the same way.
+
+The same few prefixes (one or two letters) are typed by most users,
+so answers are kept in a small in-process LRU cache for
+USERNAME_COMPLETION_CACHE_SECONDS. A user created or deleted by this
+process empties it; other processes see them when their answers
+expire.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.functions import Lower
+
+from .models import User
+
+
+COMPLETION_LIMIT = 10
+
+# Case folding of SQLite's lower(), ASCII letters only.
+_ASCII_LOWER = str.maketrans(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"
+)
+
+# Greater than every character, so that prefix + _LAST is greater
+# than every string starting with prefix.
+_LAST = "\U0010ffff"
+
+
+class PrefixCache:
+    """
+    Thread-safe LRU cache of the completions of the hottest prefixes,
+    each kept for a limited time.
+
+    Attributes:
+        max_size (int): Number of prefixes kept.
+        timeout (float): Seconds an answer is kept.
+    """
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, prefix):
+        """
+        Returns the cached completions of prefix, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(prefix)
+            if entry is None:
+                return None
+            expires, usernames = entry
+            if expires < time.monotonic():
+                del self._entries[prefix]
+                return None
+            self._entries.move_to_end(prefix)
+            return usernames
+
+    def set(self, prefix, usernames):
+        with self._lock:
+            self._entries[prefix] = (
+                time.monotonic() + self.timeout, usernames
+            )
+            self._entries.move_to_end(prefix)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = PrefixCache(
+    settings.USERNAME_COMPLETION_CACHE_SIZE,
+    settings.USERNAME_COMPLETION_CACHE_SECONDS,
+)
+
+
+def query_usernames(prefix, limit=COMPLETION_LIMIT):
+    """
+    Reads from the database the first usernames, in case-insensitive
+    alphabetical order, starting with prefix.
+
+    Args:
+        prefix (str): Prefix, ASCII letters in lowercase.
+        limit (int): Maximum number of usernames returned.
+
+    Returns:
+        list: The usernames.
+    """
+    return list(
+        User.objects
+        .annotate(username_lower=Lower("username"))
+        .filter(username_lower__gte=prefix,
+                username_lower__lt=prefix + _LAST)
+        .order_by("username_lower")
+        .values_list("username", flat=True)[:limit]
+    )
+
+
+def complete_username(text):
+    """
+    Returns the usernames starting with text, whatever its case.
+
+    Args:
+        text (str): What the user typed.
+
+    Returns:
+        list: At most COMPLETION_LIMIT usernames, empty for a blank
+        text.
+    """
+    prefix = text.strip().translate(_ASCII_LOWER)
+    if not prefix:
+        return []
+    usernames = cache.get(prefix)
+    if usernames is None:
+        usernames = query_usernames(prefix)
+        cache.set(prefix, usernames)
+    return usernames
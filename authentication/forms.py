@@ -1,9 +1,27 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
+from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
 
+class UsernameInput(forms.TextInput):
+    """
+    Text input completing the typed username with the names of the
+    existing users, read from the username_completions endpoint by
+    username_completions.js and offered in a <datalist>.
+    """
+    class Media:
+        js = ["username_completions.js"]
+
+    def __init__(self, attrs=None):
+        super().__init__({
+            "autocomplete": "off",
+            "data-completions-url": reverse_lazy("username_completions"),
+            **(attrs or {}),
+        })
+
+
 class LoginForm(forms.Form):
     """
     LoginForm is a Django form for user authentication.
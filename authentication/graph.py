@@ -0,0 +1,160 @@
+"""
+Process-level cache of the follow graph.
+
+The ids of the users someone follows (their followees) and of the
+users following them (their followers) are read from UserFollows the
+first time they are needed and kept as sorted arrays of 64-bit
+integers: 8 bytes per edge, where a list of ints costs about 36, and
+membership tests are binary searches.
+
+Each user's lists are loaded on their own, when first asked for, and
+at most FOLLOW_GRAPH_CACHE_USERS users are kept, the least recently
+used being dropped first. The signal receivers of
+authentication.signals drop the lists of both users of a follow
+created or deleted by this process, again when its transaction
+commits. Lists are also reloaded after FOLLOW_GRAPH_CACHE_SECONDS, so
+that the follows written by other processes are seen.
+
+Lists are always read from the primary database, and lists read
+inside a transaction are not kept: the cache only holds committed
+follows, which a rollback cannot take back. Code creating or deleting
+follows without their signals (bulk_create, queryset updates) must
+call forget() or FollowGraph.clear() itself.
+
+Pages read the graph through the module functions rather than
+UserFollows:
+
+    followee_ids(user_id), follower_ids(user_id),
+    is_following(user_id, other_id), forget(*user_ids)
+
+Code storing data derived from the follows (timelines, suggestions)
+reads UserFollows instead, as a list cached for up to
+FOLLOW_GRAPH_CACHE_SECONDS would be written into that data.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import UserFollows
+
+
+FOLLOWEES = "user_id", "followed_user_id"
+FOLLOWERS = "followed_user_id", "user_id"
+
+
+class FollowGraph:
+    """
+    LRU cache of the followee and follower id arrays of the most
+    recently used users.
+
+    Attributes:
+        max_users (int): Number of users whose lists are kept, per
+        direction.
+        timeout (float): Seconds a list is kept.
+    """
+    def __init__(self, max_users, timeout):
+        self.max_users = max_users
+        self.timeout = timeout
+        self._lists = {FOLLOWEES: OrderedDict(), FOLLOWERS: OrderedDict()}
+        self._lock = threading.Lock()
+        # Bumped by forget(), so that a list read from the database
+        # before a change is not cached after it.
+        self._version = 0
+
+    def ids(self, direction, user_id):
+        """
+        Returns the sorted ids at the other end of the edges of a
+        user in one direction, loading them if needed.
+
+        Args:
+            direction (tuple): FOLLOWEES or FOLLOWERS.
+            user_id (int): Id of the user.
+
+        Returns:
+            array: The ids, typecode "q". Do not modify it.
+        """
+        lists = self._lists[direction]
+        with self._lock:
+            entry = lists.get(user_id)
+            if entry is not None and entry[0] >= time.monotonic():
+                lists.move_to_end(user_id)
+                return entry[1]
+            version = self._version
+        ids = self.load(direction, user_id)
+        with self._lock:
+            if (version != self._version
+                    or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+                return ids
+            lists[user_id] = (time.monotonic() + self.timeout, ids)
+            lists.move_to_end(user_id)
+            while len(lists) > self.max_users:
+                lists.popitem(last=False)
+        return ids
+
+    def load(self, direction, user_id):
+        column, other = direction
+        # A lagging replica would be cached for the whole timeout.
+        return array("q", (
+            UserFollows.objects.using(DEFAULT_DB_ALIAS)
+            .filter(**{column: user_id})
+            .order_by(other)
+            .values_list(other, flat=True)
+        ))
+
+    def forget(self, *user_ids):
+        """
+        Drops the cached lists of the given users.
+        """
+        with self._lock:
+            self._version += 1
+            for lists in self._lists.values():
+                for user_id in user_ids:
+                    lists.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            for lists in self._lists.values():
+                lists.clear()
+
+
+graph = FollowGraph(
+    settings.FOLLOW_GRAPH_CACHE_USERS, settings.FOLLOW_GRAPH_CACHE_SECONDS
+)
+
+
+def followee_ids(user_id):
+    """
+    Returns the sorted array of the ids of the users user_id follows.
+    """
+    return graph.ids(FOLLOWEES, user_id)
+
+
+def follower_ids(user_id):
+    """
+    Returns the sorted array of the ids of the users following
+    user_id.
+    """
+    return graph.ids(FOLLOWERS, user_id)
+
+
+def is_following(user_id, other_id):
+    """
+    Returns True when user_id follows other_id.
+    """
+    ids = followee_ids(user_id)
+    index = bisect_left(ids, other_id)
+    return index < len(ids) and ids[index] == other_id
+
+
+def forget(*user_ids):
+    """
+    Drops the cached lists of the given users, to be called when
+    their follows change.
+    """
+    graph.forget(*user_ids)
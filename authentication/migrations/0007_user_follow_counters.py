@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_follows(apps, schema_editor):
+    """
+    Initializes the follow counters from the existing follows.
+    """
+    User = apps.get_model("authentication", "User")
+    UserFollows = apps.get_model("authentication", "UserFollows")
+    for field, fk in (("follower_count", "followed_user"),
+                      ("following_count", "user")):
+        counts = UserFollows.objects.filter(
+            **{fk: OuterRef("pk")}
+        ).order_by().values(fk).annotate(n=Count("pk")).values("n")
+        User.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_alter_userfollows_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_follows, migrations.RunPython.noop),
+    ]
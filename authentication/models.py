@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.db.models.functions import Lower
 
 
 class User(AbstractUser):
@@ -18,6 +19,14 @@ class User(AbstractUser):
             (user A can follow user B without B following A).
             - 'related_name="followers"' allows reverse access
             to users who follow this user.
+        follower_count (PositiveIntegerField): Number of users following
+        this user, maintained by authentication.signals.
+        following_count (PositiveIntegerField): Number of users this user
+        follows, maintained by authentication.signals.
+
+    Meta:
+        indexes: lower(username) serves the case-insensitive prefix
+        lookups of the username completion (authentication.autocomplete).
 
     Methods:
         __str__(): Returns the username of the user as the string
@@ -30,6 +39,13 @@ class User(AbstractUser):
         symmetrical=False,
         related_name="followers"
     )
+    follower_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(Lower("username"), name="user_username_lower_idx"),
+        ]
 
     def __str__(self):
         return self.username
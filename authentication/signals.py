@@ -0,0 +1,58 @@
+"""
+Signal receivers keeping the follow counters of User up to date, and
+the username completions and the follow graph cache fresh. Also
+hands the last login update to the write queue.
+"""
+from functools import partial
+
+from django.contrib.auth.models import update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from LITRevue.write_queue import run_write
+from main_feed.counters import increment
+from . import autocomplete, graph
+from .models import User, UserFollows
+
+
+@receiver(post_save, sender=UserFollows)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        increment(User, instance.user_id, "following_count", 1)
+        increment(User, instance.followed_user_id, "follower_count", 1)
+
+
+@receiver(post_delete, sender=UserFollows)
+def count_unfollow(sender, instance, **kwargs):
+    increment(User, instance.user_id, "following_count", -1)
+    increment(User, instance.followed_user_id, "follower_count", -1)
+
+
+@receiver(post_save, sender=UserFollows)
+@receiver(post_delete, sender=UserFollows)
+def forget_follows(sender, instance, **kwargs):
+    # Now for this transaction, and once committed for the requests
+    # that read the graph meanwhile.
+    users = instance.user_id, instance.followed_user_id
+    graph.forget(*users)
+    transaction.on_commit(partial(graph.forget, *users))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_completions(sender, instance, created=True, **kwargs):
+    # Renames are rare enough to wait for the cached answers to expire.
+    if created:
+        autocomplete.cache.clear()
+
+
+@receiver(user_logged_in)
+def queue_last_login(sender, user, **kwargs):
+    """
+    Replaces django.contrib.auth's update_last_login() receiver (see
+    AuthenticationConfig.ready()), running the update through
+    run_write(). The session is still written by the request thread.
+    """
+    run_write(update_last_login, sender, user)
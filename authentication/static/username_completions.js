@@ -0,0 +1,47 @@
+// Completes the username inputs having a data-completions-url with
+// the names returned by that URL, offered in a <datalist>.
+document.addEventListener("DOMContentLoaded", () => {
+  const DELAY_MS = 120;
+
+  document.querySelectorAll("input[data-completions-url]").forEach((input) => {
+    const list = document.createElement("datalist");
+    list.id = `${input.id || input.name}-completions`;
+    input.after(list);
+    input.setAttribute("list", list.id);
+
+    let timer = null;
+    let request = null;
+
+    const complete = async () => {
+      const prefix = input.value.trim();
+      if (request) {
+        request.abort();
+      }
+      if (!prefix) {
+        list.replaceChildren();
+        return;
+      }
+      request = new AbortController();
+      const url = new URL(input.dataset.completionsUrl, window.location);
+      url.searchParams.set("q", prefix);
+      try {
+        const response = await fetch(url, { signal: request.signal });
+        if (!response.ok) {
+          return;
+        }
+        const { usernames } = await response.json();
+        list.replaceChildren(...usernames.map((name) => new Option(name)));
+      } catch (error) {
+        if (error.name !== "AbortError") {
+          throw error;
+        }
+      }
+    };
+
+    // Waits for a pause in the typing instead of asking for every key.
+    input.addEventListener("input", () => {
+      clearTimeout(timer);
+      timer = setTimeout(complete, DELAY_MS);
+    });
+  });
+});
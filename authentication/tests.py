@@ -1,3 +1,162 @@
-# from django.test import TestCase
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import update_last_login
+from django.db import connection
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from LITRevue.write_queue import run_write
+from . import autocomplete, graph, signals
+from .models import User, UserFollows
+
+
+class UsernameCompletionTests(TestCase):
+    """
+    The follow form completes usernames from a case-insensitive
+    prefix, read through the lower(username) index.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        for username in ["Alice", "alfred", "Bob", "Émile", "aline"]:
+            User.objects.create_user(username=username, password="azerty1")
+
+    def setUp(self):
+        autocomplete.cache.clear()
+        self.client.force_login(User.objects.get(username="Bob"))
+
+    def completions(self, text):
+        response = self.client.get(
+            reverse("username_completions"), {"q": text}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["usernames"]
+
+    def test_prefix_is_case_insensitive(self):
+        self.assertEqual(self.completions("AL"), ["alfred", "Alice", "aline"])
+        self.assertEqual(self.completions("ali"), ["Alice", "aline"])
+        self.assertEqual(self.completions("Émi"), ["Émile"])
+        self.assertEqual(self.completions(" "), [])
+
+    def test_new_users_are_completed(self):
+        self.assertEqual(self.completions("bo"), ["Bob"])
+        User.objects.create_user(username="boris", password="azerty1")
+        self.assertEqual(self.completions("bo"), ["Bob", "boris"])
+
+    def test_hot_prefixes_are_cached(self):
+        self.completions("al")
+        with self.assertNumQueries(2):
+            # Session and user only.
+            self.assertEqual(len(self.completions("al")), 3)
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite query plans")
+    def test_lookup_uses_the_index(self):
+        with self.assertNumQueries(1) as context:
+            autocomplete.query_usernames("al")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "EXPLAIN QUERY PLAN " + context.captured_queries[0]["sql"]
+            )
+            plan = "\n".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("USING INDEX user_username_lower_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class FollowGraphTests(TransactionTestCase):
+    """
+    The follow graph cache serves repeated reads without queries and
+    forgets the users whose follows change.
+
+    A TransactionTestCase, as lists read inside a transaction are not
+    cached. Tasks run eagerly, so that the ones queued by follows do
+    not race the test for the database.
+    """
+    def setUp(self):
+        graph.graph.clear()
+        self.alice, self.bob, self.carol = (
+            User.objects.create_user(username=name, password="azerty1")
+            for name in ("alice", "bob", "carol")
+        )
+        UserFollows.objects.create(user=self.alice, followed_user=self.carol)
+        UserFollows.objects.create(user=self.alice, followed_user=self.bob)
+
+    def tearDown(self):
+        graph.graph.clear()
+
+    def test_lists_are_sorted_and_cached(self):
+        self.assertEqual(
+            list(graph.followee_ids(self.alice.id)),
+            [self.bob.id, self.carol.id],
+        )
+        self.assertEqual(
+            list(graph.follower_ids(self.bob.id)), [self.alice.id]
+        )
+        graph.followee_ids(self.bob.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.alice.id, self.bob.id))
+            self.assertFalse(graph.is_following(self.bob.id, self.alice.id))
+
+    def test_follows_and_unfollows_are_seen(self):
+        graph.followee_ids(self.alice.id)
+        graph.follower_ids(self.alice.id)
+        UserFollows.objects.create(user=self.bob, followed_user=self.alice)
+        self.assertEqual(
+            list(graph.follower_ids(self.alice.id)), [self.bob.id]
+        )
+        UserFollows.objects.filter(user=self.alice).delete()
+        self.assertEqual(list(graph.followee_ids(self.alice.id)), [])
+
+    def test_rolled_back_follows_are_not_cached(self):
+        with transaction.atomic():
+            UserFollows.objects.create(
+                user=self.carol, followed_user=self.alice
+            )
+            self.assertEqual(
+                list(graph.followee_ids(self.carol.id)), [self.alice.id]
+            )
+            transaction.set_rollback(True)
+        self.assertEqual(list(graph.followee_ids(self.carol.id)), [])
+
+    def test_least_recently_used_users_are_dropped(self):
+        small = graph.FollowGraph(max_users=1, timeout=60)
+        small.ids(graph.FOLLOWEES, self.alice.id)
+        small.ids(graph.FOLLOWEES, self.bob.id)
+        with self.assertNumQueries(1):
+            small.ids(graph.FOLLOWEES, self.alice.id)
+
+
+class LoginTests(TestCase):
+    """
+    Logging in and signing up write the session on the request thread
+    and hand the user rows to the write queue.
+    """
+    def setUp(self):
+        patcher = mock.patch.object(signals, "run_write", wraps=run_write)
+        self.run_write = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_last_login_goes_through_the_queue(self):
+        user = User.objects.create_user(username="Alice", password="azerty1")
+        response = self.client.post(
+            reverse("login"), {"username": "Alice", "password": "azerty1"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.session["_auth_user_id"], str(user.pk))
+        self.run_write.assert_called_once_with(
+            update_last_login, mock.ANY, user
+        )
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+
+    def test_sign_up_logs_in(self):
+        response = self.client.post(reverse("signup"), {
+            "username": "Bob",
+            "password1": "Vf8!kq2#Lm",
+            "password2": "Vf8!kq2#Lm",
+        })
+        self.assertRedirects(response, reverse("homepage"),
+                             fetch_redirect_response=False)
+        user = User.objects.get(username="Bob")
+        self.assertEqual(self.client.session["_auth_user_id"], str(user.pk))
+        self.assertIsNotNone(user.last_login)
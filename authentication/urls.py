@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth.views import LoginView, LogoutView
-from authentication.views import SignUpView
+from authentication.views import SignUpView, username_completions
 
 
 urlpatterns = [
@@ -8,4 +8,9 @@ urlpatterns = [
         template_name="authentication/login.html"), name="login"),
     path("logout/", LogoutView.as_view(), name="logout"),
     path("signup/", SignUpView.as_view(), name="signup"),
+    path(
+        "users/completions/",
+        username_completions,
+        name="username_completions"
+    ),
 ]
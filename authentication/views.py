@@ -1,8 +1,13 @@
 from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.views.generic import View
+
+from LITRevue.write_queue import run_write
 from . import forms
+from .autocomplete import complete_username
 
 
 class LoginView(View):
@@ -112,7 +117,7 @@ class SignUpView(View):
         button_text = "Inscription"
 
         if form.is_valid():
-            user = form.save()
+            user = run_write(form.save)
             login(request, user)
             return redirect(settings.LOGIN_REDIRECT_URL)
 
@@ -124,3 +129,20 @@ class SignUpView(View):
                 "button_text": button_text
                 }
             )
+
+
+@login_required
+def username_completions(request):
+    """
+    Return the usernames starting with the "q" query parameter,
+    whatever its case, for the completion of the follow form.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: {"usernames": [...]}, at most ten names in
+        alphabetical order.
+    """
+    text = request.GET.get("q", "")[:150]
+    return JsonResponse({"usernames": complete_username(text)})
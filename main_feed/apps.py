@@ -9,3 +9,6 @@ implemented inside the constructor
 class MainFeedConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_feed'
+
+    def ready(self):
+        from . import signals  # noqa: F401
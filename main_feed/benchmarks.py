@@ -0,0 +1,159 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks never touch the configured database: they run against a
+scratch copy of the schema created for the duration of the run, the
+same way the test runner does.
+"""
+import statistics
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from authentication import autocomplete, graph
+from authentication.models import User, UserFollows
+from .fanout import rebuild_timeline
+from .models import Ticket
+
+
+@contextmanager
+def scratch_database(name=None):
+    """
+    Creates an empty database with the project's schema, points the
+    default connection at it and destroys it on exit.
+
+    Args:
+        name (str, optional): SQLite file to use. By default the
+        database lives in memory, which is only suitable for
+        single-threaded benchmarks.
+    """
+    if name is not None:
+        connection.settings_dict["TEST"]["NAME"] = str(name)
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    # The in-process caches hold ids of the other database.
+    graph.graph.clear()
+    autocomplete.cache.clear()
+    try:
+        yield connection.settings_dict["NAME"]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        graph.graph.clear()
+        autocomplete.cache.clear()
+
+
+def create_users(prefix, count, batch_size=1000):
+    """
+    Bulk-creates users named "<prefix>-<n>" with an unusable password
+    and returns their ids.
+    """
+    password = make_password(None)
+    users = User.objects.bulk_create(
+        (
+            User(username=f"{prefix}-{n}", password=password)
+            for n in range(count)
+        ),
+        batch_size=batch_size,
+    )
+    return [user.id for user in users]
+
+
+def create_network(count, followed=10, tickets_per_user=10):
+    """
+    Creates 'count' users who all follow the first 'followed' of
+    them, and tickets written by each user, then builds the home
+    feed timelines.
+
+    Returns:
+        tuple: The ids of the users and the ids of the tickets.
+    """
+    user_ids = create_users("bench", count)
+    UserFollows.objects.bulk_create(
+        UserFollows(user_id=user_id, followed_user_id=followed_id)
+        for user_id in user_ids
+        for followed_id in user_ids[:followed]
+        if user_id != followed_id
+    )
+    tickets = Ticket.objects.bulk_create(
+        Ticket(title=f"Livre {n}", user_id=user_ids[n % count])
+        for n in range(tickets_per_user * count)
+    )
+    for user_id in user_ids:
+        rebuild_timeline(user_id)
+    return user_ids, [ticket.id for ticket in tickets]
+
+
+def timed(func, *args, **kwargs):
+    """
+    Calls func and returns its result with the elapsed time in
+    seconds.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def percentile(samples, percent):
+    """
+    Returns the given percentile of a list of samples, using the
+    nearest-rank method.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1,
+                      round(percent / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """
+    Returns the mean, p50, p95 and p99 of a list of durations in
+    seconds, converted to milliseconds.
+    """
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def measure_requests(requests):
+    """
+    Sends requests through logged-in test clients and measures each
+    of them.
+
+    Args:
+        requests (iterable): (client, method, path, data) tuples,
+        method being "get" or "post".
+
+    Returns:
+        dict: summarize() of the latencies, with the number of
+        requests, the mean and maximum number of queries, the mean
+        response size in bytes and the number of responses per status
+        code.
+    """
+    durations, queries, sizes = [], [], []
+    statuses = Counter()
+    for client, method, path, data in requests:
+        # A full query log would hide the queries of the request.
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            response, elapsed = timed(getattr(client, method), path, data)
+        durations.append(elapsed)
+        queries.append(len(context.captured_queries))
+        sizes.append(len(response.content))
+        statuses[str(response.status_code)] += 1
+    return {
+        "requests": len(durations),
+        **summarize(durations),
+        "queries_mean": statistics.fmean(queries) if queries else 0.0,
+        "queries_max": max(queries, default=0),
+        "bytes_mean": statistics.fmean(sizes) if sizes else 0.0,
+        "statuses": dict(statuses),
+    }
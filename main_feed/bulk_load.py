@@ -0,0 +1,357 @@
+"""
+Streaming import of users, follows, tickets, reviews and comments
+from a JSONL file, one object per line:
+
+    {"type": "user", "username": "alice", "password": "<hash>"}
+    {"type": "follow", "user": "alice", "followed": "bob"}
+    {"type": "ticket", "ref": "t1", "user": "bob", "title": "...",
+     "description": "...", "image": "originals/ab/....jpg",
+     "time_created": "2021-03-04T10:00:00+00:00"}
+    {"type": "review", "ref": "r1", "ticket": "t1", "user": "alice",
+     "rating": 4, "headline": "...", "body": "..."}
+    {"type": "comment", "review": "r1", "author": "bob",
+     "content": "..."}
+
+Lines are read CHUNK_SIZE at a time, and each chunk is written with
+one bulk_create() per model in its own transaction, so memory does
+not depend on the size of the file. Only the id maps grow: usernames
+(all existing users are loaded first) and the "ref" of the imported
+tickets and reviews, which later lines use to point at them. A line
+may only refer to objects of earlier lines or of the database.
+
+bulk_create() sends no signal: the counters, the rating statistics,
+the home feed timelines and the follow graph cache are rebuilt once
+at the end instead, and the derivatives of the ticket images, files
+already copied to the ticket image storage and counted in
+StoredImage, are built then (see finish()). The search index is kept
+up to date by its triggers.
+"""
+import datetime
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from authentication import autocomplete, graph
+from authentication.models import User, UserFollows
+from . import rating_stats
+from .counters import COUNTERS, reconcile
+from .fanout import rebuild_timeline
+from .images import process_ticket_image
+from .models import Comment, Review, StoredImage, Ticket
+
+
+CHUNK_SIZE = 5000
+
+# Creation order: a line may refer to the objects of the types before
+# it in the same chunk.
+TYPES = ["user", "follow", "ticket", "review", "comment"]
+
+TIMESTAMPS = ("time_created", "time_edited")
+
+
+class LoadError(ValueError):
+    """
+    A line that cannot be imported.
+    """
+
+
+@dataclass
+class LoadReport:
+    """
+    Outcome of an import.
+
+    Attributes:
+        lines (int): Number of lines read.
+        created (Counter): Number of objects created per type.
+        skipped (int): Number of lines not imported.
+        errors (list): (line number, message) of the first skipped
+        lines.
+    """
+    lines: int = 0
+    created: Counter = field(default_factory=Counter)
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    MAX_ERRORS = 20
+
+    def skip(self, number, message):
+        self.skipped += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append((number, message))
+
+
+def create_timestamped(model, objs):
+    """
+    bulk_create() keeping the creation times read from the file.
+
+    auto_now and auto_now_add set the current time on insert: the
+    times of the objects are written again by one bulk_update(). The
+    fields themselves are left alone, as other threads may save the
+    same models meanwhile.
+
+    Returns:
+        list: The created objects.
+    """
+    names = [name for name in TIMESTAMPS
+             if any(f.name == name for f in model._meta.fields)]
+    objs = list(objs)
+    times = [[getattr(obj, name) for name in names] for obj in objs]
+    created = model.objects.bulk_create(objs)
+    for obj, values in zip(created, times):
+        for name, value in zip(names, values):
+            setattr(obj, name, value)
+    model.objects.bulk_update(created, names)
+    return created
+
+
+class Loader:
+    """
+    Imports the lines of a JSONL file chunk by chunk.
+
+    Attributes:
+        chunk_size (int): Number of lines written per transaction.
+        user_ids (dict): Id of each known username.
+        ticket_ids (dict): Id of each imported ticket "ref".
+        review_ids (dict): Id of each imported review "ref".
+        report (LoadReport): What was imported so far.
+    """
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.user_ids = dict(User.objects.values_list("username", "pk"))
+        self.ticket_ids = {}
+        self.review_ids = {}
+        self.report = LoadReport()
+        self.unusable_password = make_password(None)
+
+    def load(self, lines, progress=None):
+        """
+        Imports an iterable of JSON lines.
+
+        Args:
+            lines (iterable): The lines, read lazily.
+            progress (callable, optional): Called with the report after
+            each chunk.
+
+        Returns:
+            LoadReport: What was imported.
+        """
+        chunk = []
+        for number, line in enumerate(lines, start=1):
+            if line.strip():
+                chunk.append((number, line))
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                chunk = []
+                if progress:
+                    progress(self.report)
+        if chunk:
+            self.write_chunk(chunk)
+            if progress:
+                progress(self.report)
+        return self.report
+
+    def write_chunk(self, chunk):
+        self.report.lines += len(chunk)
+        rows = {kind: [] for kind in TYPES}
+        for number, line in chunk:
+            try:
+                data = json.loads(line)
+                rows[data["type"]].append((number, data))
+            except (ValueError, KeyError, TypeError):
+                self.report.skip(number, "ligne JSON ou type invalide")
+        with transaction.atomic():
+            for kind in TYPES:
+                if rows[kind]:
+                    getattr(self, f"create_{kind}s")(rows[kind])
+
+    def build(self, rows, build):
+        """
+        Turns (number, data) rows into unsaved objects with build(data),
+        skipping the rows it rejects.
+
+        Returns:
+            list: (data, object) pairs.
+        """
+        built = []
+        for number, data in rows:
+            try:
+                built.append((data, build(data)))
+            except (LoadError, KeyError, TypeError, ValueError) as error:
+                self.report.skip(number, f"{data.get('type')} : {error!r}")
+        return built
+
+    def user_id(self, username):
+        try:
+            return self.user_ids[username]
+        except KeyError:
+            raise LoadError(f"utilisateur inconnu {username!r}")
+
+    @staticmethod
+    def timestamps(data):
+        created = timezone.now()
+        if data.get("time_created"):
+            created = parse_datetime(data["time_created"])
+            if created is None:
+                raise LoadError("date invalide")
+            if timezone.is_naive(created):
+                created = timezone.make_aware(created, datetime.timezone.utc)
+        return {"time_created": created, "time_edited": created}
+
+    def create_users(self, rows):
+        def build(data):
+            if data["username"] in self.user_ids:
+                raise LoadError("utilisateur déjà présent")
+            return User(
+                username=data["username"],
+                password=data.get("password") or self.unusable_password,
+            )
+
+        built = self.build(rows, build)
+        # A username repeated within the chunk is kept once.
+        unique = {obj.username: obj for _, obj in built}
+        users = User.objects.bulk_create(unique.values())
+        for user in users:
+            self.user_ids[user.username] = user.pk
+        self.report.created["user"] += len(users)
+
+    def create_follows(self, rows):
+        built = self.build(rows, lambda data: UserFollows(
+            user_id=self.user_id(data["user"]),
+            followed_user_id=self.user_id(data["followed"]),
+        ))
+        follows = [obj for _, obj in built
+                   if obj.user_id != obj.followed_user_id]
+        # Follows already present, in the database or earlier in the
+        # chunk, are ignored and not counted.
+        before = UserFollows.objects.count()
+        UserFollows.objects.bulk_create(follows, ignore_conflicts=True)
+        self.report.created["follow"] += (
+            UserFollows.objects.count() - before
+        )
+
+    def create_tickets(self, rows):
+        built = self.build(rows, lambda data: Ticket(
+            title=data["title"],
+            description=data.get("description", ""),
+            user_id=self.user_id(data["user"]),
+            image=data.get("image") or None,
+            image_ready=not data.get("image"),
+            **self.timestamps(data),
+        ))
+        tickets = create_timestamped(Ticket, (obj for _, obj in built))
+        for (data, _), ticket in zip(built, tickets):
+            if "ref" in data:
+                self.ticket_ids[str(data["ref"])] = ticket.pk
+        self.retain_images(ticket.image.name for ticket in tickets
+                           if ticket.image)
+        self.report.created["ticket"] += len(tickets)
+
+    def create_reviews(self, rows):
+        def build(data):
+            ticket_id = self.ticket_ids.get(str(data["ticket"]))
+            if ticket_id is None:
+                raise LoadError(f"billet inconnu {data['ticket']!r}")
+            rating = int(data["rating"])
+            if not 0 <= rating <= 5:
+                raise LoadError("note hors de 0 à 5")
+            return Review(
+                ticket_id=ticket_id,
+                rating=rating,
+                headline=data["headline"],
+                body=data.get("body", ""),
+                user_id=self.user_id(data["user"]),
+                **self.timestamps(data),
+            )
+
+        built = self.build(rows, build)
+        reviews = create_timestamped(Review, (obj for _, obj in built))
+        for (data, _), review in zip(built, reviews):
+            if "ref" in data:
+                self.review_ids[str(data["ref"])] = review.pk
+        self.report.created["review"] += len(reviews)
+
+    def create_comments(self, rows):
+        def build(data):
+            review_id = self.review_ids.get(str(data["review"]))
+            if review_id is None:
+                raise LoadError(f"critique inconnue {data['review']!r}")
+            return Comment(
+                review_id=review_id,
+                author_id=self.user_id(data["author"]),
+                content=data.get("content", ""),
+                time_created=self.timestamps(data)["time_created"],
+            )
+
+        comments = create_timestamped(
+            Comment, (obj for _, obj in self.build(rows, build))
+        )
+        self.report.created["comment"] += len(comments)
+
+    @staticmethod
+    def retain_images(names):
+        """
+        Counts the imported tickets using each stored image.
+        """
+        counts = Counter(names)
+        if not counts:
+            return
+        StoredImage.objects.bulk_create(
+            (StoredImage(name=name) for name in counts),
+            ignore_conflicts=True,
+        )
+        for name, count in counts.items():
+            StoredImage.objects.filter(name=name).update(
+                ref_count=F("ref_count") + count
+            )
+
+
+def process_pending_images():
+    """
+    Builds the derivatives of the ticket images not processed yet,
+    such as the imported ones.
+
+    Returns:
+        list: (ticket id, error) of the images that could not be
+        processed.
+    """
+    ticket_ids = Ticket.objects.filter(image_ready=False).exclude(
+        image=""
+    ).exclude(image__isnull=True).order_by("id").values_list(
+        "id", flat=True
+    )
+    failed = []
+    for ticket_id in ticket_ids.iterator():
+        try:
+            process_ticket_image(ticket_id)
+        except (OSError, ValueError) as error:
+            failed.append((ticket_id, error))
+    return failed
+
+
+def finish(rebuild_feeds=True, process_images=True):
+    """
+    Rebuilds what the signals maintain and bulk_create() skipped:
+    the counters, the rating statistics, unless rebuild_feeds is
+    False every home feed timeline and, unless process_images is
+    False, the derivatives of the imported images. Clears the
+    in-process caches holding users and follows.
+
+    Returns:
+        list: (ticket id, error) of the images that could not be
+        processed.
+    """
+    for counter in COUNTERS:
+        reconcile(counter)
+    rating_stats.rebuild()
+    graph.graph.clear()
+    autocomplete.cache.clear()
+    if rebuild_feeds:
+        for user_id in User.objects.values_list("pk", flat=True).iterator():
+            rebuild_timeline(user_id)
+    return process_pending_images() if process_images else []
@@ -0,0 +1,70 @@
+"""
+Denormalized counters stored on tickets, reviews and users.
+
+Each counter is the number of child rows pointing at a parent row.
+It is updated with an F() expression whenever a child row is created
+or deleted (see main_feed.signals and authentication.signals), and
+can be recomputed from the child table when it has drifted, for
+instance after a bulk import.
+"""
+from collections import namedtuple
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from authentication.models import User, UserFollows
+from .models import Comment, Review, Ticket
+
+
+Counter = namedtuple("Counter", ["model", "field", "child_model", "fk"])
+
+COUNTERS = [
+    Counter(Ticket, "review_count", Review, "ticket"),
+    Counter(Review, "comment_count", Comment, "review"),
+    Counter(User, "follower_count", UserFollows, "followed_user"),
+    Counter(User, "following_count", UserFollows, "user"),
+]
+
+
+def increment(model, pk, field, delta=1):
+    """
+    Atomically adds delta to a counter of one row. The counter never
+    goes below zero.
+    """
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f"{field}__gte": -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def actual_count(counter):
+    """
+    Returns an expression computing the real value of a counter from
+    its child table.
+    """
+    counts = counter.child_model.objects.filter(
+        **{counter.fk: OuterRef("pk")}
+    ).order_by().values(counter.fk).annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(counts), 0)
+
+
+def reconcile(counter, dry_run=False):
+    """
+    Repairs the rows whose counter differs from the real count.
+
+    Args:
+        counter (Counter): The counter to check.
+        dry_run (bool): Only count the drifted rows.
+
+    Returns:
+        int: The number of drifted rows.
+    """
+    drifted = counter.model.objects.alias(
+        actual=actual_count(counter)
+    ).exclude(**{counter.field: F("actual")})
+    pks = list(drifted.values_list("pk", flat=True))
+    if pks and not dry_run:
+        counter.model.objects.filter(pk__in=pks).update(
+            **{counter.field: actual_count(counter)}
+        )
+    return len(pks)
@@ -0,0 +1,215 @@
+"""
+Deterministic synthetic datasets, in the JSONL format of
+main_feed.bulk_load.
+
+The same size and seed always give the same lines. Degrees follow
+power laws, as in real social data:
+
+- the number of accounts each user follows is drawn from a Pareto
+  distribution, so most users follow a few accounts and some follow
+  many;
+- the accounts followed, the authors of posts and the tickets and
+  reviews people respond to are drawn with Zipf weights over a
+  shuffled ranking, so a few users, tickets and reviews get most of
+  the followers, posts, reviews and comments.
+
+Tickets are spread over DATASET_SPAN from DATASET_START, reviews and
+comments shortly follow what they respond to. Tickets have no image.
+
+Only the ranking weights and the creation times are kept in memory,
+so lines can be streamed to a file or straight to a Loader.
+"""
+import datetime
+import random
+from array import array
+from dataclasses import dataclass
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+
+
+DATASET_START = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+DATASET_SPAN = datetime.timedelta(days=365)
+
+# Shape of the Pareto distribution of the number of followees.
+FOLLOW_PARETO_ALPHA = 2.0
+# Exponents of the Zipf weights: popularity of accounts, activity of
+# authors, popularity of tickets and reviews.
+POPULARITY_EXPONENT = 1.0
+ACTIVITY_EXPONENT = 0.8
+POST_EXPONENT = 0.9
+
+# Mean delay before a review of a ticket and a comment on a review.
+REVIEW_DELAY = datetime.timedelta(days=3)
+COMMENT_DELAY = datetime.timedelta(days=1)
+
+WORDS = (
+    "amour guerre mer nuit jour roi reine ville voyage silence ombre "
+    "lumière jardin maison enfance mémoire hiver été forêt rivière "
+    "secret étoile monde temps vie mort rêve feu pluie vent montagne "
+    "désert île lettre chemin retour promesse colère espoir destin"
+).split()
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    """
+    Number of objects of each type in a dataset.
+
+    Attributes:
+        users (int): Number of users.
+        follows (int): Target number of follows, the mean out-degree
+        times the number of users.
+        tickets (int): Number of tickets.
+        reviews (int): Number of reviews.
+        comments (int): Number of comments.
+    """
+    users: int
+    follows: int
+    tickets: int
+    reviews: int
+    comments: int
+
+    @classmethod
+    def scaled(cls, rows):
+        """
+        Splits a total number of rows between the types: 5% users,
+        40% follows, 20% tickets, 20% reviews and 15% comments.
+        """
+        return cls(
+            users=rows // 20,
+            follows=rows * 2 // 5,
+            tickets=rows // 5,
+            reviews=rows // 5,
+            comments=rows * 3 // 20,
+        )
+
+    @property
+    def rows(self):
+        return (self.users + self.follows + self.tickets + self.reviews
+                + self.comments)
+
+
+SIZES = {
+    "10k": DatasetSize.scaled(10_000),
+    "100k": DatasetSize.scaled(100_000),
+    "1M": DatasetSize.scaled(1_000_000),
+}
+
+
+class ZipfSampler:
+    """
+    Draws integers in range(count) with Zipf weights over a random
+    ranking: the item of rank k has weight 1 / (k + 1) ** exponent.
+    """
+    def __init__(self, rng, count, exponent):
+        self.rng = rng
+        self.ranked = list(range(count))
+        rng.shuffle(self.ranked)
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** exponent for rank in range(count)
+        ))
+
+    def draw(self, k=1):
+        return [self.ranked[rank] for rank in self.rng.choices(
+            range(len(self.ranked)), cum_weights=self.cum_weights, k=k
+        )]
+
+    def one(self):
+        return self.draw()[0]
+
+
+def generate(size, seed=0, password=None):
+    """
+    Yields the lines of a dataset, as dicts, in an order load_jsonl
+    accepts: users, follows, tickets, reviews and comments.
+
+    Args:
+        size (DatasetSize): Number of objects of each type.
+        seed (int): Seed of the random generator.
+        password (str, optional): Password of every user. By default
+        the users cannot log in.
+
+    Yields:
+        dict: One object, with the keys of the JSONL format.
+    """
+    rng = random.Random(seed)
+    usernames = [f"lecteur{n}" for n in range(size.users)]
+    hashed = make_password(password) if password else None
+    for username in usernames:
+        line = {"type": "user", "username": username}
+        if hashed:
+            line["password"] = hashed
+        yield line
+    if not size.users:
+        return
+
+    popularity = ZipfSampler(rng, size.users, POPULARITY_EXPONENT)
+    mean_followees = size.follows / size.users
+    alpha = FOLLOW_PARETO_ALPHA
+    for user in range(size.users):
+        degree = round(
+            mean_followees * (alpha - 1) / alpha * rng.paretovariate(alpha)
+        )
+        # Capped, as the last accounts of the ranking are rarely drawn.
+        degree = min(degree, size.users // 2)
+        followed = set()
+        while len(followed) < degree:
+            followed.update(popularity.draw(degree - len(followed)))
+            followed.discard(user)
+        for other in sorted(followed):
+            yield {"type": "follow", "user": usernames[user],
+                   "followed": usernames[other]}
+
+    activity = ZipfSampler(rng, size.users, ACTIVITY_EXPONENT)
+    span = DATASET_SPAN.total_seconds()
+    ticket_times = array("d")
+    for n in range(size.tickets):
+        ticket_times.append((n + rng.random()) * span / size.tickets)
+        yield {
+            "type": "ticket", "ref": n,
+            "user": usernames[activity.one()],
+            "title": words(rng, 2, 4).capitalize(),
+            "description": words(rng, 10, 40),
+            "time_created": timestamp(ticket_times[n]),
+        }
+
+    review_times = array("d")
+    if size.tickets:
+        tickets = ZipfSampler(rng, size.tickets, POST_EXPONENT)
+        delay = REVIEW_DELAY.total_seconds()
+        for n in range(size.reviews):
+            ticket = tickets.one()
+            review_times.append(
+                ticket_times[ticket] + rng.expovariate(1 / delay)
+            )
+            yield {
+                "type": "review", "ref": n, "ticket": ticket,
+                "user": usernames[activity.one()],
+                "rating": rng.choices(range(6), (1, 1, 2, 4, 6, 4))[0],
+                "headline": words(rng, 2, 6).capitalize(),
+                "body": words(rng, 20, 120),
+                "time_created": timestamp(review_times[n]),
+            }
+
+    if review_times:
+        reviews = ZipfSampler(rng, len(review_times), POST_EXPONENT)
+        delay = COMMENT_DELAY.total_seconds()
+        for n in range(size.comments):
+            review = reviews.one()
+            yield {
+                "type": "comment", "review": review,
+                "author": usernames[activity.one()],
+                "content": words(rng, 3, 30),
+                "time_created": timestamp(
+                    review_times[review] + rng.expovariate(1 / delay)
+                ),
+            }
+
+
+def words(rng, low, high):
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+
+def timestamp(seconds):
+    return (DATASET_START + datetime.timedelta(seconds=seconds)).isoformat()
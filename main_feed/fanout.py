@@ -0,0 +1,223 @@
+"""
+Write side of the home feed: delivery of tickets and reviews to the
+FeedEntry timelines of their readers.
+
+A new post is added to the timeline of its author in the transaction
+creating it, so that it is on their home feed when they are sent
+back there, and pushed to the timelines of the followers of the
+author in the background. Following someone backfills their posts
+into the follower's timeline and unfollowing prunes them, in the
+transaction deleting the follow.
+
+The writes read the follows from the database, never from the
+follow graph cache (authentication.graph), locking them, in the
+transaction writing the entries: an unfollow committed
+while they run either waits for them, its prune then removing what
+they wrote, or is seen by them, so no post of an unfollowed author is
+left behind. A backfill whose follow is already gone copies nothing.
+
+Accounts with more than FEED_FANOUT_MAX_FOLLOWERS followers are not
+pushed: one of their reviews would turn into as many inserts as they
+have followers. Their posts only reach their own timeline and are
+pulled into their followers' feeds at read time (see main_feed.feed).
+When such an account falls back to the threshold, all its posts are
+pushed to its followers, who stop pulling them.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from authentication.models import User, UserFollows
+from .feed import REVIEW, TICKET, post_keys
+from .models import FeedEntry, Review, Ticket
+
+
+FANOUT_BATCH_SIZE = 1000
+
+POST_MODELS = {
+    TICKET: Ticket,
+    REVIEW: Review,
+}
+
+
+def _bulk_insert(entries):
+    """
+    Inserts FeedEntry instances from an iterable in batches of
+    FANOUT_BATCH_SIZE, ignoring the ones already delivered.
+
+    Returns:
+        int: The number of entries submitted.
+    """
+    count = 0
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        count += len(batch)
+    return count
+
+
+def is_popular(author_id):
+    """
+    Returns True when the posts of a user are pulled at read time
+    rather than pushed to their followers.
+    """
+    return User.objects.filter(
+        pk=author_id,
+        follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def deliver_to_author(content_type, post):
+    """
+    Adds a new post to the timeline of its author.
+
+    Args:
+        content_type (str): TICKET or REVIEW.
+        post (Ticket or Review): The saved post.
+    """
+    FeedEntry.objects.bulk_create([
+        FeedEntry(
+            owner_id=post.user_id,
+            author_id=post.user_id,
+            content_type=content_type,
+            post_id=post.pk,
+            time_created=post.time_created,
+        )
+    ], ignore_conflicts=True)
+
+
+def fan_out_post(content_type, post_id):
+    """
+    Delivers a post to the timelines of the followers of its author,
+    unless the author is popular.
+
+    Args:
+        content_type (str): TICKET or REVIEW.
+        post_id (int): Primary key of the post.
+
+    Returns:
+        int: The number of timeline entries written.
+    """
+    with transaction.atomic():
+        post = POST_MODELS[content_type].objects.filter(
+            pk=post_id
+        ).values("user_id", "time_created").first()
+        if post is None:
+            return 0
+        author_id = post["user_id"]
+        if is_popular(author_id):
+            return 0
+        follower_ids = list(
+            UserFollows.objects.select_for_update()
+            .filter(followed_user_id=author_id)
+            .values_list("user_id", flat=True)
+        )
+        return _bulk_insert(
+            FeedEntry(
+                owner_id=owner_id,
+                author_id=author_id,
+                content_type=content_type,
+                post_id=post_id,
+                time_created=post["time_created"],
+            )
+            for owner_id in follower_ids
+        )
+
+
+def push_after_demotion(author_id):
+    """
+    Copies all the posts of an author who is no longer popular into
+    the timelines of their followers. The posts written while the
+    author was popular were never pushed, nor copied by the backfill
+    of the follows made meanwhile.
+
+    Each follower is backfilled in its own transaction, the posts
+    being streamed, as rebuild_feeds does per user.
+
+    Returns:
+        int: The number of timeline entries written.
+    """
+    if is_popular(author_id):
+        return 0
+    follower_ids = list(
+        UserFollows.objects.filter(followed_user_id=author_id)
+        .values_list("user_id", flat=True)
+    )
+    return sum(backfill(owner_id, author_id) for owner_id in follower_ids)
+
+
+def remove_post(content_type, post_id):
+    """
+    Removes a deleted post from every timeline.
+    """
+    FeedEntry.objects.filter(
+        content_type=content_type, post_id=post_id
+    ).delete()
+
+
+def _copy_posts(owner_id, author_id):
+    if author_id != owner_id and is_popular(author_id):
+        return 0
+    return _bulk_insert(
+        FeedEntry(
+            owner_id=owner_id,
+            author_id=author_id,
+            content_type=key["content_type"],
+            post_id=key["post_id"],
+            time_created=key["time_created"],
+        )
+        for key in post_keys([author_id]).iterator()
+    )
+
+
+def backfill(owner_id, author_id):
+    """
+    Copies all the posts of an author into the timeline of a user,
+    after the user started following them. Nothing is copied for a
+    popular author, whose posts are pulled at read time, nor when the
+    user no longer follows the author.
+
+    Returns:
+        int: The number of timeline entries written.
+    """
+    follow = UserFollows.objects.select_for_update().filter(
+        user_id=owner_id, followed_user_id=author_id
+    )
+    with transaction.atomic():
+        if author_id != owner_id and follow.first() is None:
+            return 0
+        return _copy_posts(owner_id, author_id)
+
+
+def prune(owner_id, author_id):
+    """
+    Removes the posts of an author from the timeline of a user,
+    after the user stopped following them.
+    """
+    FeedEntry.objects.filter(owner_id=owner_id, author_id=author_id).delete()
+
+
+def rebuild_timeline(owner_id):
+    """
+    Rebuilds the timeline of one user from the posts of the user
+    and of the users they follow.
+
+    Returns:
+        int: The number of timeline entries written.
+    """
+    count = 0
+    with transaction.atomic():
+        author_ids = list(
+            UserFollows.objects.select_for_update()
+            .filter(user_id=owner_id)
+            .values_list("followed_user_id", flat=True)
+        )
+        FeedEntry.objects.filter(owner_id=owner_id).delete()
+        for author_id in [owner_id, *author_ids]:
+            count += _copy_posts(owner_id, author_id)
+    return count
@@ -0,0 +1,390 @@
+"""
+Read side of the feeds shown by the home page and the personal
+posts page.
+
+Tickets and reviews live in two tables. Instead of loading both in
+Python and sorting them, the database merges them with a single
+UNION ALL ordered by ``(time_created, content_type, id)`` and only
+returns one page of keys. The matching objects are then fetched in
+bulk, one query per model.
+
+The home feed reads the same keys from the FeedEntry timeline of
+the reader, which main_feed.fanout fills when posts are written.
+Posts of popular accounts are not copied into the timelines: they
+are pulled from the post tables and merged in when the feed is read.
+
+Pages are addressed with a keyset cursor: the key of the last post
+of the previous page. Reading page N therefore costs the same as
+reading page 1, whatever the size of the tables.
+"""
+import heapq
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import CharField, F, Q, Value
+
+from authentication.graph import followee_ids
+from authentication.models import User
+from .models import FeedEntry, Ticket, Review
+
+
+FEED_PAGE_SIZE = 20
+
+TICKET = "TICKET"
+REVIEW = "REVIEW"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+@dataclass(frozen=True)
+class FeedCursor:
+    """
+    Position of a post in the feed ordering.
+
+    Attributes:
+        time_created (datetime): Creation time of the post.
+        content_type (str): Either TICKET or REVIEW.
+        post_id (int): Primary key of the post.
+    """
+    time_created: datetime
+    content_type: str
+    post_id: int
+
+    def encode(self):
+        """
+        Returns the cursor as a URL-safe string such as
+        "1716400000123456_REVIEW_42".
+        """
+        micros = (self.time_created - _EPOCH) // _MICROSECOND
+        return f"{micros}_{self.content_type}_{self.post_id}"
+
+    @classmethod
+    def decode(cls, value):
+        """
+        Parses a string produced by encode().
+
+        Returns:
+            FeedCursor or None: None when the value is missing
+            or malformed, which means "start from the newest post".
+        """
+        if not value:
+            return None
+        try:
+            micros, content_type, post_id = value.split("_")
+            time_created = _EPOCH + timedelta(microseconds=int(micros))
+            post_id = int(post_id)
+        except (ValueError, OverflowError):
+            return None
+        if content_type not in (TICKET, REVIEW):
+            return None
+        return cls(time_created, content_type, post_id)
+
+
+@dataclass
+class FeedPage:
+    """
+    One page of the feed.
+
+    Attributes:
+        posts (list): Ticket and Review instances, newest first,
+        each carrying a 'content_type' attribute.
+        next_cursor (FeedCursor): Cursor of the next (older) page,
+        or None on the last page.
+    """
+    posts: list = field(default_factory=list)
+    next_cursor: FeedCursor = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _older_than(cursor, content_type):
+    """
+    Returns the Q object selecting, within one side of the union,
+    the rows that come after the cursor in the descending ordering.
+
+    The content type is constant on each side, so the tie-breaking
+    comparison on it is resolved here rather than in SQL.
+    """
+    if cursor is None:
+        return Q()
+    older = Q(time_created__lt=cursor.time_created)
+    if content_type < cursor.content_type:
+        older |= Q(time_created=cursor.time_created)
+    elif content_type == cursor.content_type:
+        older |= Q(time_created=cursor.time_created, id__lt=cursor.post_id)
+    return older
+
+
+def feed_tickets():
+    """
+    Returns the Ticket queryset used to display tickets, with their
+    author loaded in the same query.
+    """
+    return Ticket.objects.select_related("user")
+
+
+def feed_reviews():
+    """
+    Returns the Review queryset used to display reviews, with their
+    author, ticket and ticket author loaded in the same query.
+    """
+    return Review.objects.select_related("user", "ticket__user")
+
+
+def _post_keys(model, content_type, user_ids, cursor):
+    return model.objects.filter(
+        _older_than(cursor, content_type),
+        user_id__in=user_ids,
+    ).values(
+        "time_created",
+        content_type=Value(content_type, output_field=CharField()),
+        post_id=F("id"),
+    ).order_by()
+
+
+def post_keys(user_ids, cursor=None):
+    """
+    Builds the UNION ALL of the ticket and review keys written by
+    the given users, ordered from newest to oldest.
+
+    Args:
+        user_ids (iterable): Ids of the authors to include.
+        cursor (FeedCursor, optional): Only keys older than this
+        cursor are returned.
+
+    Returns:
+        QuerySet: Dictionaries with 'time_created', 'content_type'
+        and 'post_id' keys.
+    """
+    user_ids = list(user_ids)
+    tickets = _post_keys(Ticket, TICKET, user_ids, cursor)
+    reviews = _post_keys(Review, REVIEW, user_ids, cursor)
+    return tickets.union(reviews, all=True).order_by(
+        "-time_created", "-content_type", "-post_id"
+    )
+
+
+def open_ticket_keys(exclude_user_id=None, cursor=None):
+    """
+    Returns the keys of the tickets without a review, ordered from
+    newest to oldest.
+
+    The review_count counter maintained by main_feed.signals tells
+    the open tickets apart, so the partial ticket_open_time_idx index
+    serves the query without looking at the reviews.
+
+    Args:
+        exclude_user_id (int, optional): Id of a user whose tickets
+        are left out, usually the reader's.
+        cursor (FeedCursor, optional): Only keys older than this
+        cursor are returned.
+
+    Returns:
+        QuerySet: Dictionaries with 'time_created', 'content_type'
+        and 'post_id' keys.
+    """
+    tickets = Ticket.objects.filter(
+        _older_than(cursor, TICKET), review_count=0
+    )
+    if exclude_user_id is not None:
+        tickets = tickets.exclude(user_id=exclude_user_id)
+    return tickets.values(
+        "time_created",
+        content_type=Value(TICKET, output_field=CharField()),
+        post_id=F("id"),
+    ).order_by("-time_created", "-id")
+
+
+def inbox_keys(owner_id, cursor=None):
+    """
+    Returns the keys stored in the FeedEntry timeline of a user,
+    ordered from newest to oldest.
+
+    Args:
+        owner_id (int): Id of the user reading their home feed.
+        cursor (FeedCursor, optional): Only keys older than this
+        cursor are returned.
+
+    Returns:
+        QuerySet: Dictionaries with 'time_created', 'content_type'
+        and 'post_id' keys.
+    """
+    entries = FeedEntry.objects.filter(owner_id=owner_id)
+    if cursor is not None:
+        entries = entries.filter(
+            Q(time_created__lt=cursor.time_created)
+            | Q(time_created=cursor.time_created,
+                content_type__lt=cursor.content_type)
+            | Q(time_created=cursor.time_created,
+                content_type=cursor.content_type,
+                post_id__lt=cursor.post_id)
+        )
+    return entries.values(
+        "time_created", "content_type", "post_id"
+    ).order_by("-time_created", "-content_type", "-post_id")
+
+
+def popular_followee_ids(owner_id):
+    """
+    Returns the ids of the users followed by owner_id whose posts
+    are not fanned out, because they have more than
+    FEED_FANOUT_MAX_FOLLOWERS followers.
+    """
+    followees = followee_ids(owner_id)
+    if not followees:
+        return []
+    return list(
+        User.objects.filter(
+            pk__in=followees,
+            follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("pk", flat=True)
+    )
+
+
+def _sort_key(key):
+    return key["time_created"], key["content_type"], key["post_id"]
+
+
+def merge_keys(streams, limit):
+    """
+    Merges ordered streams of keys into one, newest first, dropping
+    duplicates.
+
+    Each stream must already be ordered from newest to oldest and
+    hold at most 'limit' keys, so the merge reads a bounded number
+    of rows whatever the number of posts of each author.
+
+    Args:
+        streams (list): Ordered iterables of keys.
+        limit (int): Maximum number of keys to return.
+
+    Returns:
+        list: The merged keys.
+    """
+    merged = []
+    seen = set()
+    for key in heapq.merge(*streams, key=_sort_key, reverse=True):
+        identity = (key["content_type"], key["post_id"])
+        if identity in seen:
+            continue
+        seen.add(identity)
+        merged.append(key)
+        if len(merged) == limit:
+            break
+    return merged
+
+
+def hydrate(keys):
+    """
+    Fetches the posts matching a list of keys with one query per
+    model and returns them in the order of the keys.
+
+    The authors and the tickets of the reviews come with the posts,
+    so rendering a page costs a fixed number of queries whatever its
+    size.
+    """
+    ids = {TICKET: [], REVIEW: []}
+    for key in keys:
+        ids[key["content_type"]].append(key["post_id"])
+
+    objects = {
+        TICKET: feed_tickets().in_bulk(ids[TICKET]) if ids[TICKET] else {},
+        REVIEW: feed_reviews().in_bulk(ids[REVIEW]) if ids[REVIEW] else {},
+    }
+    posts = []
+    for key in keys:
+        post = objects[key["content_type"]].get(key["post_id"])
+        if post is None:
+            # Deleted between the two queries.
+            continue
+        post.content_type = key["content_type"]
+        posts.append(post)
+    return posts
+
+
+def paginate(keys, page_size=FEED_PAGE_SIZE):
+    """
+    Reads one page from ordered post keys.
+
+    Args:
+        keys (QuerySet or list): Ordered keys, already restricted
+        to the rows older than the cursor.
+        page_size (int): Number of posts per page.
+
+    Returns:
+        FeedPage: The hydrated posts and the cursor of the next page.
+    """
+    rows = list(keys[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = FeedCursor(
+            last["time_created"], last["content_type"], last["post_id"]
+        )
+    return FeedPage(posts=hydrate(rows), next_cursor=next_cursor)
+
+
+def get_feed_page(user_ids, cursor=None, page_size=FEED_PAGE_SIZE):
+    """
+    Returns one page of the posts written by the given users.
+
+    Args:
+        user_ids (iterable): Ids of the authors to include.
+        cursor (FeedCursor, optional): Cursor returned with the
+        previous page, None for the first page.
+        page_size (int): Number of posts per page.
+
+    Returns:
+        FeedPage: The page of posts.
+    """
+    return paginate(post_keys(user_ids, cursor), page_size)
+
+
+def get_timeline_page(owner_id, cursor=None, page_size=FEED_PAGE_SIZE):
+    """
+    Returns one page of the home feed of a user, read from their
+    FeedEntry timeline and merged with the posts of the popular
+    accounts they follow.
+
+    Args:
+        owner_id (int): Id of the user reading their home feed.
+        cursor (FeedCursor, optional): Cursor returned with the
+        previous page, None for the first page.
+        page_size (int): Number of posts per page.
+
+    Returns:
+        FeedPage: The page of posts.
+    """
+    keys = inbox_keys(owner_id, cursor)
+    popular_ids = popular_followee_ids(owner_id)
+    if popular_ids:
+        # One stream per popular author, each bounded to one page.
+        streams = [keys[:page_size + 1]] + [
+            post_keys([author_id], cursor)[:page_size + 1]
+            for author_id in popular_ids
+        ]
+        keys = merge_keys(streams, page_size + 1)
+    return paginate(keys, page_size)
+
+
+def get_open_tickets_page(reader_id, cursor=None,
+                          page_size=FEED_PAGE_SIZE):
+    """
+    Returns one page of the tickets still waiting for a review,
+    other than the reader's own.
+
+    Args:
+        reader_id (int): Id of the user reading the page.
+        cursor (FeedCursor, optional): Cursor returned with the
+        previous page, None for the first page.
+        page_size (int): Number of tickets per page.
+
+    Returns:
+        FeedPage: The page of tickets.
+    """
+    return paginate(open_ticket_keys(reader_id, cursor), page_size)
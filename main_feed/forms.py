@@ -1,4 +1,5 @@
 from django import forms
+from authentication.forms import UsernameInput
 from .models import Ticket, Review, Comment
 from django.utils.translation import gettext_lazy as _
 
@@ -113,11 +114,12 @@ class UserFollowForm(forms.Form):
             - Label: "Rechercher un utilisateur"
             - Max length: 150 characters
             - Placeholder: "Entrez un nom d'utilisateur"
+            - Widget: UsernameInput, completing the typed name.
     """
     username = forms.CharField(
         label="Rechercher un utilisateur",
         max_length=150,
-        widget=forms.TextInput(attrs={
+        widget=UsernameInput(attrs={
             "placeholder": "Entrez un nom d'utilisateur"
         })
     )
@@ -143,3 +145,25 @@ class CommentForm(forms.ModelForm):
         fields = ["content"]
         labels = {"content": _("Votre commentaire")}
         widgets = {"content": forms.Textarea(attrs={"rows": 3})}
+
+
+class SearchForm(forms.Form):
+    """
+    A Django form for the full-text search of posts.
+
+    Fields:
+        q (CharField): The words to search for in the titles and
+        texts of the tickets, reviews and comments.
+            - Label: "Rechercher"
+            - Max length: 200 characters
+        after (CharField): Hidden cursor of the page to display, as
+        returned with the previous page.
+    """
+    q = forms.CharField(
+        label="Rechercher",
+        max_length=200,
+        widget=forms.SearchInput(attrs={
+            "placeholder": "Titre, auteur du livre, mots d'une critique…"
+        })
+    )
+    after = forms.CharField(required=False, widget=forms.HiddenInput)
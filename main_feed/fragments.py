@@ -0,0 +1,141 @@
+"""
+Cache of the rendered HTML of ticket and review cards.
+
+The same cards are rendered in the home feed of every follower, on
+the posts page and on the review detail page. Their viewer-independent
+part is rendered once and cached under a key made of the post id and
+of its version, the time_edited timestamp stored on the row. Saving a
+ticket or a review, processing its image or writing a comment on it
+moves that timestamp, which makes the old entry unreachable. As the
+version is read with the row, a card can never be cached under a
+newer version than the data it was rendered from. The key also holds
+the username of the author shown on the card, so renaming a user
+does not leave their old name in the cached cards.
+
+Only the per-viewer bits (edit links, the "Créer une critique"
+button) are rendered on each request and spliced into the cached
+HTML, as is the ticket card inside a review card.
+
+Hits and misses are counted per kind of card; see stats.
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+TICKET = "ticket"
+REVIEW = "review"
+
+ACTIONS_SLOT = mark_safe("<!--fragment:actions-->")
+TICKET_SLOT = mark_safe("<!--fragment:ticket-->")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class FragmentStats:
+    """
+    Thread-safe hit and miss counters of the fragment cache of the
+    current process.
+
+    Methods:
+        record(kind, hit): Counts one lookup.
+        snapshot(): Returns the counters as a dictionary such as
+        {"ticket": {"hits": 10, "misses": 2}, ...}.
+        reset(): Sets every counter back to zero.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, kind, hit):
+        with self._lock:
+            self._counts[kind, "hits" if hit else "misses"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            kind: {
+                "hits": counts.get((kind, "hits"), 0),
+                "misses": counts.get((kind, "misses"), 0),
+            }
+            for kind in (TICKET, REVIEW)
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = FragmentStats()
+
+
+def _cached_card(kind, post, template_name, context):
+    version = (post.time_edited - _EPOCH) // _MICROSECOND
+    key = f"fragment:{kind}:{post.pk}:{version}:{post.user.username}"
+    html = cache.get(key)
+    stats.record(kind, html is not None)
+    if html is None:
+        html = render_to_string(template_name, context)
+        cache.set(key, html, settings.FRAGMENT_CACHE_TIMEOUT)
+    return html
+
+
+def render_ticket(ticket, update=False, review_creation_context=False):
+    """
+    Returns the HTML of a ticket card.
+
+    Args:
+        ticket (Ticket): The ticket, with its user loaded.
+        update (bool): Show the "Modifier" link.
+        review_creation_context (bool): Hide the "Créer une critique"
+        button, the ticket being shown on the review creation page.
+    """
+    card = _cached_card(
+        TICKET, ticket, "main_feed/partials/ticket_card.html",
+        {"ticket": ticket, "actions": ACTIONS_SLOT}
+    )
+    actions = render_to_string(
+        "main_feed/partials/ticket_actions.html",
+        {
+            "ticket": ticket,
+            "update": update,
+            "review_creation_context": review_creation_context,
+        }
+    )
+    return mark_safe(card.replace(ACTIONS_SLOT, actions, 1))
+
+
+def render_review(review, update=False):
+    """
+    Returns the HTML of a review card, including the card of its
+    ticket.
+
+    Args:
+        review (Review): The review, with its user, ticket and
+        ticket user loaded.
+        update (bool): Show the "Modifier" links.
+    """
+    card = _cached_card(
+        REVIEW, review, "main_feed/partials/review_card.html",
+        {
+            "review": review,
+            "ticket_card": TICKET_SLOT,
+            "actions": ACTIONS_SLOT,
+        }
+    )
+    actions = render_to_string(
+        "main_feed/partials/review_actions.html",
+        {"review": review, "update": update}
+    )
+    ticket_card = render_ticket(review.ticket, update=update)
+    return mark_safe(
+        card.replace(TICKET_SLOT, ticket_card, 1)
+            .replace(ACTIONS_SLOT, actions, 1)
+    )
@@ -0,0 +1,334 @@
+"""
+Processing of the images attached to tickets.
+
+Uploads are stored as received; processing runs afterwards in the
+background task pool (see main_feed.tasks), so the latency of the
+views creating tickets does not depend on the size of the image.
+
+Processing builds a set of derivatives of the original image: each
+rendition of RENDITIONS at 1x and 2x density, in WebP and JPEG. They
+are stored under a directory named after the SHA-256 of the original,
+and described in Ticket.image_derivatives so that the ticket card can
+offer them through srcset and let the browser download only the one
+it needs.
+
+Images are decoded with bounded memory: their size is checked from
+the header before any pixel is decoded (see TICKET_IMAGE_MAX_PIXELS),
+and JPEG files are decoded directly at a reduced scale, close to the
+largest derivative, instead of at full resolution. Derivatives are
+encoded without the metadata of the original (EXIF, GPS position,
+ICC profile); its orientation is applied to the pixels instead.
+
+Stored originals are reference counted (StoredImage): retain_image()
+and release_image() are called when a ticket gets or loses an image,
+and the file and its derivatives are deleted with the last reference,
+unless the file was uploaded again meanwhile.
+"""
+import hashlib
+import io
+import os
+import time
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+
+from LITRevue.metrics import IMAGE, span
+
+from .models import StoredImage, Ticket
+from .storage import ticket_image_storage
+
+
+# Bounding boxes, in CSS pixels.
+RENDITIONS = {
+    "small": (105, 149),
+    "medium": Ticket.IMAGE_MAX_SIZE,
+    "large": (420, 594),
+}
+DENSITIES = (1, 2)
+FORMATS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "jpeg": {
+        "format": "JPEG", "quality": 82,
+        "optimize": True, "progressive": True,
+    },
+}
+
+DERIVATIVES_DIR = "derivatives"
+
+# Largest derivative, in pixels.
+LARGEST_SIZE = max(
+    (box[0] * density, box[1] * density)
+    for box in RENDITIONS.values()
+    for density in DENSITIES
+)
+# The decoder may scale down until the image is this many times the
+# largest derivative; the rest is resampled with LANCZOS, which looks
+# better than the scaling of the JPEG decoder.
+DECODE_REDUCING_GAP = 2.0
+
+# Released images modified more recently than this, in seconds, are
+# not deleted with their last reference (see delete_image_files()),
+# but left to collect_media_garbage, whose default --min-age it is.
+RELEASED_IMAGE_MIN_AGE = 3600
+
+# EXIF orientations swapping the width and the height.
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def file_digest(field_file, chunk_size=64 * 1024):
+    """
+    Returns the SHA-256 hex digest of a stored file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with field_file.open("rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derivative_dir(digest):
+    """
+    Returns the storage directory of the derivatives of an original
+    image, e.g. "derivatives/ab/abcdef...".
+    """
+    return f"{DERIVATIVES_DIR}/{digest[:2]}/{digest}"
+
+
+def _flatten(image):
+    """
+    Returns an RGB copy of an image, transparent areas becoming white.
+    """
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def open_image(file):
+    """
+    Opens an image without decoding it, rejecting the ones with more
+    than TICKET_IMAGE_MAX_PIXELS pixels.
+
+    Raises:
+        ValueError: The image is too large.
+        OSError: The file is not an image Pillow can read.
+    """
+    image = Image.open(file)
+    width, height = image.size
+    if width * height > settings.TICKET_IMAGE_MAX_PIXELS:
+        raise ValueError(
+            f"Image de {width}x{height} pixels, la limite est de "
+            f"{settings.TICKET_IMAGE_MAX_PIXELS} pixels."
+        )
+    return image
+
+
+def prepare_image(source):
+    """
+    Decodes an opened image at the resolution needed by the largest
+    derivative and returns it upright, in RGB, without metadata.
+
+    The JPEG decoder scales the image down by 1/2, 1/4 or 1/8 while
+    decoding (Image.draft()), so a large photo never exists in memory
+    at full resolution. Other formats are reduced by an integer factor
+    right after being decoded, before being resampled.
+    """
+    box = LARGEST_SIZE
+    orientation = source.getexif().get(ExifTags.Base.Orientation)
+    if orientation in _TRANSPOSED_ORIENTATIONS:
+        box = box[::-1]
+    # Image.thumbnail() asks the decoder for the whole box, which does
+    # not allow any reduction when the image and the box do not have
+    # the same orientation: ask for the size the image will fit in.
+    scale = min(box[0] / source.width, box[1] / source.height)
+    if scale < 1:
+        source.draft(None, (
+            int(source.width * scale * DECODE_REDUCING_GAP),
+            int(source.height * scale * DECODE_REDUCING_GAP),
+        ))
+    source.thumbnail(box, Image.LANCZOS, reducing_gap=DECODE_REDUCING_GAP)
+    image = _flatten(ImageOps.exif_transpose(source))
+    image.info = {}
+    return image
+
+
+def build_derivatives(source, digest, overwrite=False):
+    """
+    Writes the derivatives of an image to the default storage.
+
+    Renditions are produced from the largest to the smallest, each one
+    being shrunk from the previous instead of from the original. Two
+    renditions that end up with the same width (the original being
+    smaller than their boxes) are only stored once.
+
+    Args:
+        source (PIL.Image.Image): The original image, as returned by
+        open_image(). It is decoded by prepare_image().
+        digest (str): SHA-256 of the original file.
+        overwrite (bool): Replace the files already stored.
+
+    Returns:
+        list: The metadata of the stored files.
+    """
+    targets = sorted(
+        (
+            (box[0] * density, box[1] * density, name, density)
+            for name, box in RENDITIONS.items()
+            for density in DENSITIES
+        ),
+        reverse=True,
+    )
+    image = prepare_image(source)
+    directory = derivative_dir(digest)
+    derivatives = []
+    widths = set()
+    for width, height, rendition, density in targets:
+        image.thumbnail((width, height), Image.LANCZOS)
+        if image.width in widths:
+            continue
+        widths.add(image.width)
+        for extension, options in FORMATS.items():
+            name = f"{directory}/{rendition}-{density}x.{extension}"
+            if overwrite:
+                default_storage.delete(name)
+            if not default_storage.exists(name):
+                buffer = io.BytesIO()
+                image.save(buffer, **options)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            derivatives.append({
+                "rendition": rendition,
+                "density": density,
+                "format": extension,
+                "width": image.width,
+                "height": image.height,
+                "name": name,
+            })
+    return derivatives
+
+
+def derivatives_exist(derivatives):
+    return bool(derivatives) and all(
+        default_storage.exists(derivative["name"])
+        for derivative in derivatives
+    )
+
+
+def process_ticket_image(ticket_id, force=False):
+    """
+    Builds the derivatives of the image of a ticket and marks it as
+    ready.
+
+    Images whose content matches the stored hash and whose derivatives
+    are all present are left untouched, unless force is True. As
+    Ticket.save() clears the hash of a new upload, that only spares
+    the tickets processed again; a new upload of a stored image
+    reuses the derivatives of a ticket already showing it instead.
+
+    Args:
+        ticket_id (int): Primary key of the ticket.
+        force (bool): Rebuild the derivatives even if they exist.
+    """
+    ticket = Ticket.objects.filter(pk=ticket_id).first()
+    if ticket is None or not ticket.image:
+        return
+
+    digest = file_digest(ticket.image)
+    derivatives = ticket.image_derivatives
+    if digest != ticket.image_hash:
+        derivatives = Ticket.objects.filter(
+            image_hash=digest, image_ready=True
+        ).values_list("image_derivatives", flat=True).first() or []
+    if force or not derivatives_exist(derivatives):
+        with span(IMAGE), ticket.image.open("rb") as file, \
+                open_image(file) as source:
+            derivatives = build_derivatives(source, digest, overwrite=force)
+
+    # Only mark the image ready if it has not been replaced meanwhile.
+    # Moving time_edited invalidates the cached card of the ticket.
+    Ticket.objects.filter(pk=ticket_id, image=ticket.image.name).update(
+        image_hash=digest,
+        image_derivatives=derivatives,
+        image_ready=True,
+        time_edited=timezone.now(),
+    )
+
+
+def retain_image(name):
+    """
+    Counts one more ticket using the stored image 'name'.
+    """
+    # Incremented in place, so that it cannot be lost to the deletion
+    # of the row by delete_image_files().
+    counted = StoredImage.objects.filter(name=name).update(
+        ref_count=F("ref_count") + 1
+    )
+    if not counted:
+        stored, created = StoredImage.objects.get_or_create(
+            name=name, defaults={"ref_count": 1}
+        )
+        if not created:
+            StoredImage.objects.filter(pk=stored.pk).update(
+                ref_count=F("ref_count") + 1
+            )
+
+
+def release_image(name, digest=""):
+    """
+    Counts one ticket less using the stored image 'name'. When no
+    ticket uses it anymore, the file and its derivatives are deleted
+    once the transaction commits.
+
+    Args:
+        name (str): Storage name of the image.
+        digest (str): SHA-256 of the image, locating its derivatives.
+    """
+    StoredImage.objects.filter(name=name, ref_count__gt=0).update(
+        ref_count=F("ref_count") - 1
+    )
+    if StoredImage.objects.filter(name=name, ref_count=0).exists():
+        transaction.on_commit(lambda: delete_image_files(name, digest))
+
+
+def delete_image_files(name, digest="", now=None):
+    """
+    Deletes a stored image that no ticket uses, and its derivatives,
+    unless another ticket still uses them.
+
+    The count is checked again, as the same image may have been
+    uploaded with another ticket since it was released: its row is
+    only deleted while its count is zero, in the transaction deleting
+    the files. A file touched less than RELEASED_IMAGE_MIN_AGE seconds
+    ago may belong to an upload whose ticket is not committed yet (see
+    main_feed.storage); it is left to main_feed.media_gc.
+
+    Args:
+        name (str): Storage name of the image.
+        digest (str): SHA-256 of the image, locating its derivatives.
+        now (float, optional): Current time, defaults to time.time().
+    """
+    now = time.time() if now is None else now
+    storage = ticket_image_storage()
+    with transaction.atomic():
+        deleted, _ = StoredImage.objects.filter(
+            name=name, ref_count=0
+        ).delete()
+        if not deleted:
+            return
+        try:
+            age = now - os.path.getmtime(storage.path(name))
+        except FileNotFoundError:
+            age = None
+        if age is not None and age >= RELEASED_IMAGE_MIN_AGE:
+            storage.delete(name)
+        if digest and not Ticket.objects.filter(image_hash=digest).exists():
+            directory = derivative_dir(digest)
+            if default_storage.exists(directory):
+                for file_name in default_storage.listdir(directory)[1]:
+                    default_storage.delete(f"{directory}/{file_name}")
@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from authentication.models import UserFollows
+from main_feed.benchmarks import (
+    create_users, scratch_database, summarize, timed
+)
+from main_feed.feed import get_timeline_page
+from main_feed.models import FeedEntry, Review, Ticket
+
+
+class Command(BaseCommand):
+    """
+    Measures the cost of the hybrid push/pull home feed for authors
+    with different numbers of followers.
+
+    For each follower count, an author writes reviews once with push
+    delivery (the author is below FEED_FANOUT_MAX_FOLLOWERS) and once
+    with pull delivery (above it). The command reports the write
+    amplification (timeline rows per review), the write latency and
+    the latency of reading a follower's first feed page.
+
+    The benchmark runs in a scratch database.
+
+    Usage:
+        python manage.py bench_fanout --followers 10 1000 20000
+    """
+    help = "Compare l'écriture et la lecture du fil en mode push et pull."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--followers", type=int, nargs="+", default=[10, 1000, 20000],
+            help="Nombres d'abonnés de l'auteur à mesurer.",
+        )
+        parser.add_argument(
+            "--reviews", type=int, default=20,
+            help="Nombre de critiques écrites par mesure.",
+        )
+        parser.add_argument(
+            "--reads", type=int, default=50,
+            help="Nombre de lectures du fil par mesure.",
+        )
+
+    def handle(self, *args, **options):
+        with scratch_database(), override_settings(
+                BACKGROUND_TASKS_EAGER=True):
+            self.stdout.write(
+                f"{'abonnés':>8} {'mode':>5} {'lignes/critique':>16} "
+                f"{'écriture p50':>13} {'écriture p99':>13} "
+                f"{'lecture p50':>12} {'lecture p99':>12}"
+            )
+            for followers in options["followers"]:
+                for mode in ("push", "pull"):
+                    result = self.measure(
+                        followers, mode,
+                        options["reviews"], options["reads"]
+                    )
+                    self.stdout.write(
+                        f"{followers:>8} {mode:>5} "
+                        f"{result['amplification']:>16.1f} "
+                        f"{result['write']['p50_ms']:>11.2f}ms "
+                        f"{result['write']['p99_ms']:>11.2f}ms "
+                        f"{result['read']['p50_ms']:>10.2f}ms "
+                        f"{result['read']['p99_ms']:>10.2f}ms"
+                    )
+
+    def measure(self, followers, mode, reviews, reads):
+        prefix = f"{mode}-{followers}"
+        author_id, = create_users(f"{prefix}-author", 1)
+        follower_ids = create_users(f"{prefix}-follower", followers)
+        UserFollows.objects.bulk_create(
+            (UserFollows(user_id=follower_id, followed_user_id=author_id)
+             for follower_id in follower_ids),
+            batch_size=1000,
+        )
+        # Push while the author stays under the threshold, pull above.
+        threshold = followers if mode == "push" else followers - 1
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=threshold):
+            tickets = Ticket.objects.bulk_create(
+                Ticket(title=f"{prefix}-{n}", user_id=author_id)
+                for n in range(reviews)
+            )
+            entries_before = FeedEntry.objects.count()
+            write_times = []
+            for ticket in tickets:
+                _, elapsed = timed(
+                    Review.objects.create,
+                    ticket=ticket, rating=3,
+                    headline=ticket.title, user_id=author_id,
+                )
+                write_times.append(elapsed)
+            written = FeedEntry.objects.count() - entries_before
+
+            read_times = [
+                timed(get_timeline_page, follower_ids[0])[1]
+                for _ in range(reads)
+            ]
+        return {
+            "amplification": written / reviews,
+            "write": summarize(write_times),
+            "read": summarize(read_times),
+        }
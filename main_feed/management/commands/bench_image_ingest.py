@@ -0,0 +1,170 @@
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from main_feed.benchmarks import summarize
+
+
+# Processes one image and prints its measures as JSON. Each image runs
+# in a fresh interpreter, so the peak RSS it reports is its own.
+CHILD = """
+import json, resource, sys, tempfile, time
+import django
+django.setup()
+from django.conf import settings
+from PIL import Image
+from main_feed.images import build_derivatives, open_image
+
+def peak_kb():
+    # ru_maxrss is inherited from the parent process on Linux, while
+    # VmHWM belongs to this process only.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+mode, path = sys.argv[1:]
+settings.MEDIA_ROOT = tempfile.mkdtemp()
+baseline = peak_kb()
+start = time.perf_counter()
+with open(path, "rb") as file:
+    if mode == "full":
+        source = Image.open(file)
+        source.load()
+    else:
+        source = open_image(file)
+    with source:
+        size = source.size
+        build_derivatives(source, "0" * 64)
+elapsed = time.perf_counter() - start
+peak = peak_kb()
+print(json.dumps({
+    "seconds": elapsed,
+    "peak_kb": peak,
+    "delta_kb": peak - baseline,
+    "pixels": size[0] * size[1],
+}))
+"""
+
+MODES = ("full", "draft")
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+class Command(BaseCommand):
+    """
+    Measures the time and the peak memory needed to build the
+    derivatives of large images.
+
+    Each image is processed twice, in a separate interpreter: once
+    decoded at full resolution before resizing ("full", the previous
+    behaviour) and once through main_feed.images.open_image(), which
+    lets the decoder work at reduced resolution ("draft"). The peak
+    RSS is reported with the increase over the interpreter's own
+    footprint.
+
+    Without --corpus, JPEG photos of --megapixels are generated in a
+    temporary directory. Derivatives are written to temporary
+    directories, never to MEDIA_ROOT.
+
+    Usage:
+        python manage.py bench_image_ingest --count 3 --megapixels 48
+        python manage.py bench_image_ingest --corpus ~/Photos
+    """
+    help = "Mesure le temps et la mémoire du traitement des grandes images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--corpus", type=Path,
+            help="Dossier d'images à traiter au lieu d'images générées.",
+        )
+        parser.add_argument(
+            "--count", type=int, default=3,
+            help="Nombre d'images générées.",
+        )
+        parser.add_argument(
+            "--megapixels", type=float, default=24,
+            help="Taille des images générées, en mégapixels.",
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            if options["corpus"]:
+                paths = sorted(
+                    path for path in options["corpus"].iterdir()
+                    if path.suffix.lower() in EXTENSIONS
+                )
+                if not paths:
+                    raise CommandError(
+                        f"Aucune image dans {options['corpus']}."
+                    )
+            else:
+                paths = self.generate(
+                    Path(directory), options["count"], options["megapixels"]
+                )
+            self.stdout.write(
+                f"{'image':<24} {'Mpx':>6} {'mode':>6} {'temps':>10} "
+                f"{'RSS max':>10} {'hausse':>10}"
+            )
+            times = {mode: [] for mode in MODES}
+            for path in paths:
+                for mode in MODES:
+                    result = self.measure(mode, path)
+                    if result is None:
+                        continue
+                    times[mode].append(result["seconds"])
+                    self.stdout.write(
+                        f"{path.name[:24]:<24} "
+                        f"{result['pixels'] / 1e6:>6.1f} {mode:>6} "
+                        f"{result['seconds'] * 1000:>8.0f}ms "
+                        f"{result['peak_kb'] / 1024:>8.0f}Mo "
+                        f"{result['delta_kb'] / 1024:>8.0f}Mo"
+                    )
+            for mode in MODES:
+                if times[mode]:
+                    summary = summarize(times[mode])
+                    self.stdout.write(
+                        f"{mode} : p50 {summary['p50_ms']:.0f}ms, "
+                        f"p95 {summary['p95_ms']:.0f}ms"
+                    )
+
+    def generate(self, directory, count, megapixels):
+        """
+        Writes 'count' 4:3 JPEG images of the given size and returns
+        their paths.
+        """
+        width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        paths = []
+        for n in range(count):
+            bands = [
+                Image.linear_gradient("L").rotate(90 * n),
+                Image.radial_gradient("L"),
+                Image.effect_noise((256, 256), 64 + 32 * n),
+            ]
+            image = Image.merge("RGB", bands).resize((width, height))
+            path = directory / f"photo-{n}.jpg"
+            image.save(path, "JPEG", quality=90)
+            image.close()
+            paths.append(path)
+        return paths
+
+    def measure(self, mode, path):
+        process = subprocess.run(
+            [sys.executable, "-c", CHILD, mode, str(path)],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()[-1:]
+            self.stderr.write(f"{path.name} ({mode}) : {' '.join(error)}")
+            return None
+        return json.loads(process.stdout)
@@ -0,0 +1,143 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+from django.test.utils import override_settings
+
+from LITRevue.sqlite_profile import performance_profile
+from main_feed.benchmarks import (
+    create_network, scratch_database, summarize, timed
+)
+from main_feed.feed import get_timeline_page
+from main_feed.models import Comment, Review
+
+
+PROFILES = ("default", "performance")
+
+
+class Command(BaseCommand):
+    """
+    Compares the throughput and the latency of concurrent reads and
+    writes with and without the SQLite performance profile (see
+    LITRevue/sqlite_profile.py).
+
+    For each profile, a scratch database file is filled with users
+    following each other and with tickets. Writer threads then post
+    reviews and comments while reader threads read home feeds, for
+    --duration seconds. Failed operations, such as "database is
+    locked" errors, are counted separately.
+
+    Usage:
+        python manage.py bench_sqlite --writers 4 --readers 8
+    """
+    help = "Compare SQLite avec et sans le profil de performance."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers", type=int, default=4,
+            help="Nombre de threads qui publient.",
+        )
+        parser.add_argument(
+            "--readers", type=int, default=4,
+            help="Nombre de threads qui lisent le fil.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=5,
+            help="Durée de chaque mesure, en secondes.",
+        )
+        parser.add_argument(
+            "--users", type=int, default=50,
+            help="Nombre d'utilisateurs de la base de test.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profil':<12} {'op.':>9} {'ops/s':>8} {'p50':>9} "
+            f"{'p99':>9} {'échecs':>7}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in PROFILES:
+                results = self.measure(
+                    profile, Path(directory) / f"{profile}.sqlite3",
+                    options
+                )
+                for operation, result in results.items():
+                    summary = summarize(result["times"])
+                    rate = len(result["times"]) / options["duration"]
+                    self.stdout.write(
+                        f"{profile:<12} {operation:>9} {rate:>8.0f} "
+                        f"{summary['p50_ms']:>7.2f}ms "
+                        f"{summary['p99_ms']:>7.2f}ms "
+                        f"{result['errors']:>7}"
+                    )
+
+    def measure(self, profile, path, options):
+        database = connections.settings["default"]
+        saved = {**database, "TEST": dict(database["TEST"])}
+        if profile == "performance":
+            # Connections are created from this dictionary, in every
+            # thread: the profile applies to the ones opened below.
+            database.update(performance_profile(database))
+        try:
+            with scratch_database(path), override_settings(
+                    BACKGROUND_TASKS_EAGER=True):
+                user_ids, ticket_ids = create_network(options["users"])
+                return self.run_threads(user_ids, ticket_ids, options)
+        finally:
+            database.clear()
+            database.update(saved)
+
+    def run_threads(self, user_ids, ticket_ids, options):
+        results = {
+            "écriture": {"times": [], "errors": 0},
+            "lecture": {"times": [], "errors": 0},
+        }
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def write(n):
+            user_id = user_ids[n % len(user_ids)]
+            review = Review.objects.create(
+                ticket_id=ticket_ids[n % len(ticket_ids)], rating=n % 6,
+                headline=f"Critique {n}", user_id=user_id,
+            )
+            Comment.objects.create(
+                review=review, author_id=user_id, content=f"{n}"
+            )
+
+        def read(n):
+            get_timeline_page(user_ids[n % len(user_ids)])
+
+        def worker(operation, action, offset):
+            result = results[operation]
+            n = offset
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        _, elapsed = timed(action, n)
+                    except DatabaseError:
+                        with lock:
+                            result["errors"] += 1
+                    else:
+                        with lock:
+                            result["times"].append(elapsed)
+                    n += 1000
+                    close_old_connections()
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=worker, args=("écriture", write, n))
+            for n in range(options["writers"])
+        ] + [
+            threading.Thread(target=worker, args=("lecture", read, n))
+            for n in range(options["readers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,221 @@
+import json
+import platform
+import random
+import sqlite3
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from authentication.models import User
+from main_feed.benchmarks import measure_requests, scratch_database
+from main_feed.bulk_load import Loader, finish
+from main_feed.datasets import SIZES, generate
+from main_feed.models import Review
+
+
+# Views measured, in the order they are reported.
+VIEWS = ["home", "posts", "review_detail", "followings", "create_review"]
+
+
+class Command(BaseCommand):
+    """
+    Measures the latency, the number of queries and the size of the
+    responses of the main views on a synthetic dataset.
+
+    A dataset of the requested size is generated (see
+    main_feed/datasets.py), or read from a JSONL file, and imported
+    into a scratch database. Each view is then requested through the
+    test client by readers drawn at random, after a few warm-up
+    requests. The command prints p50, p95 and p99 latencies, the mean
+    number of queries and the mean response size per view, and can
+    write them to a JSON file, to be given as the baseline of a later
+    run.
+
+    Usage:
+        python manage.py bench_views --size 100k --output after.json \\
+            --baseline before.json
+    """
+    help = "Mesure la latence des principales vues sur des données " \
+           "synthétiques."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", choices=SIZES, default="10k",
+            help="Taille du jeu de données généré.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Graine des données et du choix des lecteurs.",
+        )
+        parser.add_argument(
+            "--dataset",
+            help="Fichier JSONL à importer au lieu de générer les données.",
+        )
+        parser.add_argument(
+            "--database",
+            help="Fichier SQLite de la base temporaire (par défaut, "
+                 "en mémoire).",
+        )
+        parser.add_argument(
+            "--readers", type=int, default=20,
+            help="Nombre d'utilisateurs dont les pages sont demandées.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=100,
+            help="Nombre de requêtes mesurées par vue.",
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=5,
+            help="Nombre de requêtes non mesurées par vue.",
+        )
+        parser.add_argument(
+            "--output", help="Fichier JSON où écrire les résultats.",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="Résultats JSON d'une exécution précédente à comparer.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"], encoding="utf-8") as file:
+                    baseline = json.load(file)["views"]
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f"Référence illisible : {error}")
+
+        with scratch_database(options["database"]), override_settings(
+                BACKGROUND_TASKS_EAGER=True, ALLOWED_HOSTS=["testserver"]):
+            dataset = self.load(options)
+            rng = random.Random(options["seed"])
+            user_ids = list(User.objects.order_by("pk").values_list(
+                "pk", flat=True
+            ))
+            if not user_ids:
+                raise CommandError("Le jeu de données n'a aucun utilisateur.")
+            readers = rng.sample(user_ids, min(options["readers"],
+                                               len(user_ids)))
+            review_ids = list(Review.objects.values_list("pk", flat=True))
+            clients = []
+            for user in User.objects.filter(pk__in=readers):
+                client = Client()
+                client.force_login(user)
+                clients.append(client)
+
+            views = {}
+            for name in VIEWS:
+                if name == "review_detail" and not review_ids:
+                    continue
+                requests = self.requests(name, clients, review_ids, rng)
+                measure_requests(
+                    next(requests) for _ in range(options["warmup"])
+                )
+                views[name] = measure_requests(
+                    next(requests) for _ in range(options["requests"])
+                )
+
+        self.report(views, baseline)
+        if options["output"]:
+            results = {
+                "dataset": dataset,
+                "environment": {
+                    "python": platform.python_version(),
+                    "django": django.get_version(),
+                    "sqlite": sqlite3.sqlite_version,
+                },
+                "readers": len(clients),
+                "views": views,
+            }
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f"Résultats écrits dans {options['output']}"
+            ))
+
+    def load(self, options):
+        start = time.perf_counter()
+        loader = Loader()
+        if options["dataset"]:
+            try:
+                with open(options["dataset"], encoding="utf-8") as file:
+                    report = loader.load(file)
+            except OSError as error:
+                raise CommandError(error)
+        else:
+            report = loader.load(
+                json.dumps(line) for line in
+                generate(SIZES[options["size"]], options["seed"])
+            )
+        finish()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{report.lines} lignes importées en {elapsed:.1f} s"
+        )
+        return {
+            "source": options["dataset"] or options["size"],
+            "seed": options["seed"],
+            "created": dict(report.created),
+            "load_seconds": elapsed,
+        }
+
+    @staticmethod
+    def requests(name, clients, review_ids, rng):
+        """
+        Yields (client, method, path, data) tuples for a view, the
+        readers taking turns.
+        """
+        n = 0
+        while True:
+            client = clients[n % len(clients)]
+            n += 1
+            if name == "home":
+                yield client, "get", reverse("homepage"), None
+            elif name == "posts":
+                yield client, "get", reverse("posts"), None
+            elif name == "review_detail":
+                yield (client, "get", reverse(
+                    "review_detail", args=[rng.choice(review_ids)]
+                ), None)
+            elif name == "followings":
+                yield client, "get", reverse("followings"), None
+            elif name == "create_review":
+                yield client, "post", reverse("create_review"), {
+                    "title": f"Livre mesuré {n}",
+                    "description": "Description",
+                    "update_ticket": True,
+                    "headline": f"Critique mesurée {n}",
+                    "body": "Corps de la critique",
+                    "rating": rng.randrange(6),
+                    "update_review": True,
+                }
+
+    def report(self, views, baseline):
+        self.stdout.write(
+            f"{'vue':<15} {'p50':>9} {'p95':>9} {'p99':>9} "
+            f"{'requêtes SQL':>13} {'octets':>9}"
+        )
+        for name, result in views.items():
+            line = (
+                f"{name:<15} {result['p50_ms']:>7.2f}ms "
+                f"{result['p95_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms "
+                f"{result['queries_mean']:>13.1f} "
+                f"{result['bytes_mean']:>9.0f}"
+            )
+            before = (baseline or {}).get(name)
+            if before and before["p50_ms"] and before["p95_ms"]:
+                line += (
+                    f"  p50 ×{result['p50_ms'] / before['p50_ms']:.2f}"
+                    f" p95 ×{result['p95_ms'] / before['p95_ms']:.2f}"
+                )
+            self.stdout.write(line)
+            unexpected = {
+                status: count for status, count in result["statuses"].items()
+                if status not in ("200", "302")
+            }
+            if unexpected:
+                self.stderr.write(f"{name} : réponses {unexpected}")
@@ -0,0 +1,115 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+from django.test.utils import override_settings
+
+from LITRevue.write_queue import run_write
+from main_feed.benchmarks import (
+    create_network, scratch_database, summarize, timed
+)
+from main_feed.models import Comment, Review
+
+
+MODES = {"direct": False, "queue": True}
+
+
+class Command(BaseCommand):
+    """
+    Compares concurrent posting with and without the single-writer
+    queue (see LITRevue/write_queue.py).
+
+    For each mode, a scratch database file is filled with users and
+    tickets, then --posters threads post a review and a comment on it
+    through run_write(), as the views do, for --duration seconds.
+    "direct" writes from each thread (SERIALIZE_WRITES off), "queue"
+    hands the writes to the writer thread. The command reports the
+    throughput, the latency percentiles and the failed posts.
+
+    Usage:
+        python manage.py bench_write_queue --posters 16
+    """
+    help = "Compare les écritures concurrentes avec et sans file unique."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--posters", type=int, default=8,
+            help="Nombre de threads qui publient.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=5,
+            help="Durée de chaque mesure, en secondes.",
+        )
+        parser.add_argument(
+            "--users", type=int, default=50,
+            help="Nombre d'utilisateurs de la base de test.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'mode':<8} {'posts/s':>8} {'p50':>9} {'p95':>9} "
+            f"{'p99':>9} {'échecs':>7}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, serialize in MODES.items():
+                with scratch_database(Path(directory) / f"{mode}.sqlite3"), \
+                        override_settings(BACKGROUND_TASKS_EAGER=True):
+                    user_ids, ticket_ids = create_network(options["users"])
+                    with override_settings(SERIALIZE_WRITES=serialize):
+                        times, errors = self.run_posters(
+                            user_ids, ticket_ids, options
+                        )
+                summary = summarize(times)
+                self.stdout.write(
+                    f"{mode:<8} {len(times) / options['duration']:>8.0f} "
+                    f"{summary['p50_ms']:>7.2f}ms "
+                    f"{summary['p95_ms']:>7.2f}ms "
+                    f"{summary['p99_ms']:>7.2f}ms {errors:>7}"
+                )
+
+    def run_posters(self, user_ids, ticket_ids, options):
+        times = []
+        errors = 0
+        lock = threading.Lock()
+        deadline = time.monotonic() + options["duration"]
+
+        def post(n):
+            user_id = user_ids[n % len(user_ids)]
+            review = Review.objects.create(
+                ticket_id=ticket_ids[n % len(ticket_ids)], rating=n % 6,
+                headline=f"Critique {n}", user_id=user_id,
+            )
+            Comment.objects.create(
+                review=review, author_id=user_id, content=f"{n}"
+            )
+
+        def poster(offset):
+            nonlocal errors
+            n = offset
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        _, elapsed = timed(run_write, post, n)
+                    except DatabaseError:
+                        with lock:
+                            errors += 1
+                    else:
+                        with lock:
+                            times.append(elapsed)
+                    n += options["posters"]
+                    close_old_connections()
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=poster, args=(n,))
+            for n in range(options["posters"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return times, errors
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from main_feed.images import process_ticket_image
+from main_feed.models import Ticket
+
+
+class Command(BaseCommand):
+    """
+    Builds the resized WebP and JPEG copies of the images of existing
+    tickets. Tickets whose derivatives are already present are skipped
+    unless --force is given.
+
+    Usage:
+        python manage.py build_image_derivatives
+        python manage.py build_image_derivatives --force
+    """
+    help = "Génère les déclinaisons des images des billets existants."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Régénère aussi les déclinaisons déjà présentes.",
+        )
+
+    def handle(self, *args, force=False, **options):
+        ticket_ids = Ticket.objects.exclude(image="").exclude(
+            image__isnull=True
+        ).order_by("id").values_list("id", flat=True)
+        count = 0
+        for ticket_id in ticket_ids.iterator():
+            try:
+                process_ticket_image(ticket_id, force=force)
+            except (OSError, ValueError) as error:
+                self.stderr.write(f"Billet #{ticket_id} : {error}")
+                continue
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} image(s) traitée(s)."
+        ))
@@ -0,0 +1,109 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_feed.images import RELEASED_IMAGE_MIN_AGE
+from main_feed.media_gc import (
+    GC_BATCH_SIZE, batches, delete_orphans, find_orphans, walk_media
+)
+
+
+class Command(BaseCommand):
+    """
+    Deletes the files of MEDIA_ROOT that no ticket uses anymore (see
+    main_feed.media_gc).
+
+    Files are checked by batches. After each batch, the name of the
+    last checked file is saved to the checkpoint file, so that an
+    interrupted sweep, or one limited with --max-batches, resumes
+    where it stopped. The checkpoint is removed once the whole tree
+    has been swept. Dry runs neither delete files nor move the
+    checkpoint.
+
+    Usage:
+        python manage.py collect_media_garbage --dry-run
+        python manage.py collect_media_garbage --max-batches 20
+    """
+    help = "Supprime les fichiers média qui ne sont plus utilisés."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Affiche les fichiers orphelins sans les supprimer.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=GC_BATCH_SIZE,
+            help="Nombre de fichiers vérifiés par requête.",
+        )
+        parser.add_argument(
+            "--max-batches", type=int,
+            help="Arrête le balayage après ce nombre de lots.",
+        )
+        parser.add_argument(
+            "--min-age", type=float, default=RELEASED_IMAGE_MIN_AGE,
+            help="Âge minimal, en secondes, d'un fichier supprimé.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=settings.BASE_DIR / "media_gc_checkpoint.json",
+            help="Fichier où reprendre le balayage.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Ignore le point de reprise et recommence au début.",
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        checkpoint = options["checkpoint"]
+        after = None if options["restart"] else self.load(checkpoint)
+        if after:
+            self.stdout.write(f"Reprise après {after}")
+
+        checked = deleted = freed = 0
+        finished = True
+        files = walk_media(settings.MEDIA_ROOT, after)
+        for number, batch in enumerate(
+                batches(files, options["batch_size"]), start=1):
+            orphans = find_orphans(batch, options["min_age"])
+            checked += len(batch)
+            deleted += len(orphans)
+            if dry_run:
+                freed += sum(orphan.size for orphan in orphans)
+                for orphan in orphans:
+                    self.stdout.write(f"orphelin : {orphan.name}")
+            else:
+                freed += delete_orphans(orphans, settings.MEDIA_ROOT)
+                self.save(checkpoint, batch[-1].name)
+            if number == options["max_batches"]:
+                finished = False
+                break
+
+        if finished and not dry_run:
+            self.clear(checkpoint)
+        verb = "à supprimer" if dry_run else "supprimé(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{checked} fichier(s) vérifié(s), {deleted} {verb} "
+            f"({freed / 1024 / 1024:.1f} Mo)"
+            + ("" if finished else ", balayage interrompu")
+        ))
+
+    def load(self, checkpoint):
+        try:
+            with open(checkpoint) as file:
+                return json.load(file)["after"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, checkpoint, after):
+        with open(checkpoint, "w") as file:
+            json.dump({"after": after}, file)
+
+    def clear(self, checkpoint):
+        try:
+            os.remove(checkpoint)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from main_feed.suggestions import refresh_suggestions
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the "who to follow" suggestions (see
+    main_feed/suggestions.py).
+
+    By default, only the users whose follows or ratings, or whose
+    followees' follows, changed since the last run are recomputed.
+    --all recomputes every user, which also catches the taste changes
+    caused by other users' ratings; run it from time to time.
+
+    Usage:
+        python manage.py compute_suggestions
+        python manage.py compute_suggestions --all
+    """
+    help = "Recalcule les suggestions d'abonnement."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Recalcule les suggestions de tous les utilisateurs.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Nombre d'utilisateurs enregistrés par transaction.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["all"]:
+            user_ids = User.objects.values_list("pk", flat=True)
+        start = time.perf_counter()
+        count = refresh_suggestions(user_ids, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} utilisateur(s) recalculé(s) en "
+            f"{time.perf_counter() - start:.1f} s"
+        ))
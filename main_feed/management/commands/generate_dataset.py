@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_feed.datasets import SIZES, generate
+
+
+class Command(BaseCommand):
+    """
+    Writes a deterministic synthetic dataset (see
+    main_feed/datasets.py) as JSONL, to be imported with load_jsonl.
+
+    Usage:
+        python manage.py generate_dataset --size 100k -o data.jsonl
+        python manage.py generate_dataset --size 10k --password azerty \\
+            | python manage.py load_jsonl -
+    """
+    help = "Génère un jeu de données synthétique au format JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size", choices=SIZES, default="10k",
+            help="Nombre approximatif de lignes.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="Graine du générateur : même graine, mêmes données.",
+        )
+        parser.add_argument(
+            "--password",
+            help="Mot de passe de tous les utilisateurs (par défaut, "
+                 "ils ne peuvent pas se connecter).",
+        )
+        parser.add_argument(
+            "-o", "--output", default="-",
+            help="Fichier à écrire, « - » pour la sortie standard.",
+        )
+
+    def handle(self, *args, **options):
+        lines = generate(
+            SIZES[options["size"]], options["seed"], options["password"]
+        )
+        if options["output"] == "-":
+            count = self.write(lines, self.stdout)
+            # The data goes to stdout: keep the summary out of it.
+            summary = self.stderr
+        else:
+            try:
+                with open(options["output"], "w", encoding="utf-8") as file:
+                    count = self.write(lines, file)
+            except OSError as error:
+                raise CommandError(error)
+            summary = self.stdout
+        summary.write(self.style.SUCCESS(f"{count} lignes générées."))
+
+    @staticmethod
+    def write(lines, file):
+        count = 0
+        for line in lines:
+            file.write(json.dumps(line, ensure_ascii=False) + "\n")
+            count += 1
+        return count
@@ -0,0 +1,92 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_feed.bulk_load import CHUNK_SIZE, Loader, finish
+
+
+class Command(BaseCommand):
+    """
+    Imports users, follows, tickets, reviews and comments from a JSONL
+    file (format in main_feed/bulk_load.py), with one bulk insert per
+    model and per chunk of lines, then rebuilds the counters, rating
+    statistics and home feed timelines and builds the derivatives of
+    the ticket images.
+
+    Usage:
+        python manage.py load_jsonl export.jsonl
+        python manage.py load_jsonl - --chunk-size 20000 < export.jsonl
+    """
+    help = "Importe des utilisateurs, billets, critiques, commentaires " \
+           "et abonnements depuis un fichier JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            help="Fichier JSONL à importer, « - » pour l'entrée standard.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE,
+            help="Nombre de lignes écrites par transaction.",
+        )
+        parser.add_argument(
+            "--no-rebuild-feeds",
+            action="store_false",
+            dest="rebuild_feeds",
+            help="Ne reconstruit pas les fils d'actualité "
+                 "(lancer rebuild_feeds ensuite).",
+        )
+        parser.add_argument(
+            "--no-images",
+            action="store_false",
+            dest="process_images",
+            help="Ne traite pas les images des billets "
+                 "(lancer build_image_derivatives ensuite).",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(report):
+            if options["verbosity"] > 1:
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{report.lines} lignes, "
+                    f"{report.lines / elapsed:.0f} lignes/s"
+                )
+
+        loader = Loader(options["chunk_size"])
+        try:
+            if options["path"] == "-":
+                report = loader.load(sys.stdin, progress)
+            else:
+                with open(options["path"], encoding="utf-8") as file:
+                    report = loader.load(file, progress)
+        except OSError as error:
+            raise CommandError(error)
+        loaded = time.perf_counter() - start
+
+        for number, message in report.errors:
+            self.stderr.write(f"Ligne {number} ignorée : {message}")
+        created = ", ".join(
+            f"{count} {kind}(s)" for kind, count in report.created.items()
+        )
+        self.stdout.write(
+            f"{report.lines} lignes en {loaded:.1f} s "
+            f"({report.lines / max(loaded, 1e-9):.0f} lignes/s) : "
+            f"{created or 'rien'} ; {report.skipped} ignorée(s)"
+        )
+
+        failed = finish(options["rebuild_feeds"], options["process_images"])
+        for ticket_id, error in failed:
+            self.stderr.write(f"Billet #{ticket_id} : {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Données dérivées reconstruites en "
+            f"{time.perf_counter() - start - loaded:.1f} s. Lancer "
+            "compute_suggestions --all pour les suggestions."
+        ))
+        if not options["process_images"]:
+            self.stdout.write(
+                "Images non traitées : lancer build_image_derivatives."
+            )
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import User
+from main_feed.fanout import rebuild_timeline
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the FeedEntry timelines from the tickets, reviews and
+    follows currently stored in the database.
+
+    Usage:
+        python manage.py rebuild_feeds
+        python manage.py rebuild_feeds --user reader
+    """
+    help = "Reconstruit les fils d'actualité de tous les utilisateurs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="usernames",
+            help="Ne reconstruit que le fil de cet utilisateur "
+                 "(option répétable).",
+        )
+
+    def handle(self, *args, usernames=None, **options):
+        users = User.objects.order_by("id")
+        if usernames:
+            users = users.filter(username__in=usernames)
+            missing = set(usernames) - set(
+                users.values_list("username", flat=True)
+            )
+            if missing:
+                raise CommandError(
+                    f"Utilisateur(s) introuvable(s) : {', '.join(missing)}"
+                )
+
+        total = 0
+        for user_id, username in users.values_list(
+                "id", "username").iterator():
+            count = rebuild_timeline(user_id)
+            total += count
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{username} : {count} entrées")
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} entrées de fil reconstruites."
+        ))
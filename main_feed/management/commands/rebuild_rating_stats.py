@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main_feed.rating_stats import rebuild
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the rating statistics of every user and ticket from
+    the reviews (see main_feed/rating_stats.py), for instance after
+    reviews were imported without their signals.
+
+    Usage:
+        python manage.py rebuild_rating_stats
+    """
+    help = "Recalcule les statistiques de notes des utilisateurs et billets."
+
+    def handle(self, *args, **options):
+        for name, count in rebuild().items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{name} : {count} ligne(s) recalculée(s)"
+            ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from main_feed.counters import COUNTERS, reconcile
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the denormalized counters (reviews per ticket,
+    comments per review, followers and followings per user) and
+    repairs the ones that have drifted.
+
+    Usage:
+        python manage.py reconcile_counters
+        python manage.py reconcile_counters --dry-run
+    """
+    help = "Recalcule les compteurs dénormalisés et corrige les écarts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Affiche les écarts sans les corriger.",
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        for counter in COUNTERS:
+            drifted = reconcile(counter, dry_run=dry_run)
+            label = f"{counter.model.__name__}.{counter.field}"
+            if not drifted:
+                self.stdout.write(f"{label} : aucun écart")
+            elif dry_run:
+                self.stdout.write(self.style.WARNING(
+                    f"{label} : {drifted} ligne(s) en écart"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{label} : {drifted} ligne(s) corrigée(s)"
+                ))
@@ -0,0 +1,212 @@
+"""
+Garbage collection of the files of MEDIA_ROOT that no ticket uses.
+
+Ticket images are released when their ticket is deleted (see
+main_feed.images.release_image), but files can still be left behind:
+images uploaded before reference counting existed, uploads whose
+transaction was rolled back, temporary files of an interrupted
+upload, derivatives of images that were replaced.
+
+The sweep walks MEDIA_ROOT in a fixed order (directory entries sorted
+by name) and checks the files by batches, with one query per batch
+and kind of file, so neither the file list nor the tables are ever
+loaded whole. The position of the last checked file can be saved
+after each batch, and a later sweep resumes after it.
+
+Files modified less than 'min_age' seconds ago are never collected:
+an upload is written to disk before its ticket is committed, and
+uploading a file that is already stored touches it (see
+main_feed.storage).
+"""
+import os
+import time
+from dataclasses import dataclass
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from .images import DERIVATIVES_DIR
+from .models import StoredImage, Ticket
+from .storage import ContentAddressedStorage
+
+
+GC_BATCH_SIZE = 500
+
+# Temporary files of main_feed.storage.ContentAddressedStorage.
+_UPLOAD_PREFIX = ".upload-"
+
+
+@dataclass
+class MediaFile:
+    """
+    A file found under MEDIA_ROOT.
+
+    Attributes:
+        name (str): Path relative to MEDIA_ROOT, with "/" separators.
+        path (str): Absolute path.
+        size (int): Size in bytes.
+        mtime (float): Modification time.
+    """
+    name: str
+    path: str
+    size: int
+    mtime: float
+
+    @property
+    def parts(self):
+        return tuple(self.name.split("/"))
+
+    @property
+    def digest(self):
+        """
+        The digest of the original a derivative was built from, ""
+        for the other files.
+        """
+        parts = self.parts
+        if len(parts) == 4 and parts[0] == DERIVATIVES_DIR:
+            return parts[2]
+        return ""
+
+
+def walk_media(root, after=None):
+    """
+    Yields the files under root, sorted by path components.
+
+    Args:
+        root (str): The directory to walk, usually MEDIA_ROOT.
+        after (str, optional): Name of the last file checked by a
+        previous sweep. Only the files that come after it are
+        yielded, and the directories before it are not even listed.
+    """
+    after = tuple(after.split("/")) if after else ()
+
+    def walk(directory, prefix):
+        try:
+            with os.scandir(directory) as scan:
+                entries = sorted(scan, key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            parts = prefix + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if parts >= after[:len(parts)]:
+                    yield from walk(entry.path, parts)
+                continue
+            if parts <= after or not entry.is_file(follow_symlinks=False):
+                continue
+            if (entry.name.startswith(".")
+                    and not entry.name.startswith(_UPLOAD_PREFIX)):
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            yield MediaFile(
+                "/".join(parts), entry.path, stat.st_size, stat.st_mtime
+            )
+
+    yield from walk(str(root), ())
+
+
+def batches(files, size=GC_BATCH_SIZE):
+    """
+    Groups an iterable of files into lists of at most 'size' files.
+    """
+    batch = []
+    for media_file in files:
+        batch.append(media_file)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def find_orphans(batch, min_age, now=None):
+    """
+    Returns the files of a batch that no ticket uses.
+
+    Originals are used when a ticket has them as image. Derivatives
+    are used when a ticket's image has their digest, either as
+    processed hash or, while it waits for processing, in its
+    content-addressed name.
+
+    Args:
+        batch (list): MediaFile instances.
+        min_age (float): Files modified more recently than this
+        many seconds are kept.
+        now (float, optional): Current time, defaults to time.time().
+    """
+    now = time.time() if now is None else now
+    candidates = [f for f in batch if now - f.mtime >= min_age]
+
+    names = [f.name for f in candidates if not f.digest]
+    used_names = set(
+        Ticket.objects.filter(image__in=names)
+        .values_list("image", flat=True)
+    ) if names else set()
+
+    digests = {f.digest for f in candidates if f.digest}
+    used_digests = set()
+    if digests:
+        used_digests.update(
+            Ticket.objects.filter(image_hash__in=digests)
+            .values_list("image_hash", flat=True)
+        )
+        pending = digests - used_digests
+        if pending:
+            originals = ContentAddressedStorage()
+            prefixes = reduce(or_, (
+                Q(image__startswith=originals.content_name(digest, ""))
+                for digest in pending
+            ))
+            for name in Ticket.objects.filter(
+                    prefixes, image_ready=False
+            ).values_list("image", flat=True):
+                used_digests.add(os.path.basename(name).split(".")[0])
+
+    return [
+        f for f in candidates
+        if (f.digest not in used_digests if f.digest
+            else f.name not in used_names)
+    ]
+
+
+def delete_orphans(orphans, root):
+    """
+    Deletes orphaned files, the StoredImage rows counting them and
+    the directories left empty. Files modified since they were found
+    are kept: an upload of the same content touches the stored file
+    before its ticket uses it.
+
+    Returns:
+        int: Number of bytes freed.
+    """
+    unchanged = []
+    for media_file in orphans:
+        try:
+            mtime = os.stat(media_file.path).st_mtime
+        except FileNotFoundError:
+            continue
+        if mtime == media_file.mtime:
+            unchanged.append(media_file)
+    StoredImage.objects.filter(
+        name__in=[f.name for f in unchanged if not f.digest]
+    ).delete()
+    freed = 0
+    directories = set()
+    for media_file in unchanged:
+        try:
+            os.remove(media_file.path)
+        except FileNotFoundError:
+            continue
+        freed += media_file.size
+        directories.add(os.path.dirname(media_file.path))
+    root = os.path.abspath(root)
+    for directory in sorted(directories, reverse=True):
+        while os.path.abspath(directory) != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # Not empty.
+                break
+            directory = os.path.dirname(directory)
+    return freed
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:48
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+FILL_BATCH_SIZE = 1000
+
+
+def fill_timelines(apps, schema_editor):
+    """
+    Delivers the existing tickets and reviews to the timeline of
+    their author and of the author's followers.
+
+    The follows are read once, as a map of the followers of each
+    author, and the entries are written every FILL_BATCH_SIZE.
+    """
+    FeedEntry = apps.get_model("main_feed", "FeedEntry")
+    UserFollows = apps.get_model("authentication", "UserFollows")
+    followers = defaultdict(list)
+    follows = UserFollows.objects.values_list("followed_user_id", "user_id")
+    for author_id, owner_id in follows.iterator():
+        followers[author_id].append(owner_id)
+
+    entries = []
+    for model_name, content_type in (("Ticket", "TICKET"),
+                                     ("Review", "REVIEW")):
+        model = apps.get_model("main_feed", model_name)
+        posts = model.objects.values_list("id", "user_id", "time_created")
+        for post_id, author_id, time_created in posts.iterator():
+            for owner_id in [author_id, *followers.get(author_id, ())]:
+                entries.append(FeedEntry(
+                    owner_id=owner_id,
+                    author_id=author_id,
+                    content_type=content_type,
+                    post_id=post_id,
+                    time_created=time_created,
+                ))
+            if len(entries) >= FILL_BATCH_SIZE:
+                FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+                entries = []
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_alter_userfollows_user'),
+        ('main_feed', '0002_comment_content_alter_comment_review'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_type', models.CharField(choices=[('TICKET', 'Billet'), ('REVIEW', 'Critique')], max_length=6)),
+                ('post_id', models.PositiveBigIntegerField()),
+                ('time_created', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Entrée de fil',
+                'verbose_name_plural': 'Entrées de fil',
+                'indexes': [models.Index(fields=['owner', '-time_created', '-content_type', '-post_id'], name='feedentry_timeline_idx'), models.Index(fields=['owner', 'author'], name='feedentry_owner_author_idx'), models.Index(fields=['content_type', 'post_id'], name='feedentry_post_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'content_type', 'post_id'), name='feedentry_unique_post')],
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
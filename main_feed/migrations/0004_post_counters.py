@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_children(apps, schema_editor):
+    """
+    Initializes the review and comment counters from the existing rows.
+    """
+    for parent, field, child, fk in (("Ticket", "review_count",
+                                      "Review", "ticket"),
+                                     ("Review", "comment_count",
+                                      "Comment", "review")):
+        parent_model = apps.get_model("main_feed", parent)
+        child_model = apps.get_model("main_feed", child)
+        counts = child_model.objects.filter(
+            **{fk: OuterRef("pk")}
+        ).order_by().values(fk).annotate(n=Count("pk")).values("n")
+        parent_model.objects.update(
+            **{field: Coalesce(Subquery(counts), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_feed', '0003_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_children, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_feed', '0005_ticket_image_processing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
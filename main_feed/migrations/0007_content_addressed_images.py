@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:57
+
+import main_feed.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_image_references(apps, schema_editor):
+    """
+    Creates the reference counts of the images already stored.
+    """
+    Ticket = apps.get_model("main_feed", "Ticket")
+    StoredImage = apps.get_model("main_feed", "StoredImage")
+    references = Ticket.objects.exclude(image="").exclude(
+        image__isnull=True
+    ).values("image").annotate(n=Count("id")).order_by()
+    StoredImage.objects.bulk_create(
+        StoredImage(name=row["image"], ref_count=row["n"])
+        for row in references
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_feed', '0006_ticket_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Image stockée',
+                'verbose_name_plural': 'Images stockées',
+            },
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=main_feed.storage.ticket_image_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(
+            count_image_references, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:00
+
+import main_feed.storage
+import main_feed.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_feed', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ticket',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=main_feed.storage.ticket_image_storage, upload_to='', validators=[main_feed.validators.validate_image_pixels]),
+        ),
+    ]
@@ -0,0 +1,103 @@
+from django.db import migrations
+
+
+# Rowids of the index are <post id> * 4 + <kind>, see main_feed.search.
+TICKET, REVIEW, COMMENT = 1, 2, 3
+
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE main_feed_search USING fts5(
+    title,
+    body,
+    author_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+# The visibility of a comment is the one of its review.
+TICKET_ROW = (
+    f"new.id * 4 + {TICKET}, new.title, new.description, new.user_id"
+)
+REVIEW_ROW = (
+    f"new.id * 4 + {REVIEW}, new.headline, new.body, new.user_id"
+)
+COMMENT_ROW = (
+    f"new.id * 4 + {COMMENT}, '', coalesce(new.content, ''), "
+    "(SELECT user_id FROM main_feed_review WHERE id = new.review_id)"
+)
+
+# (table, kind, indexed row, condition for reindexing a changed row)
+TRIGGERS = [
+    ("main_feed_ticket", TICKET, TICKET_ROW,
+     "old.title IS NOT new.title "
+     "OR old.description IS NOT new.description "
+     "OR old.user_id IS NOT new.user_id"),
+    ("main_feed_review", REVIEW, REVIEW_ROW,
+     "old.headline IS NOT new.headline "
+     "OR old.body IS NOT new.body "
+     "OR old.user_id IS NOT new.user_id"),
+    ("main_feed_comment", COMMENT, COMMENT_ROW,
+     "old.content IS NOT new.content "
+     "OR old.review_id IS NOT new.review_id"),
+]
+
+
+def trigger_statements():
+    for table, kind, row, changed in TRIGGERS:
+        insert = (
+            "INSERT INTO main_feed_search(rowid, title, body, author_id) "
+            f"VALUES ({row});"
+        )
+        delete = (
+            f"DELETE FROM main_feed_search WHERE rowid = old.id * 4 + {kind};"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} "
+            f"BEGIN {insert} END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_update AFTER UPDATE ON {table} "
+            f"WHEN {changed} BEGIN {delete} {insert} END"
+        )
+        yield (
+            f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} "
+            f"BEGIN {delete} END"
+        )
+
+
+FILL_INDEX = [
+    "INSERT INTO main_feed_search(rowid, title, body, author_id) "
+    f"SELECT id * 4 + {TICKET}, title, description, user_id "
+    "FROM main_feed_ticket",
+    "INSERT INTO main_feed_search(rowid, title, body, author_id) "
+    f"SELECT id * 4 + {REVIEW}, headline, body, user_id "
+    "FROM main_feed_review",
+    "INSERT INTO main_feed_search(rowid, title, body, author_id) "
+    f"SELECT c.id * 4 + {COMMENT}, '', coalesce(c.content, ''), r.user_id "
+    "FROM main_feed_comment c JOIN main_feed_review r ON r.id = c.review_id",
+]
+
+
+class Migration(migrations.Migration):
+    """
+    Creates the FTS5 full-text index of tickets, reviews and comments,
+    kept up to date by triggers, and fills it from the existing rows.
+    """
+
+    dependencies = [
+        ('main_feed', '0009_post_access_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [CREATE_INDEX, *trigger_statements(), *FILL_INDEX],
+            [
+                *(
+                    f"DROP TRIGGER {table}_search_{event}"
+                    for table, _, _, _ in TRIGGERS
+                    for event in ("insert", "update", "delete")
+                ),
+                "DROP TABLE main_feed_search",
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_feed', '0011_follow_suggestions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('review_count', 0)), fields=['-time_created', '-id'], name='ticket_open_time_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_stats(apps, schema_editor):
+    """
+    Initializes the rating statistics from the existing reviews.
+    """
+    review_model = apps.get_model("main_feed", "Review")
+    aggregates = {
+        "count": Count("pk"),
+        "total": Sum("rating"),
+        **{
+            f"r{rating}": Count("pk", filter=Q(rating=rating))
+            for rating in range(6)
+        },
+    }
+    for name, field in (("UserRatingStats", "user_id"),
+                        ("TicketRatingStats", "ticket_id")):
+        model = apps.get_model("main_feed", name)
+        rows = review_model.objects.order_by().values(field).annotate(
+            **aggregates
+        )
+        model.objects.bulk_create(
+            model(pk=row.pop(field), **row) for row in rows
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_user_username_lower_idx'),
+        ('main_feed', '0012_open_ticket_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketRatingStats',
+            fields=[
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('r0', models.PositiveIntegerField(default=0)),
+                ('r1', models.PositiveIntegerField(default=0)),
+                ('r2', models.PositiveIntegerField(default=0)),
+                ('r3', models.PositiveIntegerField(default=0)),
+                ('r4', models.PositiveIntegerField(default=0)),
+                ('r5', models.PositiveIntegerField(default=0)),
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='main_feed.ticket')),
+            ],
+            options={
+                'verbose_name': "Statistiques de notes d'un billet",
+                'verbose_name_plural': 'Statistiques de notes des billets',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRatingStats',
+            fields=[
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('r0', models.PositiveIntegerField(default=0)),
+                ('r1', models.PositiveIntegerField(default=0)),
+                ('r2', models.PositiveIntegerField(default=0)),
+                ('r3', models.PositiveIntegerField(default=0)),
+                ('r4', models.PositiveIntegerField(default=0)),
+                ('r5', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': "Statistiques de notes d'un utilisateur",
+                'verbose_name_plural': 'Statistiques de notes des utilisateurs',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
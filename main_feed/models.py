@@ -1,8 +1,10 @@
+from django.core.files.storage import default_storage
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
 from LITRevue.settings import AUTH_USER_MODEL
 
-from PIL import Image
+from .storage import ticket_image_storage
+from .validators import validate_image_pixels
 
 
 class Ticket(models.Model):
@@ -15,18 +17,48 @@ class Ticket(models.Model):
         description (TextField): Optional detailed description of the
         ticket (max 2048 characters).
         user (ForeignKey): Reference to the user who created the ticket.
-        image (ImageField): Optional image associated with the ticket.
+        image (ImageField): Optional image associated with the ticket,
+        stored once per distinct content (see main_feed.storage), of at
+        most TICKET_IMAGE_MAX_PIXELS pixels.
         time_created (DateTimeField): Timestamp when the ticket was created.
+        review_count (PositiveIntegerField): Number of reviews of the
+        ticket, maintained by main_feed.signals.
+        image_hash (CharField): SHA-256 of the processed image, empty
+        until processing ends, used to skip images that were already
+        processed and to find the derivatives of a stored image.
+        image_derivatives (JSONField): Metadata of the resized copies of
+        the image (see main_feed.images.RENDITIONS): one dictionary per
+        file with its rendition, density, format, width, height and
+        storage name.
+        image_ready (BooleanField): False while a newly uploaded image
+        waits for processing; templates show a placeholder meanwhile.
+        time_edited (DateTimeField): Timestamp of the last change of the
+        ticket, used as the version of its cached card.
 
     Properties:
         has_review (bool): Returns True if at least one review exists for
         this ticket.
+        picture (dict): The URLs, srcset strings and intrinsic size of
+        the image derivatives, for the <picture> element of the ticket
+        card. None when the image has no derivatives.
 
     Methods:
-        resize_image(): Resizes the associated image to fit within
-        IMAGE_MAX_SIZE.
-        save(*args, **kwargs): Saves the ticket instance and resizes
-        the image if present.
+        store_image(): Stores a newly uploaded image without saving
+        the ticket.
+        save(*args, **kwargs): Saves the ticket instance. When a new
+        image was uploaded, marks it as not ready; main_feed.signals
+        then queues its processing (see main_feed.images) once the
+        transaction commits. The name and hash of the image the ticket
+        had before are kept in 'previous_image_name' and
+        'previous_image_hash' for the reference counting of stored
+        images, done in the same transaction.
+
+    Meta:
+        indexes: (user, -time_created) serves the tickets of a set of
+        users, newest first, as read by the feeds. The partial
+        (-time_created, -id) index of the tickets without a review
+        serves the open tickets page, newest first, without reading
+        the reviewed ones.
     """
     title = models.CharField(max_length=128)
     description = models.TextField(
@@ -36,23 +68,99 @@ class Ticket(models.Model):
         to=AUTH_USER_MODEL,
         on_delete=models.CASCADE
         )
-    image = models.ImageField(null=True, blank=True)
+    image = models.ImageField(
+        null=True, blank=True, storage=ticket_image_storage,
+        validators=[validate_image_pixels]
+        )
     time_created = models.DateTimeField(auto_now_add=True)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    image_hash = models.CharField(
+        max_length=64, blank=True, editable=False, db_index=True
+        )
+    image_ready = models.BooleanField(default=True, editable=False)
+    image_derivatives = models.JSONField(
+        default=list, blank=True, editable=False
+    )
+    time_edited = models.DateTimeField(auto_now=True)
 
+    # Size of the image in the ticket card, in CSS pixels.
     IMAGE_MAX_SIZE = (210, 297)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-time_created"],
+                name="ticket_user_time_idx"
+            ),
+            models.Index(
+                fields=["-time_created", "-id"],
+                condition=models.Q(review_count=0),
+                name="ticket_open_time_idx"
+            ),
+        ]
+
     @property
     def has_review(self):
-        return Review.objects.filter(ticket=self).exists()
+        return self.review_count > 0
+
+    @property
+    def picture(self):
+        if not self.image_derivatives:
+            return None
+        derivatives = sorted(self.image_derivatives, key=lambda d: d["width"])
+        srcsets = {}
+        for derivative in derivatives:
+            srcsets.setdefault(derivative["format"], []).append(
+                f"{default_storage.url(derivative['name'])} "
+                f"{derivative['width']}w"
+            )
+        # The largest JPEG fitting in the card, or the smallest one.
+        jpegs = [d for d in derivatives if d["format"] == "jpeg"]
+        fitting = [d for d in jpegs if d["width"] <= self.IMAGE_MAX_SIZE[0]]
+        fallback = fitting[-1] if fitting else jpegs[0]
+        return {
+            "webp_srcset": ", ".join(srcsets.get("webp", [])),
+            "jpeg_srcset": ", ".join(srcsets.get("jpeg", [])),
+            "src": default_storage.url(fallback["name"]),
+            "width": fallback["width"],
+            "height": fallback["height"],
+        }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "image" in field_names:
+            instance.loaded_image_name = values[field_names.index("image")]
+        return instance
 
-    def resize_image(self):
-        image = Image.open(self.image)
-        image.thumbnail(self.IMAGE_MAX_SIZE)
-        image.save(self.image.path)
+    def store_image(self):
+        """
+        Writes a newly uploaded image to its storage, which saving the
+        ticket would do otherwise, so that the views can copy the file
+        before handing the save to the write queue.
+        """
+        if self.image and not self.image._committed:
+            self.image.save(self.image.name, self.image.file, save=False)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.resize_image()
+        # A file that is not committed yet has just been uploaded, one
+        # with another name was uploaded and stored by store_image().
+        self.previous_image_name = getattr(self, "loaded_image_name", "")
+        self.image_changed = bool(self.image) and (
+            not self.image._committed
+            or self.image.name != self.previous_image_name
+        )
+        self.previous_image_hash = self.image_hash
+        # The hash and the derivatives describe the previous image;
+        # processing the new one sets them again.
+        if self.image_changed or not self.image:
+            self.image_hash = ""
+            self.image_derivatives = []
+        if self.image_changed:
+            self.image_ready = False
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self.loaded_image_name = self.image.name or ""
 
 
 class Review(models.Model):
@@ -68,6 +176,11 @@ class Review(models.Model):
         user (User): The user who wrote the review.
         time_created (datetime): The timestamp when the review
         was created.
+        comment_count (int): Number of comments on the review,
+        maintained by main_feed.signals.
+        time_edited (datetime): Timestamp of the last change of the
+        review or of its comments, used as the version of its cached
+        card.
 
     Properties:
         stars_rating (str): Returns a string of star characters
@@ -76,6 +189,14 @@ class Review(models.Model):
     Methods:
         __str__(): Returns a string representation of the review,
         including its ID and associated ticket title.
+        save(), delete(): Run in a transaction, so that the rating
+        statistics updated by main_feed.signals are written with the
+        review. The rating, ticket and author the review had when
+        loaded are kept in 'loaded_rating' for those updates.
+
+    Meta:
+        indexes: (user, -time_created) serves the reviews of a set of
+        users, newest first, as read by the feeds.
     """
     ticket = models.ForeignKey(
         to=Ticket, on_delete=models.CASCADE
@@ -90,11 +211,43 @@ class Review(models.Model):
         on_delete=models.CASCADE
         )
     time_created = models.DateTimeField(auto_now_add=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    time_edited = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-time_created"],
+                name="review_user_time_idx"
+            ),
+        ]
 
     @property
     def stars_rating(self):
         return "" + "★" * self.rating
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_rating = instance.rating_key()
+        return instance
+
+    def rating_key(self):
+        """
+        Returns the (user_id, ticket_id, rating) the rating
+        statistics of the review are counted under.
+        """
+        return self.user_id, self.ticket_id, self.rating
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self.loaded_rating = self.rating_key()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return (f"Review #{id} - "
                 f"{self.ticket.title if self.ticket else 'No Ticket'}")
@@ -117,6 +270,10 @@ class Comment(models.Model):
         __str__(): Returns a string representation of the
         comment, including its ID, author, and associated
         review.
+
+    Meta:
+        indexes: (review, time_created) serves the comments of a
+        review in chronological order, without sorting them.
     """
     review = models.ForeignKey(
         Review, on_delete=models.CASCADE,
@@ -131,6 +288,260 @@ class Comment(models.Model):
     )
     time_created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["review", "time_created"],
+                name="comment_review_time_idx"
+            ),
+        ]
+
     def __str__(self):
         return (f"Comment #{self.id} par {self.author} "
                 f"sur Review #{self.review.id}")
+
+
+class FeedEntry(models.Model):
+    """
+    Represents one post delivered to the home feed of one user.
+
+    Every ticket and review is copied ("fanned out") into the
+    timeline of its author and of each of their followers when it
+    is written, so reading a home feed is a single range scan on
+    the owner's entries instead of a lookup over the posts of every
+    followed user.
+
+    Attributes:
+        owner (User): The user whose home feed contains the entry.
+        author (User): The user who wrote the post.
+        content_type (str): "TICKET" or "REVIEW".
+        post_id (int): Primary key of the Ticket or Review.
+        time_created (datetime): Creation time of the post, copied
+        so that the timeline can be ordered without a join.
+
+    Meta:
+        constraints: A post is delivered at most once per owner.
+        indexes: The timeline index serves the keyset-paginated
+        home feed, the others serve pruning on unfollow and
+        removal of a deleted post.
+    """
+    CONTENT_TYPES = [
+        ("TICKET", "Billet"),
+        ("REVIEW", "Critique"),
+    ]
+
+    owner = models.ForeignKey(
+        to=AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="feed_entries"
+    )
+    author = models.ForeignKey(
+        to=AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    content_type = models.CharField(max_length=6, choices=CONTENT_TYPES)
+    post_id = models.PositiveBigIntegerField()
+    time_created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "content_type", "post_id"],
+                name="feedentry_unique_post"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=[
+                    "owner", "-time_created", "-content_type", "-post_id"
+                ],
+                name="feedentry_timeline_idx"
+            ),
+            models.Index(
+                fields=["owner", "author"],
+                name="feedentry_owner_author_idx"
+            ),
+            models.Index(
+                fields=["content_type", "post_id"],
+                name="feedentry_post_idx"
+            ),
+        ]
+        verbose_name = "Entrée de fil"
+        verbose_name_plural = "Entrées de fil"
+
+
+class StoredImage(models.Model):
+    """
+    Reference count of a ticket image file.
+
+    Identical uploads share one file (see main_feed.storage), so a
+    file may only be removed when the last ticket using it is deleted
+    or changes its image.
+
+    Attributes:
+        name (str): Storage name of the file.
+        ref_count (int): Number of tickets using the file.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Image stockée"
+        verbose_name_plural = "Images stockées"
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class FollowSuggestion(models.Model):
+    """
+    An account suggested to a user on their followings page,
+    computed offline by the compute_suggestions command (see
+    main_feed.suggestions).
+
+    Attributes:
+        user (User): The user the account is suggested to.
+        suggested (User): The suggested account.
+        score (float): Rank of the suggestion, higher first.
+        mutual_count (int): Number of the user's followees who
+        follow the suggested account.
+        shared_tickets (int): Number of tickets both reviewed.
+
+    Meta:
+        constraints: An account is suggested at most once per user.
+        indexes: (user, -score) serves the suggestions panel.
+    """
+    user = models.ForeignKey(
+        to=AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="follow_suggestions"
+    )
+    suggested = models.ForeignKey(
+        to=AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    shared_tickets = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "suggested"],
+                name="followsuggestion_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-score"],
+                name="followsuggestion_rank_idx"
+            ),
+        ]
+        verbose_name = "Suggestion d'abonnement"
+        verbose_name_plural = "Suggestions d'abonnement"
+
+
+class SuggestionRefresh(models.Model):
+    """
+    Marks a user whose follow suggestions are out of date, because
+    they or one of their followees followed or unfollowed someone,
+    or because they reviewed a ticket. compute_suggestions only
+    recomputes the marked users and removes their marks.
+
+    Attributes:
+        user (User): The user to recompute, primary key.
+        time_requested (datetime): When the last change since the
+        last computation happened.
+    """
+    user = models.OneToOneField(
+        to=AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="+"
+    )
+    time_requested = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Suggestions à recalculer"
+        verbose_name_plural = "Suggestions à recalculer"
+
+
+class RatingStats(models.Model):
+    """
+    Stored summary of a set of review ratings: their number, their
+    sum and how many there are of each rating from 0 to 5.
+
+    Kept up to date with F() expressions by main_feed.signals in the
+    transaction writing the review (see main_feed.rating_stats), so
+    that showing an average or a histogram reads a single row.
+
+    Attributes:
+        count (int): Number of ratings.
+        total (int): Sum of the ratings.
+        r0 ... r5 (int): Number of ratings of each value.
+
+    Properties:
+        average (float): Mean rating, None without ratings.
+        histogram (list): (rating, count) pairs, from 0 to 5.
+    """
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    r0 = models.PositiveIntegerField(default=0)
+    r1 = models.PositiveIntegerField(default=0)
+    r2 = models.PositiveIntegerField(default=0)
+    r3 = models.PositiveIntegerField(default=0)
+    r4 = models.PositiveIntegerField(default=0)
+    r5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average(self):
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    @property
+    def histogram(self):
+        return [(rating, getattr(self, f"r{rating}")) for rating in range(6)]
+
+
+class UserRatingStats(RatingStats):
+    """
+    Summary of the ratings given by a user.
+
+    Attributes:
+        user (User): The author of the reviews, primary key.
+    """
+    user = models.OneToOneField(
+        to=AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating_stats"
+    )
+
+    class Meta:
+        verbose_name = "Statistiques de notes d'un utilisateur"
+        verbose_name_plural = "Statistiques de notes des utilisateurs"
+
+
+class TicketRatingStats(RatingStats):
+    """
+    Summary of the ratings given to a ticket.
+
+    Attributes:
+        ticket (Ticket): The reviewed ticket, primary key.
+    """
+    ticket = models.OneToOneField(
+        to=Ticket,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating_stats"
+    )
+
+    class Meta:
+        verbose_name = "Statistiques de notes d'un billet"
+        verbose_name_plural = "Statistiques de notes des billets"
@@ -0,0 +1,103 @@
+"""
+Rating statistics stored per user and per ticket.
+
+Each review counts once in the UserRatingStats row of its author and
+once in the TicketRatingStats row of its ticket: in 'count', in
+'total' and in the histogram column of its rating. The signal
+receivers of main_feed.signals add a review when it is created,
+move it when its rating, ticket or author changes and remove it when
+it is deleted, with F() expressions, inside the transaction of
+Review.save() and Review.delete().
+
+rebuild() recomputes every row from the reviews, for instance after
+a bulk import that bypassed the signals.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import Review, TicketRatingStats, UserRatingStats
+
+
+RATINGS = range(6)
+
+# (model, field of the review the rows are keyed by)
+STATS = [
+    (UserRatingStats, "user_id"),
+    (TicketRatingStats, "ticket_id"),
+]
+
+
+def apply(key, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) one rating from the statistics
+    of its author and of its ticket.
+
+    Args:
+        key (tuple): (user_id, ticket_id, rating), as returned by
+        Review.rating_key().
+        sign (int): 1 or -1.
+    """
+    user_id, ticket_id, rating = key
+    histogram = f"r{rating}"
+    for (model, _), pk in zip(STATS, (user_id, ticket_id)):
+        rows = model.objects.filter(pk=pk)
+        if sign > 0:
+            model.objects.bulk_create([model(pk=pk)], ignore_conflicts=True)
+        else:
+            # Never below zero, should the row have drifted.
+            rows = rows.filter(count__gte=1, **{f"{histogram}__gte": 1})
+        rows.update(
+            count=F("count") + sign,
+            total=F("total") + sign * rating,
+            **{histogram: F(histogram) + sign},
+        )
+
+
+def move(previous, current):
+    """
+    Moves a rating whose value, ticket or author changed.
+
+    Args:
+        previous (tuple): Key the review was counted under, None for a
+        new review.
+        current (tuple): Key it must now be counted under.
+    """
+    if previous == current:
+        return
+    if previous is not None:
+        apply(previous, -1)
+    apply(current, 1)
+
+
+def rebuild():
+    """
+    Recomputes the statistics of every user and ticket from the
+    reviews, in one transaction.
+
+    Returns:
+        dict: Number of rows written per model name.
+    """
+    aggregates = {
+        "count": Count("pk"),
+        "total": Sum("rating"),
+        **{
+            f"r{rating}": Count("pk", filter=Q(rating=rating))
+            for rating in RATINGS
+        },
+    }
+    written = {}
+    with transaction.atomic():
+        for model, field in STATS:
+            rows = Review.objects.order_by().values(field).annotate(
+                **aggregates
+            )
+            model.objects.all().delete()
+            model.objects.bulk_create(
+                (
+                    model(pk=row.pop(field), **row)
+                    for row in rows.iterator()
+                ),
+                batch_size=1000,
+            )
+            written[model.__name__] = model.objects.count()
+    return written
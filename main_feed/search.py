@@ -0,0 +1,225 @@
+"""
+Full-text search over tickets, reviews and comments.
+
+The main_feed_search FTS5 table (created by migration 0010) indexes
+the title and the text of every post: ticket titles and descriptions,
+review headlines and bodies, comment contents. Triggers on the post
+tables keep it in sync within the transaction that writes the post,
+bulk inserts included.
+
+Each row of the index is identified by its rowid, <post id> * 4 +
+<kind>, and carries the id of the author whose posts it belongs to
+(the author of the review, for a comment). Results are restricted to
+the posts the home feed of the viewer may show: their own and the
+ones of the users they follow.
+
+Matches are ranked with bm25, a title match weighing more than a
+match in the text, and returned with a highlighted excerpt. Pages are
+addressed with a keyset cursor, the (score, rowid) of the last result
+of the previous page, as the feed does.
+"""
+import re
+from dataclasses import dataclass, field
+
+from django.db import connections, router
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .feed import feed_reviews, feed_tickets
+from .models import Comment
+
+
+SEARCH_PAGE_SIZE = 20
+
+TICKET = "TICKET"
+REVIEW = "REVIEW"
+COMMENT = "COMMENT"
+
+# Kind codes of the rowids, see migration 0010.
+KIND_CODES = {TICKET: 1, REVIEW: 2, COMMENT: 3}
+_KINDS = {code: kind for kind, code in KIND_CODES.items()}
+
+# bm25 weights of the title and body columns.
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+EXCERPT_TOKENS = 16
+# Highlight markers put in the excerpts by FTS5, replaced by <mark>
+# once the excerpt is escaped.
+_MARK_START = "\x02"
+_MARK_END = "\x03"
+
+_WORD = re.compile(r"\w+")
+
+SEARCH_SQL = f"""
+SELECT rowid, score, excerpt FROM (
+    SELECT
+        rowid,
+        bm25(main_feed_search, {TITLE_WEIGHT}, {BODY_WEIGHT}) AS score,
+        snippet(main_feed_search, -1, '{_MARK_START}', '{_MARK_END}',
+                '…', {EXCERPT_TOKENS}) AS excerpt
+    FROM main_feed_search
+    WHERE main_feed_search MATCH %s
+      AND (author_id = %s OR author_id IN (
+          SELECT followed_user_id FROM authentication_userfollows
+          WHERE user_id = %s
+      ))
+)
+WHERE score > %s OR (score = %s AND rowid > %s)
+ORDER BY score, rowid
+LIMIT %s
+"""
+
+
+@dataclass(frozen=True)
+class SearchCursor:
+    """
+    Position of a result in the ranking.
+
+    Attributes:
+        score (float): bm25 score of the result, lower is better.
+        rowid (int): Rowid of the result in the index.
+    """
+    score: float
+    rowid: int
+
+    def encode(self):
+        """
+        Returns the cursor as a URL-safe string such as
+        "-3.2202054423998_277".
+        """
+        return f"{self.score!r}_{self.rowid}"
+
+    @classmethod
+    def decode(cls, value):
+        """
+        Parses a string produced by encode().
+
+        Returns:
+            SearchCursor or None: None when the value is missing or
+            malformed, which means "start from the best result".
+        """
+        if not value:
+            return None
+        try:
+            score, rowid = value.rsplit("_", 1)
+            return cls(float(score), int(rowid))
+        except ValueError:
+            return None
+
+
+@dataclass
+class SearchResult:
+    """
+    One matching post.
+
+    Attributes:
+        kind (str): TICKET, REVIEW or COMMENT.
+        post (Model): The Ticket, Review or Comment, with the
+        objects needed to display it.
+        excerpt (str): Safe HTML excerpt of the matching text, the
+        matched terms in <mark> elements.
+        score (float): bm25 score, lower is better.
+    """
+    kind: str
+    post: object
+    excerpt: str
+    score: float
+
+
+@dataclass
+class SearchPage:
+    """
+    One page of search results.
+
+    Attributes:
+        results (list): SearchResult instances, best first.
+        next_cursor (SearchCursor): Cursor of the next page, or None
+        on the last page.
+    """
+    results: list = field(default_factory=list)
+    next_cursor: SearchCursor = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def match_expression(text):
+    """
+    Turns what the user typed into an FTS5 query matching the posts
+    that contain every word, each word also matching as a prefix.
+
+    The words are quoted, so FTS5 operators typed by the user are
+    searched for as plain words.
+
+    Returns:
+        str: The query, empty when the text has no word.
+    """
+    return " ".join(f'"{word}"*' for word in _WORD.findall(text))
+
+
+def _excerpt(snippet):
+    html = escape(snippet)
+    html = html.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+    return mark_safe(html)
+
+
+def _hydrate(rows):
+    ids = {kind: [] for kind in KIND_CODES}
+    for rowid, _, _ in rows:
+        ids[_KINDS[rowid % 4]].append(rowid // 4)
+    querysets = {
+        TICKET: feed_tickets(),
+        REVIEW: feed_reviews(),
+        COMMENT: Comment.objects.select_related("author", "review"),
+    }
+    objects = {
+        kind: querysets[kind].in_bulk(ids[kind]) if ids[kind] else {}
+        for kind in KIND_CODES
+    }
+    results = []
+    for rowid, score, excerpt in rows:
+        kind = _KINDS[rowid % 4]
+        post = objects[kind].get(rowid // 4)
+        if post is None:
+            # Deleted between the two queries.
+            continue
+        results.append(SearchResult(kind, post, _excerpt(excerpt), score))
+    return results
+
+
+def search(viewer_id, text, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    """
+    Returns one page of the posts visible to a user that match a
+    text.
+
+    Args:
+        viewer_id (int): Id of the user searching.
+        text (str): The words to search for.
+        cursor (SearchCursor, optional): Cursor returned with the
+        previous page, None for the first page.
+        page_size (int): Number of results per page.
+
+    Returns:
+        SearchPage: The page of results.
+    """
+    query = match_expression(text)
+    if not query:
+        return SearchPage()
+    if cursor is None:
+        cursor = SearchCursor(float("-inf"), -1)
+    connection = connections[router.db_for_read(Comment)]
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(SEARCH_SQL, [
+            query, viewer_id, viewer_id,
+            cursor.score, cursor.score, cursor.rowid, page_size + 1,
+        ])
+        rows = db_cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        rowid, score, _ = rows[-1]
+        next_cursor = SearchCursor(score, rowid)
+    return SearchPage(results=_hydrate(rows), next_cursor=next_cursor)
@@ -0,0 +1,192 @@
+"""
+Signal receivers keeping the data derived from tickets, reviews,
+comments and follows up to date: home feed timelines, denormalized
+counters, rating statistics, cached card fragments, processed images
+and follow suggestions.
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from authentication.models import UserFollows
+from . import fanout, rating_stats
+from .counters import increment
+from .feed import REVIEW, TICKET
+from .images import process_ticket_image, release_image, retain_image
+from .models import Comment, Review, Ticket
+from .suggestions import mark_for_refresh
+from .tasks import enqueue
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_save, sender=Review)
+def deliver_post(sender, instance, created, **kwargs):
+    """
+    Adds a new ticket or review to the timeline of its author, then
+    fans it out to the timelines of their followers.
+    """
+    if created:
+        content_type = TICKET if sender is Ticket else REVIEW
+        fanout.deliver_to_author(content_type, instance)
+        enqueue(fanout.fan_out_post, content_type, instance.pk)
+
+
+@receiver(post_save, sender=Ticket)
+def queue_image_processing(sender, instance, **kwargs):
+    """
+    Processes a newly uploaded ticket image in the background.
+    """
+    if getattr(instance, "image_changed", False):
+        enqueue(process_ticket_image, instance.pk)
+
+
+@receiver(post_save, sender=Ticket)
+def count_image_reference(sender, instance, **kwargs):
+    """
+    Updates the reference counts of stored images when a ticket gets,
+    replaces or loses its image.
+    """
+    previous = getattr(instance, "previous_image_name", "") or ""
+    current = instance.image.name or ""
+    if previous != current:
+        if current:
+            retain_image(current)
+        if previous:
+            release_image(previous, instance.previous_image_hash)
+
+
+@receiver(post_delete, sender=Ticket)
+def release_image_reference(sender, instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name, instance.image_hash)
+
+
+@receiver(post_delete, sender=Ticket)
+@receiver(post_delete, sender=Review)
+def withdraw_post(sender, instance, **kwargs):
+    """
+    Removes a deleted ticket or review from every timeline.
+    """
+    content_type = TICKET if sender is Ticket else REVIEW
+    fanout.remove_post(content_type, instance.pk)
+
+
+@receiver(post_save, sender=UserFollows)
+def backfill_timeline(sender, instance, created, **kwargs):
+    """
+    Adds the posts of a newly followed user to the follower's
+    timeline.
+    """
+    if created:
+        enqueue(fanout.backfill, instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_delete, sender=UserFollows)
+def prune_timeline(sender, instance, **kwargs):
+    """
+    Removes the posts of an unfollowed user from the timeline of
+    their former follower, in the transaction deleting the follow.
+    """
+    fanout.prune(instance.user_id, instance.followed_user_id)
+
+
+@receiver(post_delete, sender=UserFollows)
+def push_demoted_posts(sender, instance, **kwargs):
+    """
+    Pushes the posts of a popular user to their followers once an
+    unfollow brings them back to FEED_FANOUT_MAX_FOLLOWERS. The
+    followers are counted, up to one more than the threshold, rather
+    than read from the counter, which the receivers of
+    authentication.signals may not have updated yet.
+    """
+    threshold = settings.FEED_FANOUT_MAX_FOLLOWERS
+    followers = UserFollows.objects.filter(
+        followed_user_id=instance.followed_user_id
+    )[:threshold + 1].count()
+    if followers == threshold:
+        enqueue(fanout.push_after_demotion, instance.followed_user_id)
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    if created:
+        increment(Ticket, instance.ticket_id, "review_count", 1)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    increment(Ticket, instance.ticket_id, "review_count", -1)
+
+
+@receiver(post_save, sender=Review)
+def count_rating(sender, instance, created, **kwargs):
+    """
+    Counts a new review in the rating statistics of its author and
+    ticket, or moves a changed one. A review saved without having
+    been loaded is left to rebuild_rating_stats.
+    """
+    if created:
+        rating_stats.move(None, instance.rating_key())
+    elif hasattr(instance, "loaded_rating"):
+        rating_stats.move(instance.loaded_rating, instance.rating_key())
+
+
+@receiver(post_delete, sender=Review)
+def uncount_rating(sender, instance, **kwargs):
+    key = getattr(instance, "loaded_rating", None) or instance.rating_key()
+    rating_stats.apply(key, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        increment(Review, instance.review_id, "comment_count", 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    increment(Review, instance.review_id, "comment_count", -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_commented_review(sender, instance, **kwargs):
+    """
+    Gives the commented review a new version, which invalidates its
+    cached card.
+    """
+    Review.objects.filter(pk=instance.review_id).update(
+        time_edited=timezone.now()
+    )
+
+
+def mark_followers_for_refresh(user_id):
+    # Not the follow graph cache, which may lag behind.
+    mark_for_refresh(UserFollows.objects.filter(
+        followed_user_id=user_id
+    ).values_list("user_id", flat=True))
+
+
+@receiver(post_save, sender=UserFollows)
+@receiver(post_delete, sender=UserFollows)
+def refresh_follow_suggestions(sender, instance, **kwargs):
+    """
+    Marks for recomputation the suggestions of a user who followed
+    or unfollowed someone, and, in the background, of their
+    followers, whose friends of friends changed.
+    """
+    if kwargs.get("created", True):
+        mark_for_refresh([instance.user_id])
+        enqueue(mark_followers_for_refresh, instance.user_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_taste_suggestions(sender, instance, **kwargs):
+    """
+    Marks for recomputation the suggestions of a user who rated a
+    ticket. The users who rated the same ticket are left to the
+    periodic full recomputation.
+    """
+    mark_for_refresh([instance.user_id])
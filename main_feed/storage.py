@@ -0,0 +1,71 @@
+"""
+Content-addressed storage of the images uploaded with tickets.
+
+An upload is hashed while it is streamed to disk and stored under its
+SHA-256 digest, e.g. "originals/ab/abcdef....jpg". Uploading a file
+that is already stored does not create a copy: the existing name is
+returned, and the derivatives built from it (see main_feed.images)
+are shared as well. StoredImage rows count the tickets using each
+file, so that it is only removed with the last of them.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage, storages
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage naming files after the SHA-256 of their content.
+
+    The name requested by the caller only provides the extension.
+    """
+    directory = "originals"
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal contents: no need for a free name.
+        return name
+
+    def content_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f"{self.directory}/{digest[:2]}/{digest}{extension}"
+
+    def _save(self, name, content):
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.location, prefix=".upload-"
+        )
+        try:
+            with os.fdopen(descriptor, "wb") as temporary:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temporary.write(chunk)
+
+            name = self.content_name(digest.hexdigest(), name)
+            path = self.path(name)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temporary_path, self.file_permissions_mode)
+                os.replace(temporary_path, path)
+            else:
+                # Protects the file from main_feed.media_gc, and from
+                # the release of its last reference, until the ticket
+                # using it again is committed.
+                os.utime(path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return name
+
+
+def ticket_image_storage():
+    """
+    Returns the storage of ticket images, configured by the
+    "ticket_images" entry of the STORAGES setting.
+    """
+    return storages["ticket_images"]
@@ -0,0 +1,65 @@
+"""
+Small in-process task queue for the work that does not need to
+happen inside the request, such as delivering a new post to the
+timelines of its followers.
+
+Tasks are only submitted once the surrounding transaction commits,
+so a worker never sees a row that could still be rolled back. They
+run on a bounded thread pool whose size is BACKGROUND_TASK_WORKERS.
+With BACKGROUND_TASKS_EAGER enabled (tests, management commands),
+they run synchronously when the transaction commits instead.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASK_WORKERS,
+                thread_name_prefix="main_feed-task"
+            )
+        return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", func.__qualname__)
+    finally:
+        # Database connections are per thread: close the ones of this
+        # worker unless they are persistent (CONN_MAX_AGE) and usable,
+        # as Django does at the end of each request.
+        close_old_connections()
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Schedules func(*args, **kwargs) to run in the background once
+    the current transaction is committed (immediately when there is
+    no transaction in progress).
+
+    Args:
+        func (callable): The task. Its arguments should be plain
+        values such as ids, not model instances.
+    """
+    def submit():
+        if settings.BACKGROUND_TASKS_EAGER:
+            func(*args, **kwargs)
+        else:
+            _get_executor().submit(_run, func, args, kwargs)
+
+    transaction.on_commit(submit)
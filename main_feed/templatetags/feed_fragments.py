@@ -0,0 +1,33 @@
+from django import template
+
+from main_feed import fragments
+
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def ticket_fragment(context, ticket):
+    """
+    Renders a ticket card through the fragment cache. The per-viewer
+    buttons follow the 'update' and 'review_creation_context'
+    variables of the including template.
+    """
+    return fragments.render_ticket(
+        ticket,
+        update=bool(context.get("update")),
+        review_creation_context=bool(
+            context.get("review_creation_context")
+        ),
+    )
+
+
+@register.simple_tag(takes_context=True)
+def review_fragment(context, review):
+    """
+    Renders a review card through the fragment cache. The per-viewer
+    links follow the 'update' variable of the including template.
+    """
+    return fragments.render_review(
+        review, update=bool(context.get("update"))
+    )
@@ -1,3 +1,1505 @@
-# from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from array import array
+from collections import Counter
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageCms
+
+from authentication import graph
+from authentication.models import User, UserFollows
+from .benchmarks import measure_requests
+from .bulk_load import Loader
+from .counters import increment
+from .datasets import DatasetSize, generate
+from . import fanout, fragments, signals
+from .fanout import rebuild_timeline
+from .feed import (
+    REVIEW, FeedCursor, get_feed_page, get_timeline_page, merge_keys
+)
+from .forms import TicketForm
+from .images import (
+    RELEASED_IMAGE_MIN_AGE, build_derivatives, derivative_dir,
+    derivatives_exist, file_digest, open_image, process_ticket_image
+)
+from .media_gc import delete_orphans, find_orphans, walk_media
+from .models import (
+    Comment, FeedEntry, FollowSuggestion, Review, StoredImage,
+    SuggestionRefresh, Ticket, TicketRatingStats, UserRatingStats
+)
+from .rating_stats import rebuild
+from .search import SearchCursor, search
+from .storage import ContentAddressedStorage, ticket_image_storage
+from .suggestions import (
+    SuggestionGraph, mark_for_refresh, refresh_suggestions
+)
+from .views import SUGGESTIONS_SHOWN, FeedPageMixin
+
+
+class FeedDataMixin:
+    """
+    Helpers creating a reader who follows an author, and posts
+    written by both of them.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username="reader", password="azerty123"
+        )
+        cls.author = User.objects.create_user(
+            username="critique", password="azerty123"
+        )
+        UserFollows.objects.create(
+            user=cls.reader, followed_user=cls.author
+        )
+
+    def create_posts(self, count):
+        """
+        Creates 'count' tickets and 'count' reviews, alternating
+        between the reader and the author, half of the tickets
+        being reviewed.
+        """
+        users = [self.reader, self.author]
+        tickets = Ticket.objects.bulk_create(
+            Ticket(title=f"Livre {n}", user=users[n % 2])
+            for n in range(2 * count)
+        )
+        reviews = [
+            Review.objects.create(
+                ticket=ticket, rating=n % 6, headline=f"Critique {n}",
+                user=users[n % 2]
+            )
+            for n, ticket in enumerate(tickets[:count])
+        ]
+        rebuild_timeline(self.reader.id)
+        return tickets, reviews
+
+
+class QueryBudgetTests(FeedDataMixin, TestCase):
+    """
+    The feed pages must run a fixed number of queries, whatever the
+    number of posts they display.
+
+    Budgets include the session and the user lookups done by the
+    authentication middleware. The follow graph is never cached
+    inside the test transaction, so the home feed also reads the
+    reader's followees.
+    """
+    HOME_QUERIES = 7
+    POSTS_QUERIES = 5
+    OPEN_TICKETS_QUERIES = 4
+    REVIEW_DETAIL_QUERIES = 4
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def assertConstantQueries(self, budget, url):
+        for count in (1, 8):
+            with self.subTest(new_posts=count):
+                self.create_posts(count)
+                with self.assertNumQueries(budget):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_home_feed(self):
+        self.assertConstantQueries(self.HOME_QUERIES, reverse("homepage"))
+
+    def test_posts(self):
+        self.assertConstantQueries(self.POSTS_QUERIES, reverse("posts"))
+
+    def test_open_tickets(self):
+        self.assertConstantQueries(
+            self.OPEN_TICKETS_QUERIES, reverse("open_tickets")
+        )
+
+    def test_review_detail(self):
+        _, reviews = self.create_posts(1)
+        review = reviews[0]
+        url = reverse("review_detail", args=[review.id])
+        for count in (1, 10):
+            with self.subTest(comments=count):
+                Comment.objects.bulk_create(
+                    Comment(review=review, author=self.author,
+                            content=f"Commentaire {n}")
+                    for n in range(count)
+                )
+                with self.assertNumQueries(self.REVIEW_DETAIL_QUERIES):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite's")
+class IndexUsageTests(FeedDataMixin, TestCase):
+    """
+    The main query of each page must be served by the index matching
+    its filter and ordering, so that a dropped or reordered index
+    fails the build instead of turning into a table scan.
+    """
+    def setUp(self):
+        self.client.force_login(self.reader)
+        _, self.reviews = self.create_posts(4)
+
+    def query_plans(self, url, marker):
+        """
+        Requests url and returns the query plans of the queries it
+        ran whose SQL contains 'marker'.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if marker in query["sql"]:
+                    cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                    plans.append(
+                        "\n".join(row[-1] for row in cursor.fetchall())
+                    )
+        self.assertTrue(plans, f"No query containing {marker!r}.")
+        return plans
+
+    def assertPostIndexes(self, plan):
+        self.assertIn("USING COVERING INDEX ticket_user_time_idx", plan)
+        self.assertIn("USING COVERING INDEX review_user_time_idx", plan)
+
+    def test_posts(self):
+        plan, = self.query_plans(reverse("posts"), "UNION ALL")
+        self.assertPostIndexes(plan)
+
+    def test_home_feed_timeline(self):
+        plan, = self.query_plans(
+            reverse("homepage"), 'FROM "main_feed_feedentry"'
+        )
+        self.assertIn("USING COVERING INDEX feedentry_timeline_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_home_feed_popular_authors(self):
+        plan, = self.query_plans(reverse("homepage"), "UNION ALL")
+        self.assertPostIndexes(plan)
+
+    def test_open_tickets(self):
+        plan, = self.query_plans(
+            reverse("open_tickets"), '"main_feed_ticket"."review_count" ='
+        )
+        self.assertIn("USING INDEX ticket_open_time_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertNotIn("main_feed_review", plan)
+
+    def test_review_detail_comments(self):
+        review = self.reviews[0]
+        Comment.objects.bulk_create(
+            Comment(review=review, author=self.author, content=f"{n}")
+            for n in range(3)
+        )
+        plan, = self.query_plans(
+            reverse("review_detail", args=[review.id]),
+            'FROM "main_feed_comment"'
+        )
+        self.assertIn("USING INDEX comment_review_time_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class FanoutTests(FeedDataMixin, TestCase):
+    """
+    Posts reach the timelines of their author and of the author's
+    followers, follows backfill and unfollows prune them, and a
+    background write running after an unfollow leaves nothing behind.
+    """
+    def setUp(self):
+        self.stranger = User.objects.create_user(
+            username="inconnu", password="azerty123"
+        )
+
+    def timeline(self, user):
+        return set(FeedEntry.objects.filter(owner=user).values_list(
+            "content_type", "post_id"
+        ))
+
+    def post(self, user, title="Livre"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ticket.objects.create(title=title, user=user)
+
+    def test_posts_reach_the_followers(self):
+        ticket = self.post(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(
+                ticket=ticket, rating=3, headline="Avis", user=self.author
+            )
+        expected = {("TICKET", ticket.id), ("REVIEW", review.id)}
+        self.assertEqual(self.timeline(self.author), expected)
+        self.assertEqual(self.timeline(self.reader), expected)
+        self.assertEqual(self.timeline(self.stranger), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertEqual(self.timeline(self.reader), {("TICKET", ticket.id)})
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_own_post_is_delivered_before_the_fan_out(self):
+        # The fan-out task is never run: the transaction is not
+        # committed.
+        ticket = Ticket.objects.create(title="Livre", user=self.author)
+        self.assertEqual(self.timeline(self.author), {("TICKET", ticket.id)})
+        self.assertEqual(self.timeline(self.reader), set())
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        ticket = self.post(self.stranger)
+        with self.captureOnCommitCallbacks(execute=True):
+            follow = UserFollows.objects.create(
+                user=self.reader, followed_user=self.stranger
+            )
+        self.assertEqual(self.timeline(self.reader), {("TICKET", ticket.id)})
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        self.assertEqual(self.timeline(self.reader), set())
+
+    def test_late_background_writes_after_an_unfollow(self):
+        ticket = Ticket.objects.create(title="Livre", user=self.author)
+        UserFollows.objects.filter(
+            user=self.reader, followed_user=self.author
+        ).delete()
+        # The backfill and the fan-out queued before the unfollow run
+        # after it.
+        self.assertEqual(fanout.backfill(self.reader.id, self.author.id), 0)
+        self.assertEqual(fanout.fan_out_post("TICKET", ticket.id), 0)
+        self.assertEqual(self.timeline(self.reader), set())
+
+    def test_writes_do_not_read_the_follow_graph_cache(self):
+        ticket = self.post(self.author)
+        # A cached list from before the follow.
+        with mock.patch.object(graph.graph, "ids", return_value=array("q")):
+            rebuild_timeline(self.reader.id)
+            with self.captureOnCommitCallbacks(execute=True):
+                SuggestionRefresh.objects.all().delete()
+                UserFollows.objects.create(
+                    user=self.author, followed_user=self.stranger
+                )
+        self.assertIn(("TICKET", ticket.id), self.timeline(self.reader))
+        self.assertTrue(
+            SuggestionRefresh.objects.filter(user=self.reader).exists()
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_popular_authors_are_pulled_until_demoted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            follow = UserFollows.objects.create(
+                user=self.stranger, followed_user=self.author
+            )
+        ticket = self.post(self.author)
+        key = ("TICKET", ticket.id)
+        self.assertNotIn(key, self.timeline(self.reader))
+        page = get_timeline_page(self.reader.id)
+        self.assertEqual(page.posts, [ticket])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            follow.delete()
+        self.assertIn(key, self.timeline(self.reader))
+        page = get_timeline_page(self.reader.id)
+        self.assertEqual(page.posts, [ticket])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_demotion_does_not_read_the_counter(self):
+        follow = UserFollows.objects.create(
+            user=self.stranger, followed_user=self.author
+        )
+        ticket = self.post(self.author)
+        # As if the counter was updated after the receivers of
+        # main_feed ran.
+        User.objects.filter(pk=self.author.pk).update(follower_count=5)
+        with mock.patch.object(signals, "enqueue") as enqueue:
+            follow.delete()
+        enqueue.assert_any_call(fanout.push_after_demotion, self.author.pk)
+        User.objects.filter(pk=self.author.pk).update(follower_count=1)
+        self.assertEqual(fanout.push_after_demotion(self.author.pk), 1)
+        self.assertIn(("TICKET", ticket.id), self.timeline(self.reader))
+
+    def test_merge_keys_drops_duplicates(self):
+        now = timezone.now()
+
+        def keys(*posts):
+            return [
+                {"time_created": now - timedelta(minutes=age),
+                 "content_type": content_type, "post_id": post_id}
+                for age, content_type, post_id in posts
+            ]
+
+        inbox = keys((0, "TICKET", 3), (2, "REVIEW", 1), (4, "TICKET", 1))
+        pulled = keys((0, "TICKET", 3), (1, "TICKET", 2), (2, "REVIEW", 1))
+        merged = merge_keys([inbox, pulled], 10)
+        self.assertEqual(
+            [(key["content_type"], key["post_id"]) for key in merged],
+            [("TICKET", 3), ("TICKET", 2), ("REVIEW", 1), ("TICKET", 1)],
+        )
+        self.assertEqual(len(merge_keys([inbox, pulled], 2)), 2)
+
+    def test_rebuild_feeds(self):
+        mine = self.post(self.reader)
+        followed = self.post(self.author)
+        self.post(self.stranger)
+        FeedEntry.objects.all().delete()
+        call_command("rebuild_feeds", stdout=io.StringIO())
+        self.assertEqual(
+            self.timeline(self.reader),
+            {("TICKET", mine.id), ("TICKET", followed.id)},
+        )
+        self.assertEqual(self.timeline(self.author), {("TICKET", followed.id)})
+
+        FeedEntry.objects.all().delete()
+        call_command(
+            "rebuild_feeds", usernames=["critique"], stdout=io.StringIO()
+        )
+        self.assertEqual(self.timeline(self.reader), set())
+        with self.assertRaises(CommandError):
+            call_command("rebuild_feeds", usernames=["personne"])
+
+
+class FeedPaginationTests(FeedDataMixin, TestCase):
+    """
+    Keyset cursors survive a round trip through the "before" query
+    parameter, and following the "older posts" links returns every
+    post exactly once, posts created at the same time included.
+    """
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_cursor_round_trip(self):
+        cursor = FeedCursor(timezone.now(), REVIEW, 42)
+        self.assertEqual(FeedCursor.decode(cursor.encode()), cursor)
+
+    def test_bad_cursors_start_from_the_newest_post(self):
+        for value in ("", "abc", "1_TICKET", "x_TICKET_1", "1_TICKET_x",
+                      "1_COMMENT_1", "99999999999999999999_TICKET_1"):
+            with self.subTest(value=value):
+                self.assertIsNone(FeedCursor.decode(value))
+        self.create_posts(1)
+        response = self.client.get(reverse("posts"), {"before": "abc"})
+        self.assertEqual(len(response.context["object_list"]), 2)
+
+    def test_equal_times_are_ordered_by_type_then_id(self):
+        tickets, reviews = self.create_posts(3)
+        moment = timezone.now()
+        Ticket.objects.update(time_created=moment)
+        Review.objects.update(time_created=moment)
+        seen = []
+        cursor = None
+        while True:
+            page = get_feed_page(
+                [self.reader.id, self.author.id], cursor, page_size=2
+            )
+            seen += [(post.content_type, post.id) for post in page.posts]
+            if not page.has_next:
+                break
+            cursor = FeedCursor.decode(page.next_cursor.encode())
+        self.assertEqual(
+            seen,
+            [("TICKET", ticket.id) for ticket in reversed(tickets)]
+            + [("REVIEW", review.id) for review in reversed(reviews)],
+        )
+
+    @mock.patch.object(FeedPageMixin, "page_size", 4)
+    def test_older_posts_links_cover_every_post_once(self):
+        tickets, reviews = self.create_posts(5)
+        # Most posts share their creation time.
+        moment = timezone.now()
+        Ticket.objects.filter(pk__in=[t.pk for t in tickets[:6]]).update(
+            time_created=moment
+        )
+        Review.objects.filter(pk__in=[r.pk for r in reviews[:3]]).update(
+            time_created=moment
+        )
+        rebuild_timeline(self.reader.id)
+        posts = [("TICKET", t) for t in tickets] + [
+            ("REVIEW", r) for r in reviews
+        ]
+        for url, authors in ((reverse("homepage"), (self.reader, self.author)),
+                             (reverse("posts"), (self.reader,))):
+            with self.subTest(url=url):
+                seen = []
+                before = ""
+                while True:
+                    response = self.client.get(url, {"before": before})
+                    page = response.context["object_list"]
+                    self.assertLessEqual(len(page), 4)
+                    seen += [(post.content_type, post.id) for post in page]
+                    before = response.context["next_cursor"]
+                    if not before:
+                        break
+                    self.assertContains(response, f"?before={before}")
+                self.assertCountEqual(seen, [
+                    (content_type, post.id) for content_type, post in posts
+                    if post.user in authors
+                ])
+
+
+@skipUnless(connection.vendor == "sqlite", "The search index uses FTS5")
+class SearchTests(FeedDataMixin, TestCase):
+    """
+    The full-text index follows the posts through the triggers, and
+    search results are ranked, highlighted, paginated and limited to
+    the posts the viewer may see.
+    """
+    def setUp(self):
+        self.client.force_login(self.reader)
+        self.stranger = User.objects.create_user(
+            username="inconnu", password="azerty123"
+        )
+
+    def found(self, text, viewer=None):
+        viewer = viewer or self.reader
+        return [
+            (result.kind, result.post.id)
+            for result in search(viewer.id, text, page_size=100).results
+        ]
+
+    def test_index_follows_the_posts(self):
+        ticket = Ticket.objects.create(
+            title="Les Misérables", description="Un forçat", user=self.author
+        )
+        review = Review.objects.create(
+            ticket=ticket, rating=5, headline="Immense",
+            body="Jean Valjean", user=self.author,
+        )
+        comment = Comment.objects.create(
+            review=review, author=self.reader, content="Et Javert ?"
+        )
+        # Accents are ignored and words match as prefixes.
+        self.assertEqual(self.found("miserab"), [("TICKET", ticket.id)])
+        self.assertEqual(self.found("valjean"), [("REVIEW", review.id)])
+        self.assertEqual(self.found("javert"), [("COMMENT", comment.id)])
+
+        ticket.title = "Notre-Dame de Paris"
+        ticket.save()
+        self.assertEqual(self.found("miserables"), [])
+        self.assertEqual(self.found("notre dame"), [("TICKET", ticket.id)])
+        review.delete()
+        self.assertEqual(self.found("valjean"), [])
+        self.assertEqual(self.found("javert"), [])
+
+    def test_only_visible_posts_are_found(self):
+        mine = Ticket.objects.create(title="Dune", user=self.reader)
+        followed = Ticket.objects.create(title="Dune", user=self.author)
+        Ticket.objects.create(title="Dune", user=self.stranger)
+        self.assertCountEqual(
+            self.found("dune"),
+            [("TICKET", mine.id), ("TICKET", followed.id)],
+        )
+
+    def test_title_matches_rank_first(self):
+        in_body = Ticket.objects.create(
+            title="Roman", description="Une lecture sur Proust",
+            user=self.author,
+        )
+        in_title = Ticket.objects.create(title="Proust", user=self.author)
+        self.assertEqual(
+            self.found("proust"),
+            [("TICKET", in_title.id), ("TICKET", in_body.id)],
+        )
+
+    def test_pages_cover_every_result_once(self):
+        Ticket.objects.bulk_create(
+            Ticket(title=f"Fondation {n}", description="Asimov " * (n % 3),
+                   user=self.author)
+            for n in range(7)
+        )
+        seen = []
+        cursor = None
+        while True:
+            page = search(self.reader.id, "fondation asimov", cursor, 2)
+            seen += [result.post.id for result in page.results]
+            if not page.has_next:
+                break
+            cursor = SearchCursor.decode(page.next_cursor.encode())
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(len(set(seen)), 4)
+
+    def test_operators_are_searched_as_words(self):
+        Ticket.objects.create(title="Ni OR ni NEAR", user=self.author)
+        self.assertEqual(len(self.found('OR "NEAR(')), 1)
+        self.assertEqual(self.found("***"), [])
+
+    def test_api_highlights_escaped_excerpts(self):
+        ticket = Ticket.objects.create(
+            title="<b>Kafka</b>", description="Le Procès", user=self.author
+        )
+        response = self.client.get(reverse("search_api"), {"q": "kafka"})
+        self.assertEqual(response.status_code, 200)
+        result, = response.json()["results"]
+        self.assertEqual(result["type"], "TICKET")
+        self.assertEqual(result["id"], ticket.id)
+        self.assertEqual(
+            result["excerpt"], "&lt;b&gt;<mark>Kafka</mark>&lt;/b&gt;"
+        )
+        self.assertIsNone(response.json()["next"])
+        self.assertEqual(
+            self.client.get(reverse("search_api")).status_code, 400
+        )
+
+    def test_search_page(self):
+        Ticket.objects.create(title="Le Horla", user=self.author)
+        response = self.client.get(reverse("search"), {"q": "horla"})
+        self.assertContains(response, "<mark>Horla</mark>", html=False)
+
+
+class OpenTicketsTests(FeedDataMixin, TestCase):
+    """
+    The open tickets page lists the other users' tickets without a
+    review, and follows reviews being written and deleted.
+    """
+    def test_reviews_open_and_close_tickets(self):
+        self.client.force_login(self.reader)
+        mine = Ticket.objects.create(title="Le mien", user=self.reader)
+        first, second = (
+            Ticket.objects.create(title=f"Livre {n}", user=self.author)
+            for n in range(2)
+        )
+
+        def listed():
+            response = self.client.get(reverse("open_tickets"))
+            return [ticket.id for ticket in response.context["tickets"]]
+
+        self.assertEqual(listed(), [second.id, first.id])
+        review = Review.objects.create(
+            ticket=second, rating=3, headline="Avis", user=self.reader
+        )
+        self.assertEqual(listed(), [first.id])
+        review.delete()
+        self.assertEqual(listed(), [second.id, first.id])
+        self.assertNotIn(mine.id, listed())
+
+
+class CounterTests(FeedDataMixin, TestCase):
+    """
+    The denormalized counters follow the reviews, comments and follows
+    being created and deleted, and reconcile_counters repairs them.
+    """
+    def counts(self, ticket, review):
+        ticket.refresh_from_db()
+        review.refresh_from_db()
+        self.reader.refresh_from_db()
+        self.author.refresh_from_db()
+        return (
+            ticket.review_count, review.comment_count,
+            self.author.follower_count, self.reader.following_count,
+        )
+
+    def test_signals_update_the_counters(self):
+        tickets, reviews = self.create_posts(1)
+        ticket, review = tickets[0], reviews[0]
+        comment = Comment.objects.create(
+            review=review, author=self.reader, content="Oui"
+        )
+        self.assertEqual(self.counts(ticket, review), (1, 1, 1, 1))
+
+        comment.delete()
+        UserFollows.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.counts(ticket, review), (1, 0, 0, 0))
+        review.delete()
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.review_count, 0)
+
+    def test_counters_never_go_below_zero(self):
+        ticket = Ticket.objects.create(title="Livre", user=self.author)
+        increment(Ticket, ticket.pk, "review_count", -1)
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.review_count, 0)
+
+    def test_reconcile_counters(self):
+        tickets, reviews = self.create_posts(1)
+        ticket, review = tickets[0], reviews[0]
+        Comment.objects.create(
+            review=review, author=self.reader, content="Oui"
+        )
+        Ticket.objects.filter(pk=ticket.pk).update(review_count=5)
+        Review.objects.filter(pk=review.pk).update(comment_count=0)
+        User.objects.filter(pk=self.author.pk).update(follower_count=0)
+
+        output = io.StringIO()
+        call_command("reconcile_counters", dry_run=True, stdout=output)
+        self.assertIn("Ticket.review_count : 1 ligne(s) en écart",
+                      output.getvalue())
+        self.assertIn("User.following_count : aucun écart",
+                      output.getvalue())
+        self.assertEqual(self.counts(ticket, review), (5, 0, 0, 1))
+
+        call_command("reconcile_counters", stdout=io.StringIO())
+        self.assertEqual(self.counts(ticket, review), (1, 1, 1, 1))
+
+    def test_drifted_counter_does_not_allow_a_second_review(self):
+        tickets, reviews = self.create_posts(1)
+        ticket = tickets[0]
+        Ticket.objects.filter(pk=ticket.pk).update(review_count=0)
+        self.client.force_login(self.reader)
+        url = reverse("create_review_from_ticket", args=[ticket.pk])
+        self.assertRedirects(self.client.get(url), reverse("homepage"))
+        response = self.client.post(url, {
+            "headline": "Encore", "body": "Texte", "rating": 3,
+            "update_review": True,
+        })
+        self.assertRedirects(response, reverse("homepage"))
+        self.assertEqual(ticket.review_set.count(), 1)
+
+    def test_review_published_meanwhile_is_reported(self):
+        ticket = Ticket.objects.create(title="Livre", user=self.author)
+        self.client.force_login(self.reader)
+        url = reverse("create_review_from_ticket", args=[ticket.pk])
+
+        def publish_first(func):
+            # Another review saved between the two checks.
+            Review.objects.create(
+                ticket=ticket, rating=1, headline="Avant", user=self.author
+            )
+            return func()
+
+        with mock.patch("main_feed.views.run_write",
+                        side_effect=publish_first):
+            response = self.client.post(url, {
+                "headline": "Après", "body": "Texte", "rating": 3,
+                "update_review": True,
+            })
+        self.assertContains(
+            response, "Une critique de ce billet vient d&#x27;être publiée."
+        )
+        self.assertEqual(
+            list(ticket.review_set.values_list("headline", flat=True)),
+            ["Avant"],
+        )
+
+
+class FragmentTests(FeedDataMixin, TestCase):
+    """
+    Cards are rendered once per version and author name, and the
+    per-viewer links are spliced into the cached HTML.
+    """
+    def setUp(self):
+        cache.clear()
+        fragments.stats.reset()
+        self.addCleanup(cache.clear)
+        tickets, reviews = self.create_posts(1)
+        self.ticket = tickets[0]
+        self.review = Review.objects.select_related(
+            "user", "ticket__user"
+        ).get(pk=reviews[0].pk)
+
+    def lookups(self, kind):
+        counts = fragments.stats.snapshot()[kind]
+        return counts["hits"], counts["misses"]
+
+    def test_hits_and_misses(self):
+        fragments.render_ticket(self.ticket)
+        fragments.render_ticket(self.ticket)
+        self.assertEqual(self.lookups(fragments.TICKET), (1, 1))
+        fragments.render_review(self.review)
+        fragments.render_review(self.review)
+        self.assertEqual(self.lookups(fragments.REVIEW), (1, 1))
+        self.assertEqual(self.lookups(fragments.TICKET), (3, 1))
+
+    def test_edit_invalidates_the_card(self):
+        fragments.render_review(self.review)
+        self.review.headline = "Nouveau titre"
+        self.review.save()
+        html = fragments.render_review(self.review)
+        self.assertIn("Nouveau titre", html)
+        self.assertEqual(self.lookups(fragments.REVIEW), (0, 2))
+
+    def test_rename_invalidates_the_cards(self):
+        self.assertIn("par reader", fragments.render_ticket(self.ticket))
+        self.reader.username = "lectrice"
+        self.reader.save()
+        ticket = Ticket.objects.select_related("user").get(pk=self.ticket.pk)
+        html = fragments.render_ticket(ticket)
+        self.assertIn("par lectrice", html)
+        self.assertNotIn("par reader", html)
+
+    def test_viewer_links_are_spliced(self):
+        edit = reverse("update_review", args=[self.review.pk])
+        own = fragments.render_review(self.review, update=True)
+        other = fragments.render_review(self.review)
+        self.assertEqual(self.lookups(fragments.REVIEW), (1, 1))
+        self.assertIn(edit, own)
+        self.assertNotIn(edit, other)
+        for html in (own, other):
+            self.assertNotIn(fragments.ACTIONS_SLOT, html)
+            self.assertNotIn(fragments.TICKET_SLOT, html)
+            self.assertIn(self.review.ticket.title, html)
+            self.assertIn(self.review.headline, html)
+
+
+class MediaFilesMixin:
+    """
+    Stores the media files of each test in a temporary MEDIA_ROOT, and
+    creates small images in memory.
+    """
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    @staticmethod
+    def image_bytes(size=(300, 400), color="red", image_format="JPEG",
+                    **options):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, color).save(buffer, image_format, **options)
+        return buffer.getvalue()
+
+    def image_file(self, name="couverture.jpg", **kwargs):
+        return SimpleUploadedFile(
+            name, self.image_bytes(**kwargs), content_type="image/jpeg"
+        )
+
+    def media_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media_root)
+            for directory, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+
+class ImageProcessingTests(MediaFilesMixin, FeedDataMixin, TestCase):
+    """
+    Uploaded images show a placeholder until their derivatives are
+    built, processed images are not processed again and an image
+    replaced during its processing is not marked ready.
+    """
+    def test_placeholder_then_ready(self):
+        ticket = Ticket.objects.create(
+            title="Livre", user=self.author, image=self.image_file()
+        )
+        self.assertFalse(ticket.image_ready)
+        self.assertIn("Image en cours de traitement",
+                      fragments.render_ticket(ticket))
+
+        process_ticket_image(ticket.pk)
+        ticket = Ticket.objects.select_related("user").get(pk=ticket.pk)
+        self.assertTrue(ticket.image_ready)
+        self.assertEqual(ticket.image_hash, file_digest(ticket.image))
+        self.assertTrue(derivatives_exist(ticket.image_derivatives))
+        html = fragments.render_ticket(ticket)
+        self.assertNotIn("Image en cours de traitement", html)
+        self.assertIn("<picture>", html)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True)
+    def test_processed_images_are_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Ticket.objects.create(
+                title="Livre", user=self.author, image=self.image_file()
+            )
+        first.refresh_from_db()
+        with mock.patch("main_feed.images.build_derivatives") as build:
+            process_ticket_image(first.pk)
+            # The same image uploaded with another ticket.
+            with self.captureOnCommitCallbacks(execute=True):
+                second = Ticket.objects.create(
+                    title="Livre", user=self.reader,
+                    image=self.image_file(name="copie.jpg"),
+                )
+        build.assert_not_called()
+        second.refresh_from_db()
+        self.assertTrue(second.image_ready)
+        self.assertEqual(second.image_derivatives, first.image_derivatives)
+
+        with mock.patch("main_feed.images.build_derivatives",
+                        return_value=[]) as build:
+            process_ticket_image(first.pk, force=True)
+        build.assert_called_once()
+
+    def test_replaced_image_is_not_marked_ready(self):
+        ticket = Ticket.objects.create(
+            title="Livre", user=self.author, image=self.image_file()
+        )
+
+        def replace_image(source, digest, overwrite=False):
+            Ticket.objects.filter(pk=ticket.pk).update(
+                image="originals/autre.jpg"
+            )
+            return []
+
+        with mock.patch("main_feed.images.build_derivatives",
+                        side_effect=replace_image):
+            process_ticket_image(ticket.pk)
+        ticket.refresh_from_db()
+        self.assertFalse(ticket.image_ready)
+        self.assertEqual(ticket.image_hash, "")
+
+
+class ImageDerivativeTests(MediaFilesMixin, TestCase):
+    """
+    Each width of the renditions is stored once in WebP and JPEG, and
+    described in the srcset of the ticket card.
+    """
+    def derivatives(self, size):
+        with Image.open(io.BytesIO(self.image_bytes(size=size))) as source:
+            return build_derivatives(source, "ab" * 32)
+
+    def test_derivative_set(self):
+        derivatives = self.derivatives((1000, 1400))
+        self.assertEqual(
+            [(d["rendition"], d["density"], d["format"], d["width"],
+              d["height"]) for d in derivatives],
+            [
+                ("large", 2, "webp", 840, 1176),
+                ("large", 2, "jpeg", 840, 1176),
+                # large at 1x has the same width.
+                ("medium", 2, "webp", 420, 588),
+                ("medium", 2, "jpeg", 420, 588),
+                # medium at 1x has the same width.
+                ("small", 2, "webp", 210, 294),
+                ("small", 2, "jpeg", 210, 294),
+                ("small", 1, "webp", 105, 147),
+                ("small", 1, "jpeg", 105, 147),
+            ],
+        )
+        self.assertTrue(derivatives_exist(derivatives))
+        for derivative in derivatives:
+            with default_storage.open(derivative["name"]) as file, \
+                    Image.open(file) as image:
+                self.assertEqual(image.format, derivative["format"].upper())
+                self.assertEqual(
+                    image.size, (derivative["width"], derivative["height"])
+                )
+
+    def test_small_images_are_not_enlarged(self):
+        derivatives = self.derivatives((150, 200))
+        self.assertEqual(
+            sorted({d["width"] for d in derivatives}), [105, 150]
+        )
+
+    def test_srcset(self):
+        ticket = Ticket(image_derivatives=self.derivatives((1000, 1400)))
+        picture = ticket.picture
+        url = default_storage.url(f"{derivative_dir('ab' * 32)}/")
+        self.assertEqual(picture["webp_srcset"], ", ".join(
+            f"{url}{name}.webp {width}w" for name, width in (
+                ("small-1x", 105), ("small-2x", 210), ("medium-2x", 420),
+                ("large-2x", 840),
+            )
+        ))
+        self.assertIn(f"{url}large-2x.jpeg 840w", picture["jpeg_srcset"])
+        # The largest JPEG fitting in the card.
+        self.assertEqual(picture["src"], f"{url}small-2x.jpeg")
+        self.assertEqual((picture["width"], picture["height"]), (210, 294))
+        self.assertIsNone(Ticket().picture)
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class StoredImageTests(MediaFilesMixin, FeedDataMixin, TestCase):
+    """
+    Identical uploads share one file, counted by StoredImage, which is
+    deleted with its derivatives when its last ticket releases it,
+    unless it is uploaded again meanwhile.
+    """
+    def create_ticket(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = Ticket.objects.create(
+                title="Livre", user=self.author,
+                image=self.image_file(**kwargs),
+            )
+        return Ticket.objects.get(pk=ticket.pk)
+
+    def ref_count(self, ticket):
+        return StoredImage.objects.filter(
+            name=ticket.image.name
+        ).values_list("ref_count", flat=True).first()
+
+    def age(self, ticket):
+        # Older than the uploads still waiting for their ticket.
+        path = ticket_image_storage().path(ticket.image.name)
+        old = time.time() - 2 * RELEASED_IMAGE_MIN_AGE
+        os.utime(path, (old, old))
+
+    def stored(self, ticket):
+        return [
+            name for name in self.media_files()
+            if ticket.image_hash in name
+        ]
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.create_ticket(name="1984.jpg")
+        second = self.create_ticket(name="1984_GhjZ1Dy.jpg")
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            first.image.name,
+            f"originals/{first.image_hash[:2]}/{first.image_hash}.jpg",
+        )
+        self.assertEqual(self.ref_count(first), 2)
+        self.assertEqual(second.image_derivatives, first.image_derivatives)
+        originals = [
+            name for name in self.media_files()
+            if name.startswith("originals/")
+        ]
+        self.assertEqual(originals, [first.image.name])
+
+    def test_replacing_an_image(self):
+        first = self.create_ticket(color="red")
+        second = self.create_ticket(color="red")
+        self.age(first)
+        old_files = self.stored(first)
+
+        for ticket in (first, second):
+            ticket.image = self.image_file(color="blue")
+            with self.captureOnCommitCallbacks(execute=True):
+                ticket.save()
+            if ticket is first:
+                # Still used by the second ticket.
+                self.assertEqual(self.ref_count(ticket), 1)
+                for name in old_files:
+                    self.assertIn(name, self.media_files())
+
+        for name in old_files:
+            self.assertNotIn(name, self.media_files())
+        self.assertFalse(StoredImage.objects.filter(
+            name=old_files[-1]
+        ).exists())
+        first.refresh_from_db()
+        self.assertEqual(self.ref_count(first), 2)
+        self.assertTrue(derivatives_exist(first.image_derivatives))
+
+    def test_deleting_the_last_ticket(self):
+        ticket = self.create_ticket()
+        self.age(ticket)
+        files = self.stored(ticket)
+        self.assertEqual(len(files), 1 + len(ticket.image_derivatives))
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.delete()
+        self.assertEqual(self.media_files(), [])
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_recent_files_are_left_to_the_collector(self):
+        ticket = self.create_ticket()
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.delete()
+        self.assertIn(ticket.image.name, self.media_files())
+        self.assertFalse(StoredImage.objects.exists())
+
+    def test_upload_during_the_deletion(self):
+        first = self.create_ticket()
+        self.age(first)
+        with self.captureOnCommitCallbacks() as callbacks:
+            first.delete()
+        # The same image is uploaded again before the deletion of the
+        # files runs, and committed after it.
+        second = Ticket(
+            title="Livre", user=self.reader, image=self.image_file()
+        )
+        second.store_image()
+        for callback in callbacks:
+            callback()
+        self.assertIn(first.image.name, self.media_files())
+        with self.captureOnCommitCallbacks(execute=True):
+            second.save()
+        self.assertEqual(self.ref_count(second), 1)
+
+        # Committed before it.
+        self.age(second)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Ticket.objects.get(pk=second.pk).delete()
+        third = self.create_ticket()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.ref_count(third), 1)
+        self.assertIn(third.image.name, self.media_files())
+
+
+class ImageIngestTests(MediaFilesMixin, FeedDataMixin, TestCase):
+    """
+    Images over TICKET_IMAGE_MAX_PIXELS are refused before being
+    decoded, and derivatives lose the metadata of the original but
+    keep its orientation.
+    """
+    @override_settings(TICKET_IMAGE_MAX_PIXELS=200 * 300)
+    def test_too_many_pixels(self):
+        with self.assertRaises(ValueError):
+            open_image(io.BytesIO(self.image_bytes(size=(201, 300))))
+        with open_image(io.BytesIO(self.image_bytes(size=(200, 300)))):
+            pass
+
+        form = TicketForm(
+            {"title": "Livre", "description": "", "update_ticket": True},
+            {"image": self.image_file(size=(300, 300))},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors.as_data()["image"][0].code, "image_too_large"
+        )
+
+    def test_metadata_is_stripped(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Make] = "Appareil"
+        # Rotated by 90 degrees: shown 400 pixels wide.
+        exif[ExifTags.Base.Orientation] = 6
+        profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+        data = self.image_bytes(
+            size=(300, 400), exif=exif.tobytes(),
+            icc_profile=profile.tobytes(),
+        )
+        with Image.open(io.BytesIO(data)) as source:
+            self.assertIn("icc_profile", source.info)
+        with Image.open(io.BytesIO(data)) as source:
+            derivatives = build_derivatives(source, "cd" * 32)
+
+        for derivative in derivatives:
+            with default_storage.open(derivative["name"]) as file, \
+                    Image.open(file) as image:
+                self.assertEqual(dict(image.getexif()), {})
+                self.assertNotIn("exif", image.info)
+                self.assertNotIn("icc_profile", image.info)
+                self.assertGreater(image.width, image.height)
+
+
+class MediaGarbageTests(MediaFilesMixin, FeedDataMixin, TestCase):
+    """
+    The sweep deletes the files no ticket uses, old enough not to
+    belong to an upload in progress, and resumes from its checkpoint.
+    """
+    def setUp(self):
+        super().setUp()
+        self.used = {}
+        self.orphans = []
+        digests = {name: name * 64 for name in "abcde"}
+
+        def original(digest, extension=".jpg"):
+            return ContentAddressedStorage().content_name(
+                digest, f"image{extension}"
+            )
+
+        # Processed: used as image, and as hash by its derivatives.
+        processed = original(digests["a"])
+        Ticket.objects.bulk_create([Ticket(
+            title="Livre", user=self.author, image=processed,
+            image_hash=digests["a"],
+        )])
+        self.write(processed)
+        self.write(f"{derivative_dir(digests['a'])}/small-1x.jpeg")
+        # Uploaded, waiting for processing: its derivatives may be
+        # shared with an earlier upload of the same image.
+        uploaded = Ticket.objects.create(
+            title="Livre", user=self.author,
+            image=original(digests["b"], ".png"),
+        )
+        self.assertFalse(uploaded.image_ready)
+        self.write(uploaded.image.name)
+        self.write(f"{derivative_dir(digests['b'])}/large-2x.webp")
+        # Bulk loaded, without a hash until build_image_derivatives.
+        loaded = original(digests["c"])
+        Loader().load([json.dumps({
+            "type": "ticket", "ref": 0, "user": self.author.username,
+            "title": "Livre", "image": loaded,
+        })])
+        self.assertEqual(Ticket.objects.get(image=loaded).image_hash, "")
+        self.write(loaded)
+        self.write(f"{derivative_dir(digests['c'])}/small-1x.jpeg")
+        self.counted = [uploaded.image.name, loaded]
+        # Released, its StoredImage row left at zero.
+        released = original(digests["d"])
+        StoredImage.objects.create(name=released, ref_count=0)
+        self.write(released, orphan=True)
+        self.write(f"{derivative_dir(digests['d'])}/small-1x.webp",
+                   orphan=True)
+        # Uploaded before reference counting.
+        self.write("1984_GhjZ1Dy.jpg", orphan=True)
+        self.write(".upload-interrompu", orphan=True)
+        # Just uploaded, its ticket not committed yet.
+        self.in_progress = [original(digests["e"]), ".upload-en-cours"]
+        for name in self.in_progress:
+            self.write(name, age=10)
+
+    def write(self, name, orphan=False, age=2 * 3600):
+        path = os.path.join(self.media_root, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"image")
+        moment = time.time() - age
+        os.utime(path, (moment, moment))
+        if orphan:
+            self.orphans.append(name)
+
+    def test_find_and_delete_orphans(self):
+        files = list(walk_media(self.media_root))
+        self.assertEqual(len(files), len(self.media_files()))
+        orphans = find_orphans(files, min_age=3600)
+        self.assertEqual(
+            sorted(orphan.name for orphan in orphans), sorted(self.orphans)
+        )
+        survivors = sorted(set(self.media_files()) - set(self.orphans))
+
+        freed = delete_orphans(orphans, self.media_root)
+        self.assertEqual(freed, len(b"image") * len(self.orphans))
+        self.assertEqual(self.media_files(), survivors)
+        # Only the row of the released image is deleted.
+        self.assertEqual(
+            sorted(StoredImage.objects.values_list("name", flat=True)),
+            sorted(self.counted),
+        )
+        # Directories left empty are removed.
+        self.assertFalse(os.path.exists(os.path.join(
+            self.media_root, "derivatives", "dd"
+        )))
+
+        # Without the age guard, only the upload in progress goes.
+        orphans = find_orphans(list(walk_media(self.media_root)), 0)
+        self.assertEqual(
+            sorted(orphan.name for orphan in orphans),
+            sorted(self.in_progress),
+        )
+
+    def test_files_touched_since_the_walk_are_kept(self):
+        orphans = find_orphans(list(walk_media(self.media_root)), 3600)
+        released = StoredImage.objects.get(ref_count=0).name
+        # Uploaded again meanwhile (see ContentAddressedStorage).
+        os.utime(os.path.join(self.media_root, *released.split("/")))
+        delete_orphans(orphans, self.media_root)
+        self.assertIn(released, self.media_files())
+        self.assertTrue(StoredImage.objects.filter(name=released).exists())
+
+    def test_command_resumes_from_the_checkpoint(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        checkpoint = os.path.join(directory.name, "checkpoint.json")
+        files = [media_file.name for media_file in walk_media(
+            self.media_root
+        )]
+        options = {"checkpoint": checkpoint, "batch_size": 3,
+                   "stdout": io.StringIO()}
+
+        call_command("collect_media_garbage", dry_run=True, **options)
+        self.assertEqual(len(self.media_files()), len(files))
+        self.assertFalse(os.path.exists(checkpoint))
+
+        call_command("collect_media_garbage", max_batches=1, **options)
+        with open(checkpoint) as file:
+            self.assertEqual(json.load(file), {"after": files[2]})
+        self.assertEqual(
+            self.media_files(),
+            sorted(set(files) - set(self.orphans).intersection(files[:3])),
+        )
+
+        output = io.StringIO()
+        call_command("collect_media_garbage", **{**options, "stdout": output})
+        self.assertIn(f"Reprise après {files[2]}", output.getvalue())
+        self.assertEqual(
+            self.media_files(), sorted(set(files) - set(self.orphans))
+        )
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+class RatingStatsTests(FeedDataMixin, TestCase):
+    """
+    The stored rating statistics follow the reviews being created,
+    changed and deleted, and match a rebuild from the reviews.
+    """
+    def stats(self, model, pk):
+        row = model.objects.get(pk=pk)
+        return row.count, row.total, [count for _, count in row.histogram]
+
+    def assertMatchesRebuild(self):
+        # Rebuilding leaves out the rows emptied by deletions.
+        stored = {
+            model: sorted(model.objects.filter(count__gt=0).values_list())
+            for model in (UserRatingStats, TicketRatingStats)
+        }
+        rebuild()
+        for model, rows in stored.items():
+            self.assertEqual(rows, sorted(model.objects.values_list()))
+
+    def test_reviews_update_the_stats(self):
+        book, other = (
+            Ticket.objects.create(title=f"Livre {n}", user=self.author)
+            for n in range(2)
+        )
+        review = Review.objects.create(
+            ticket=book, rating=4, headline="Bien", user=self.reader
+        )
+        Review.objects.create(
+            ticket=book, rating=1, headline="Bof", user=self.author
+        )
+        self.assertEqual(
+            self.stats(TicketRatingStats, book.pk),
+            (2, 5, [0, 1, 0, 0, 1, 0]),
+        )
+        self.assertEqual(book.rating_stats.average, 2.5)
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.ticket = other
+        review.save()
+        self.assertEqual(
+            self.stats(TicketRatingStats, book.pk),
+            (1, 1, [0, 1, 0, 0, 0, 0]),
+        )
+        self.assertEqual(
+            self.stats(UserRatingStats, self.reader.pk),
+            (1, 5, [0, 0, 0, 0, 0, 1]),
+        )
+        self.assertMatchesRebuild()
+
+        review.delete()
+        self.assertEqual(
+            self.stats(UserRatingStats, self.reader.pk),
+            (0, 0, [0] * 6),
+        )
+        book.delete()
+        self.assertEqual(
+            self.stats(UserRatingStats, self.author.pk),
+            (0, 0, [0] * 6),
+        )
+        self.assertMatchesRebuild()
+
+    def test_review_detail_shows_the_ticket_stats(self):
+        _, reviews = self.create_posts(1)
+        self.client.force_login(self.reader)
+        response = self.client.get(
+            reverse("review_detail", args=[reviews[0].id])
+        )
+        self.assertContains(response, "sur 1 critique")
+
+
+class SuggestionTests(FeedDataMixin, TestCase):
+    """
+    Suggestions rank friends of friends and users with the same
+    taste, and are only recomputed for the users marked as changed.
+    """
+    def setUp(self):
+        self.friend, self.fan, self.hater = (
+            User.objects.create_user(username=name, password="azerty123")
+            for name in ("ami", "fan", "detracteur")
+        )
+        # The author the reader follows follows "ami".
+        UserFollows.objects.create(user=self.author, followed_user=self.friend)
+        tickets = Ticket.objects.bulk_create(
+            Ticket(title=f"Livre {n}", user=self.author) for n in range(3)
+        )
+        for ticket in tickets:
+            for user, rating in ((self.reader, 5), (self.fan, 4),
+                                 (self.hater, 0)):
+                Review.objects.create(
+                    ticket=ticket, rating=rating, headline="Avis", user=user
+                )
+
+    def suggested(self, user):
+        return list(
+            FollowSuggestion.objects.filter(user=user)
+            .order_by("-score").values_list("suggested__username", flat=True)
+        )
+
+    def test_ranking(self):
+        refresh_suggestions()
+        self.assertEqual(self.suggested(self.reader), ["fan", "ami"])
+        suggestion = FollowSuggestion.objects.get(
+            user=self.reader, suggested=self.fan
+        )
+        self.assertEqual(suggestion.shared_tickets, 3)
+        self.assertEqual(suggestion.mutual_count, 0)
+
+    def test_only_marked_users_are_recomputed(self):
+        refresh_suggestions()
+        self.assertFalse(SuggestionRefresh.objects.exists())
+        UserFollows.objects.create(user=self.reader, followed_user=self.fan)
+        self.assertEqual(
+            list(SuggestionRefresh.objects.values_list("user", flat=True)),
+            [self.reader.id],
+        )
+        self.assertEqual(refresh_suggestions(), 1)
+        self.assertEqual(self.suggested(self.reader), ["ami"])
+
+    def test_marks_moved_during_a_run_stay(self):
+        mark_for_refresh([self.reader.id])
+
+        def follow_while_loading():
+            # A follow made after the run started, before the graph
+            # is loaded.
+            mark_for_refresh([self.reader.id])
+            return SuggestionGraph()
+
+        with mock.patch("main_feed.suggestions.SuggestionGraph",
+                        side_effect=follow_while_loading):
+            refresh_suggestions()
+        self.assertTrue(
+            SuggestionRefresh.objects.filter(user=self.reader).exists()
+        )
+
+    def test_followings_page_shows_suggestions(self):
+        refresh_suggestions()
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse("followings"))
+        self.assertEqual(
+            [s.suggested.username for s in response.context["suggestions"]],
+            ["fan", "ami"],
+        )
+        self.assertContains(response, "3 livres notés en commun")
+
+    def test_followed_accounts_are_not_suggested(self):
+        refresh_suggestions()
+        # Better ranked suggestions, all followed since they were
+        # computed.
+        followed = User.objects.bulk_create(
+            User(username=f"suivi{n}") for n in range(2 * SUGGESTIONS_SHOWN)
+        )
+        UserFollows.objects.bulk_create(
+            UserFollows(user=self.reader, followed_user=user)
+            for user in followed
+        )
+        FollowSuggestion.objects.bulk_create(
+            FollowSuggestion(user=self.reader, suggested=user, score=100)
+            for user in followed
+        )
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse("followings"))
+        self.assertEqual(
+            [s.suggested.username for s in response.context["suggestions"]],
+            ["fan", "ami"],
+        )
+
+
+class BulkLoadTests(MediaFilesMixin, FeedDataMixin, TestCase):
+    """
+    load_jsonl imports a JSONL export chunk by chunk, skips the lines
+    it cannot import and rebuilds what the signals would maintain.
+    """
+    LINES = [
+        {"type": "user", "username": "lectrice"},
+        {"type": "follow", "user": "lectrice", "followed": "critique"},
+        {"type": "follow", "user": "reader", "followed": "lectrice"},
+        {"type": "ticket", "ref": "t1", "user": "critique",
+         "title": "Dune", "time_created": "2021-03-04T10:00:00+00:00"},
+        {"type": "review", "ref": "r1", "ticket": "t1",
+         "user": "lectrice", "rating": 4, "headline": "Vaste"},
+        {"type": "review", "ticket": "t1", "user": "reader",
+         "rating": 2, "headline": "Long"},
+        {"type": "review", "ticket": "t9", "user": "reader",
+         "rating": 2, "headline": "Billet inconnu"},
+        {"type": "comment", "review": "r1", "author": "critique",
+         "content": "Merci"},
+        {"type": "ticket", "user": "personne", "title": "Orphelin"},
+    ]
+
+    def load(self, lines):
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".jsonl", delete=False) as file:
+            file.writelines(f"{line}\n" for line in lines)
+        self.addCleanup(os.remove, file.name)
+        call_command(
+            "load_jsonl", file.name, chunk_size=2,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+    def test_lines_are_imported(self):
+        self.load([json.dumps(line) for line in self.LINES] + ["{oups"])
+        reader = User.objects.get(username="lectrice")
+        self.assertTrue(UserFollows.objects.filter(
+            user=reader, followed_user=self.author
+        ).exists())
+
+        ticket = Ticket.objects.get(title="Dune")
+        self.assertEqual(ticket.time_created.year, 2021)
+        self.assertEqual(ticket.review_count, 2)
+        self.assertFalse(Ticket.objects.filter(title="Orphelin").exists())
+        self.assertEqual(Review.objects.count(), 2)
+        review = Review.objects.get(headline="Vaste")
+        self.assertEqual(review.comment_count, 1)
+        self.assertEqual(Comment.objects.get().review, review)
+
+        stats = TicketRatingStats.objects.get(pk=ticket.pk)
+        self.assertEqual((stats.count, stats.total), (2, 6))
+        self.assertEqual(
+            [(r.kind, r.post.pk)
+             for r in search(self.reader.id, "dune").results],
+            [("TICKET", ticket.pk)],
+        )
+
+    def test_timestamp_fields_are_left_alone(self):
+        fields = [Ticket._meta.get_field("time_created"),
+                  Review._meta.get_field("time_edited")]
+
+        def progress(report):
+            self.assertTrue(fields[0].auto_now_add)
+            self.assertTrue(fields[1].auto_now)
+
+        Loader(chunk_size=2).load(
+            (json.dumps(line) for line in self.LINES), progress
+        )
+        review = Review.objects.get(headline="Vaste")
+        self.assertEqual(review.time_created, review.time_edited)
+
+    def test_only_new_follows_are_counted(self):
+        report = Loader().load(json.dumps(line) for line in [
+            {"type": "follow", "user": "reader", "followed": "critique"},
+            {"type": "follow", "user": "critique", "followed": "reader"},
+            {"type": "follow", "user": "critique", "followed": "reader"},
+        ])
+        self.assertEqual(report.created["follow"], 1)
+
+    def test_imported_images_are_processed(self):
+        name = ticket_image_storage().save(
+            "originals/dune.jpg", ContentFile(self.image_bytes())
+        )
+        self.load([json.dumps({
+            "type": "ticket", "user": "critique", "title": "Dune",
+            "image": name,
+        })])
+        ticket = Ticket.objects.get(title="Dune")
+        self.assertTrue(ticket.image_ready)
+        self.assertTrue(ticket.image_derivatives)
+
+
+class DatasetTests(TestCase):
+    """
+    Generated datasets are reproducible, skewed like real follow
+    graphs and importable, and the views can be measured on them.
+    """
+    SIZE = DatasetSize(
+        users=60, follows=300, tickets=80, reviews=80, comments=50
+    )
+
+    def test_same_seed_same_lines(self):
+        self.assertEqual(
+            list(generate(self.SIZE, seed=3)),
+            list(generate(self.SIZE, seed=3)),
+        )
+        self.assertNotEqual(
+            list(generate(self.SIZE, seed=3)),
+            list(generate(self.SIZE, seed=4)),
+        )
+
+    def test_follows_are_skewed(self):
+        followers = Counter(
+            line["followed"] for line in generate(self.SIZE)
+            if line["type"] == "follow"
+        )
+        mean = sum(followers.values()) / self.SIZE.users
+        self.assertGreater(max(followers.values()), 4 * mean)
+
+    def test_dataset_is_importable_and_measurable(self):
+        report = Loader(chunk_size=100).load(
+            json.dumps(line) for line in generate(self.SIZE)
+        )
+        self.assertEqual(report.skipped, 0)
+        self.assertEqual(report.created["review"], self.SIZE.reviews)
+
+        client = self.client
+        client.force_login(User.objects.get(username="lecteur0"))
+        result = measure_requests(
+            (client, "get", reverse("posts"), None) for _ in range(3)
+        )
+        self.assertEqual(result["requests"], 3)
+        self.assertEqual(result["statuses"], {"200": 3})
+        self.assertGreater(result["queries_mean"], 0)
+        self.assertGreater(result["bytes_mean"], 0)
@@ -7,8 +7,11 @@ from main_feed.views import (
     update_review,
     followings,
     PostsView,
+    OpenTicketsView,
     unfollow_user,
-    review_detail
+    review_detail,
+    search_posts,
+    search_api
     )
 
 
@@ -38,7 +41,10 @@ urlpatterns = [
     path("reviews/<int:review_id>/", review_detail, name="review_detail"),
     path("followings/", followings, name="followings"),
     path("posts/", PostsView.as_view(), name="posts"),
+    path("tickets/open/", OpenTicketsView.as_view(), name="open_tickets"),
     path(
         "followings/unfollow/<int:user_id>/", unfollow_user, name="unfollow"
-    )
+    ),
+    path("search/", search_posts, name="search"),
+    path("search/api/", search_api, name="search_api"),
 ]
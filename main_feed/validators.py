@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+
+def validate_image_pixels(image):
+    """
+    Rejects images with more than TICKET_IMAGE_MAX_PIXELS pixels.
+
+    The dimensions are read from the header of the file, so a
+    decompression bomb is refused before any pixel is decoded.
+    Files whose dimensions cannot be read are left to the image
+    validation of the form field.
+
+    Args:
+        image (ImageFieldFile): The uploaded or stored image.
+
+    Raises:
+        ValidationError: The image is too large.
+    """
+    try:
+        width, height = image.width, image.height
+    except (OSError, TypeError, ValueError):
+        return
+    if width * height > settings.TICKET_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            "L'image est trop grande (%(width)s×%(height)s pixels, "
+            "%(max_pixels)s pixels au maximum).",
+            code="image_too_large",
+            params={
+                "width": width,
+                "height": height,
+                "max_pixels": settings.TICKET_IMAGE_MAX_PIXELS,
+            },
+        )
@@ -1,31 +1,98 @@
-from itertools import chain
 from django.shortcuts import (
     HttpResponseRedirect, redirect, render, get_object_or_404)
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView, CreateView
-from django.db.models import CharField, Value
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
+from django.db.models import Exists, OuterRef
+from django.http import JsonResponse
+from authentication.graph import followee_ids, follower_ids
 from authentication.models import User, UserFollows
-from .models import Ticket, Review
+from LITRevue.metrics import IMAGE, span
+from LITRevue.write_queue import run_write
+from .models import FollowSuggestion, Ticket, Review
+from .feed import (
+    FEED_PAGE_SIZE,
+    FeedCursor,
+    feed_reviews,
+    get_feed_page,
+    get_open_tickets_page,
+    get_timeline_page,
+)
 from .forms import (
     TicketForm,
     ReviewForm,
     UserFollowForm,
     DeleteReviewForm,
     DeleteTicketForm,
-    CommentForm
+    CommentForm,
+    SearchForm
 )
+from .search import COMMENT, REVIEW, TICKET, SearchCursor, search
+
+
+SUGGESTIONS_SHOWN = 5
+
+SEARCH_KIND_LABELS = {
+    TICKET: "Billet",
+    REVIEW: "Critique",
+    COMMENT: "Commentaire",
+}
+
+
+class FeedPageMixin:
+    """
+    Mixin for the list views showing a keyset-paginated feed of
+    tickets and reviews.
+
+    The cursor of the page to display is read from the "before"
+    query parameter. The page and the cursor of the next (older)
+    page are exposed to the template as 'feed_page' and
+    'next_cursor'.
+
+    Methods:
+        get_feed_user_ids():
+            Returns the ids of the users whose posts are shown.
+            Must be implemented by subclasses.
+        get_feed_page(cursor):
+            Returns the FeedPage to display.
+    """
+    page_size = FEED_PAGE_SIZE
+
+    def get_feed_user_ids(self):
+        raise NotImplementedError
 
+    def get_feed_page(self, cursor):
+        return get_feed_page(
+            self.get_feed_user_ids(), cursor, self.page_size
+        )
+
+    def get_queryset(self):
+        cursor = FeedCursor.decode(self.request.GET.get("before"))
+        self.feed_page = self.get_feed_page(cursor)
+        return self.feed_page.posts
 
-class HomeView(LoginRequiredMixin, ListView):
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        next_cursor = self.feed_page.next_cursor
+        context["feed_page"] = self.feed_page
+        context["next_cursor"] = next_cursor.encode() if next_cursor else ""
+        return context
+
+
+class HomeView(LoginRequiredMixin, FeedPageMixin, ListView):
     """
     HomeView displays a combined feed of reviews and tickets
     for the logged-in user and users they follow.
 
+    The feed is read from the user's FeedEntry timeline, which is
+    filled when posts are written, instead of being gathered from
+    the posts of every followed user.
+
     Inherits:
         LoginRequiredMixin: Ensures the user is authenticated.
+        FeedPageMixin: Provides the keyset-paginated feed.
         ListView: Provides list display functionality.
 
     Attributes:
@@ -35,59 +102,25 @@ class HomeView(LoginRequiredMixin, ListView):
         the posts in the template.
 
     Methods:
-        get_queryset():
-            Retrieves and returns a sorted list of Review and
-            Ticket objects created by the current user and users
-            they follow.
-            Each object is annotated with a 'content_type'
-            field indicating whether it is a 'REVIEW' or 'TICKET'.
-            The combined list is sorted in descending order
-            by creation time.
+        get_feed_page(cursor):
+            Returns one page of the current user's timeline.
     """
     template_name = "main_feed/home.html"
     context_object_name = "posts"
 
-    def get_queryset(self):
-        """
-        Returns a combined and chronologically ordered list
-        of Review and Ticket objects
-        created by the current user and users they follow.
-        Each object in the list is
-        annotated with a 'content_type' field indicating
-        whether it is a 'REVIEW' or a 'TICKET'.
-
-        Returns:
-            list: A list of Review and Ticket objects sorted
-            by 'time_created' in descending order.
-        """
-        followee_ids = self.request.user.following.values_list(
-            "id", flat=True
+    def get_feed_page(self, cursor):
+        return get_timeline_page(
+            self.request.user.id, cursor, self.page_size
         )
-        user_ids = list(followee_ids) + [self.request.user.id]
-        reviews = Review.objects.filter(
-            user_id__in=user_ids).order_by("-time_created")
-        reviews = reviews.annotate(
-            content_type=Value("REVIEW", output_field=CharField()))
-        tickets = Ticket.objects.filter(
-            user_id__in=user_ids).order_by("-time_created")
-        tickets = tickets.annotate(
-            content_type=Value("TICKET", output_field=CharField()))
-        posts = sorted(
-            chain(
-                reviews, tickets
-            ), key=lambda post: post.time_created, reverse=True)
-        return posts
-
-
-class PostsView(LoginRequiredMixin, ListView):
+
+
+class PostsView(LoginRequiredMixin, FeedPageMixin, ListView):
     """
     PostsView displays a list of the current user's posts,
     including both reviews and tickets.
 
-    This view combines Review and Ticket objects created by
-    the logged-in user, annotates each with a 'content_type'
-    field to distinguish between reviews and tickets, and
-    orders them by creation time in descending order.
+    It uses the same keyset-paginated feed engine as HomeView,
+    restricted to the posts of the logged-in user.
 
     Attributes:
         template_name (str): The template used to render the
@@ -96,31 +129,44 @@ class PostsView(LoginRequiredMixin, ListView):
         for the posts in the template.
 
     Methods:
-        get_queryset():
-            Retrieves and returns a sorted list of the user's
-            reviews and tickets, each annotated with a
-            'content_type'
-            to indicate its type, ordered by 'time_created'
-            in descending order.
+        get_feed_user_ids():
+            Returns the id of the current user.
     """
     template_name = "main_feed/posts.html"
     context_object_name = "personal_posts"
 
-    def get_queryset(self):
-        reviews = Review.objects.filter(
-            user=self.request.user).order_by("-time_created")
-        reviews = reviews.annotate(
-            content_type=Value("REVIEW", output_field=CharField()))
-        tickets = Ticket.objects.filter(
-            user=self.request.user).order_by("-time_created")
-        tickets = tickets.annotate(
-            content_type=Value("TICKET", output_field=CharField()))
-        personal_posts = sorted(
-            chain(reviews, tickets),
-            key=lambda personal_post: personal_post.time_created,
-            reverse=True
+    def get_feed_user_ids(self):
+        return [self.request.user.id]
+
+
+class OpenTicketsView(LoginRequiredMixin, FeedPageMixin, ListView):
+    """
+    OpenTicketsView lists the tickets of the other users that are
+    still waiting for a review, newest first, so that readers can
+    find the review requests they could answer.
+
+    Inherits:
+        LoginRequiredMixin: Ensures the user is authenticated.
+        FeedPageMixin: Provides the keyset pagination.
+        ListView: Provides list display functionality.
+
+    Attributes:
+        template_name (str): The template used to render the
+        tickets.
+        context_object_name (str): The context variable name
+        for the tickets in the template.
+
+    Methods:
+        get_feed_page(cursor):
+            Returns one page of the open tickets.
+    """
+    template_name = "main_feed/open_tickets.html"
+    context_object_name = "tickets"
+
+    def get_feed_page(self, cursor):
+        return get_open_tickets_page(
+            self.request.user.id, cursor, self.page_size
         )
-        return personal_posts
 
 
 class TicketCreateView(LoginRequiredMixin, CreateView):
@@ -159,7 +205,9 @@ class TicketCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        self.object = form.save()
+        with span(IMAGE):
+            form.instance.store_image()
+        self.object = run_write(form.save)
         return HttpResponseRedirect(self.get_success_url())
 
 
@@ -172,7 +220,9 @@ def create_review(request, ticket_id=None):
     If a `ticket_id` is provided, the view allows the user
     to create a review for the specified ticket, provided that a
     review does not already exist for it. If a review already exists
-    for the ticket, the user is redirected to the homepage.
+    for the ticket, the user is redirected to the homepage. If one is
+    published while the form is being saved, the form is shown again
+    with an error.
 
     If no `ticket_id` is provided, the view allows the user
     to create both a new ticket and a review in a single form submission.
@@ -189,7 +239,9 @@ def create_review(request, ticket_id=None):
 
     if ticket_id:
         ticket = get_object_or_404(Ticket, pk=ticket_id)
-        if Review.objects.filter(ticket=ticket).exists():
+        # Not ticket.has_review: the counter may have drifted.
+        reviews = Review.objects.filter(ticket_id=ticket.id)
+        if reviews.exists():
             return redirect("homepage")
 
         form = ReviewForm(request.POST or None)
@@ -198,8 +250,20 @@ def create_review(request, ticket_id=None):
             review = form.save(commit=False)
             review.user = request.user
             review.ticket = ticket
-            review.save()
-            return redirect("homepage")
+
+            def save_review():
+                # Checked again by the writer, as another review may
+                # have been saved since the first check.
+                if reviews.exists():
+                    return False
+                review.save()
+                return True
+
+            if run_write(save_review):
+                return redirect("homepage")
+            form.add_error(
+                None, "Une critique de ce billet vient d'être publiée."
+            )
 
         return render(
             request,
@@ -221,12 +285,17 @@ def create_review(request, ticket_id=None):
     if ticket_form.is_valid() and review_form.is_valid():
         ticket = ticket_form.save(commit=False)
         ticket.user = request.user
-        ticket.save()
-
+        with span(IMAGE):
+            ticket.store_image()
         review = review_form.save(commit=False)
         review.user = request.user
-        review.ticket = ticket
-        review.save()
+
+        def save_ticket_and_review():
+            ticket.save()
+            review.ticket = ticket
+            review.save()
+
+        run_write(save_ticket_and_review)
         return redirect("homepage")
 
     return render(
@@ -251,19 +320,23 @@ def review_detail(request, review_id):
 
     Returns:
         HttpResponse: The rendered review detail page with
-        associated comments and a comment form.
+        associated comments, the rating statistics of the ticket
+        and a comment form.
         If a valid comment is submitted via POST, redirects
         to the same review detail page.
     """
-    review = get_object_or_404(Review, id=review_id)
-    comments = review.comments.all().order_by("time_created")
+    review = get_object_or_404(
+        feed_reviews().select_related("ticket__rating_stats"), id=review_id
+    )
+    comments = review.comments.select_related(
+        "author").order_by("time_created")
     form = CommentForm(request.POST or None)
 
     if request.method == "POST" and form.is_valid():
         new_comment = form.save(commit=False)
         new_comment.review = review
         new_comment.author = request.user
-        new_comment.save()
+        run_write(new_comment.save)
         return redirect("review_detail", review_id=review.id)
 
     return render(
@@ -307,13 +380,15 @@ def update_ticket(request, ticket_id):
         if "update_ticket" in request.POST:
             form = TicketForm(request.POST, instance=ticket)
             if form.is_valid():
-                form.save()
+                with span(IMAGE):
+                    form.instance.store_image()
+                run_write(form.save)
                 return redirect("homepage")
 
         if "delete_ticket" in request.POST:
             form = DeleteTicketForm(request.POST)
             if form.is_valid():
-                ticket.delete()
+                run_write(ticket.delete)
                 return redirect("homepage")
 
     context = {
@@ -366,7 +441,7 @@ def update_review(request, review_id):
                 )
 
             if update_form.is_valid():
-                update_form.save()
+                run_write(update_form.save)
                 return redirect("homepage")
 
         if "delete_review" in request.POST:
@@ -374,7 +449,7 @@ def update_review(request, review_id):
                 request.POST
                 )
             if delete_form.is_valid():
-                review.delete()
+                run_write(review.delete)
                 return redirect("homepage")
 
     context = {
@@ -395,7 +470,9 @@ def followings(request):
     follow other users by username.
 
     - On GET: Displays the followings and followers
-    of the current user, along with a form to follow new users.
+    of the current user, along with a form to follow new users
+    and the accounts suggested to them (computed offline by
+    compute_suggestions), minus the ones followed since.
     - On POST: Processes the follow form, validates
     the username, and creates a follow relationship if possible.
         - Shows appropriate messages for errors
@@ -423,7 +500,8 @@ def followings(request):
                     "Vous ne pouvez pas vous suivre vous-même."
                 )
             else:
-                obj, created = UserFollows.objects.get_or_create(
+                obj, created = run_write(
+                    UserFollows.objects.get_or_create,
                     user=request.user,
                     followed_user=user_to_follow
                 )
@@ -444,8 +522,17 @@ def followings(request):
                 request,
                 "Utilisateur introuvable."
             )
-    following = request.user.following.all()
-    followers = request.user.followers.all()
+    following = User.objects.filter(pk__in=followee_ids(request.user.id))
+    followers = User.objects.filter(pk__in=follower_ids(request.user.id))
+    # Suggestions are computed offline: leave out the accounts
+    # followed since.
+    suggestions = FollowSuggestion.objects.filter(
+        user=request.user
+    ).exclude(
+        Exists(UserFollows.objects.filter(
+            user=request.user, followed_user=OuterRef("suggested")
+        ))
+    ).select_related("suggested").order_by("-score")[:SUGGESTIONS_SHOWN]
     return render(
         request,
         "main_feed/followings.html",
@@ -453,6 +540,7 @@ def followings(request):
             "form": form,
             "following": following,
             "followers": followers,
+            "suggestions": suggestions,
         }
     )
 
@@ -486,10 +574,12 @@ def unfollow_user(request, user_id):
             request, "Se désabonner de soi-même ? Joker."
             )
     else:
-        deleted, _ = UserFollows.objects.filter(
-            user=request.user,
-            followed_user=target
-        ).delete()
+        deleted, _ = run_write(
+            UserFollows.objects.filter(
+                user=request.user,
+                followed_user=target
+            ).delete
+        )
         if deleted:
             messages.success(
                 request,
@@ -501,3 +591,131 @@ def unfollow_user(request, user_id):
                 f"Vous ne suiviez déjà plus {target.username}."
             )
     return redirect("followings")
+
+
+def result_details(result):
+    """
+    Returns the title, author and link of a search result.
+
+    Reviews and comments link to the review page. Tickets link to the
+    review form while they have no review.
+
+    Args:
+        result (SearchResult): The result to describe.
+
+    Returns:
+        dict: "title", "author" and "url" (None for a reviewed
+        ticket) of the result.
+    """
+    post = result.post
+    if result.kind == TICKET:
+        url = None
+        if not post.has_review:
+            url = reverse("create_review_from_ticket", args=[post.id])
+        return {"title": post.title, "author": post.user, "url": url}
+    if result.kind == REVIEW:
+        return {
+            "title": post.headline,
+            "author": post.user,
+            "url": reverse("review_detail", args=[post.id]),
+        }
+    return {
+        "title": post.review.headline,
+        "author": post.author,
+        "url": reverse("review_detail", args=[post.review_id]),
+    }
+
+
+def search_page(request):
+    """
+    Runs the search described by the query string of a request.
+
+    Returns:
+        tuple: The bound SearchForm and the SearchPage, None when the
+        form is not valid (no search submitted yet).
+    """
+    form = SearchForm(request.GET or None)
+    if not form.is_valid():
+        return form, None
+    page = search(
+        request.user.id,
+        form.cleaned_data["q"],
+        SearchCursor.decode(form.cleaned_data["after"]),
+    )
+    return form, page
+
+
+@login_required
+def search_posts(request):
+    """
+    Display the tickets, reviews and comments visible to the user
+    (their own posts and the ones of the users they follow) that
+    match the searched words, best matches first.
+
+    The cursor of the page to display is read from the "after" query
+    parameter.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        HttpResponse: The rendered search page with the form and the
+        results.
+    """
+    form, page = search_page(request)
+    results = []
+    next_cursor = ""
+    if page is not None:
+        results = [
+            {
+                **result_details(result),
+                "result": result,
+                "label": SEARCH_KIND_LABELS[result.kind],
+            }
+            for result in page.results
+        ]
+        if page.next_cursor:
+            next_cursor = page.next_cursor.encode()
+    return render(
+        request,
+        "main_feed/search.html",
+        {
+            "form": form,
+            "results": results,
+            "next_cursor": next_cursor,
+        }
+    )
+
+
+@login_required
+def search_api(request):
+    """
+    JSON version of the search page.
+
+    Query parameters:
+        q: The words to search for.
+        after: Cursor returned as "next" with the previous page.
+
+    Returns:
+        JsonResponse: {"results": [...], "next": cursor or null},
+        each result with its "type", "id", "title", "excerpt" (HTML,
+        matched terms in <mark> elements), "url", "author" and
+        "time_created". Status 400 when "q" is missing or invalid.
+    """
+    form, page = search_page(request)
+    if page is None:
+        return JsonResponse({"errors": form.errors}, status=400)
+    results = []
+    for result in page.results:
+        details = result_details(result)
+        results.append({
+            "type": result.kind,
+            "id": result.post.id,
+            "title": details["title"],
+            "excerpt": result.excerpt,
+            "url": details["url"],
+            "author": details["author"].username,
+            "time_created": result.post.time_created.isoformat(),
+        })
+    next_cursor = page.next_cursor.encode() if page.next_cursor else None
+    return JsonResponse({"results": results, "next": next_cursor})
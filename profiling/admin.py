@@ -0,0 +1,42 @@
+from django.contrib import admin
+from django.utils.html import format_html
+
+from .middleware import STATS_SORTS, format_stats
+from .models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Lists the recorded request profiles and shows the pstats report
+    of each of them. Profiles are only created by
+    ProfilingMiddleware.
+    """
+    list_display = [
+        "time_created", "view_name", "method", "path", "status_code",
+        "duration", "user",
+    ]
+    list_filter = ["view_name"]
+    search_fields = ["path", "view_name"]
+    fields = [
+        "time_created", "user", "view_name", "method", "path",
+        "status_code", "duration", "file_name", "statistics",
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Statistiques")
+    def statistics(self, profile):
+        try:
+            reports = [format_stats(profile.file_path, sort)
+                       for sort in STATS_SORTS]
+        except OSError:
+            return "Fichier de profil introuvable."
+        return format_html(
+            "".join("<pre>{}</pre>" for _ in reports), *reports
+        )
@@ -0,0 +1,102 @@
+"""
+On-demand profiling of single requests.
+
+A staff user adds ?profile=1 to a URL (PROFILE_QUERY_PARAMETER), or
+sends the X-Profile header (PROFILE_HEADER), to have that request run
+under cProfile. The pstats dump is written to PROFILES_DIR, named
+after the time and the view, and recorded as a RequestProfile, whose
+admin page shows the functions with the most cumulative and own
+time. The dump itself can be opened with pstats or snakeviz. The
+response carries the id of the profile in its X-Profile-Id header.
+
+Requests not asking for a profile only pay for the lookup of the
+parameter and of the header; the user is not even loaded.
+
+The middleware must come after AuthenticationMiddleware. It profiles
+the middlewares after it and the view.
+"""
+import cProfile
+import io
+import pstats
+import re
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from LITRevue.metrics import view_label
+from .models import RequestProfile
+
+
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+STATS_SORTS = ("cumulative", "tottime")
+STATS_LIMIT = 60
+
+
+def profiling_requested(request):
+    meta_key = "HTTP_" + settings.PROFILE_HEADER.upper().replace("-", "_")
+    return (settings.PROFILE_QUERY_PARAMETER in request.GET
+            or meta_key in request.META)
+
+
+def dump_name(view_name, moment):
+    """
+    Returns the file name of a dump: the time, then the view name
+    reduced to file-safe characters.
+    """
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", view_name).strip("-.")
+    return f"{moment:%Y%m%d-%H%M%S-%f}-{slug or 'view'}.prof"
+
+
+def format_stats(path, sort, limit=STATS_LIMIT):
+    """
+    Returns the pstats report of a dump, sorted by 'sort' and limited
+    to its first 'limit' functions.
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(str(path), stream=output)
+    stats.sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    Runs the requests of staff users asking for it under cProfile
+    and records the profiles.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling_requested(request) or not request.user.is_staff:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread.
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        view_name = view_label(request)
+        file_name = dump_name(view_name, timezone.now())
+        settings.PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(settings.PROFILES_DIR.joinpath(file_name))
+        profile = RequestProfile.objects.create(
+            user=request.user,
+            view_name=view_name,
+            method=request.method,
+            path=request.get_full_path(),
+            status_code=response.status_code,
+            duration=duration,
+            file_name=file_name,
+        )
+        response[PROFILE_ID_HEADER] = str(profile.pk)
+        return response
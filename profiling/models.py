@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db import models
+from LITRevue.settings import AUTH_USER_MODEL
+
+
+class RequestProfile(models.Model):
+    """
+    A cProfile dump of one request, recorded at the demand of a staff
+    user by ProfilingMiddleware.
+
+    Attributes:
+        user (User): The staff user who asked for it.
+        view_name (str): Name of the view of the request.
+        method (str): HTTP method of the request.
+        path (str): Path and query string of the request.
+        status_code (int): Status of the response.
+        duration (float): Time of the request in seconds, profiler
+        included.
+        file_name (str): Name of the pstats dump in PROFILES_DIR.
+        time_created (datetime): When the request was made.
+
+    Properties:
+        file_path (Path): Location of the dump.
+    """
+    user = models.ForeignKey(
+        to=AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="+"
+    )
+    view_name = models.CharField(max_length=200)
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    status_code = models.PositiveSmallIntegerField()
+    duration = models.FloatField()
+    file_name = models.CharField(max_length=255)
+    time_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-time_created"]
+        verbose_name = "Profil de requête"
+        verbose_name_plural = "Profils de requête"
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration * 1000:.0f} ms)"
+
+    @property
+    def file_path(self):
+        return settings.PROFILES_DIR.joinpath(self.file_name)
@@ -0,0 +1,18 @@
+"""
+Signal receivers deleting the dumps of deleted request profiles.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import RequestProfile
+
+
+@receiver(post_delete, sender=RequestProfile)
+def delete_profile_dump(sender, instance, **kwargs):
+    """
+    Deletes the pstats dump of a deleted profile, once the deletion
+    is committed.
+    """
+    path = instance.file_path
+    transaction.on_commit(lambda: path.unlink(missing_ok=True))
@@ -0,0 +1,73 @@
+import tempfile
+from pathlib import Path
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import User
+from .middleware import PROFILE_ID_HEADER
+from .models import RequestProfile
+
+
+class ProfilingTests(TestCase):
+    """
+    ProfilingMiddleware records a profile of the requests of staff
+    users asking for one, and only of those.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="lecteur", password="azerty123"
+        )
+        cls.staff = User.objects.create_superuser(
+            username="admin", password="azerty123"
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiles_dir = override_settings(PROFILES_DIR=Path(directory.name))
+        profiles_dir.enable()
+        self.addCleanup(profiles_dir.disable)
+
+    def test_only_requested_staff_requests_are_profiled(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("homepage"))
+        self.assertFalse(response.has_header(PROFILE_ID_HEADER))
+
+        self.client.force_login(self.user)
+        self.client.get(reverse("homepage"), {"profile": "1"})
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_query_flag_and_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("homepage"), {"profile": "1"})
+        profile = RequestProfile.objects.get(
+            pk=response[PROFILE_ID_HEADER]
+        )
+        self.assertEqual(profile.view_name, "homepage")
+        self.assertEqual(profile.path, "/home/?profile=1")
+        self.assertEqual(profile.user, self.staff)
+        self.assertTrue(profile.file_path.exists())
+        self.assertIn("homepage", profile.file_name)
+
+        self.client.get(reverse("posts"), headers={"X-Profile": "1"})
+        self.assertEqual(RequestProfile.objects.count(), 2)
+
+    def test_admin_shows_statistics(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("homepage"), {"profile": "1"})
+        profile_id = response[PROFILE_ID_HEADER]
+        response = self.client.get(reverse(
+            "admin:profiling_requestprofile_change", args=[profile_id]
+        ))
+        self.assertContains(response, "function calls")
+        self.assertContains(response, "cumulative")
+
+    def test_deleting_a_profile_deletes_its_dump(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse("homepage"), {"profile": "1"})
+        profile = RequestProfile.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.delete()
+        self.assertFalse(profile.file_path.exists())